@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'progress_done', 'progress_total', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'message')
+    readonly_fields = ('checkpoint', 'result', 'error', 'worker', 'heartbeat_at', 'started_at', 'finished_at', 'created_at')
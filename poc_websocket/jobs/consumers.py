@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import InMemoryChannelLayer
+from django.db.models import Q
+from django.utils import timezone
+
+from poc_project.instrumentation import InstrumentedConsumerMixin
+from .events import JOBS_GROUP, job_group, job_payload
+from .models import Job
+from .queue import job_options
+
+RECENT_JOBS = 20
+
+
+class JobProgressConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    """Streams job state to clients.
+
+    ws/jobs/          every job: a snapshot of recent jobs, then updates
+    ws/jobs/<id>/     one job
+
+    Frames are {"type": "job_progress", "job": {...}} (see events.job_payload).
+    Workers run in other processes, so their events only arrive through a
+    shared channel layer. With the in-memory layer (development) the
+    consumer polls the jobs table every JOBS['WS_POLL_INTERVAL'] seconds.
+    """
+
+    async def connect(self):
+        job_id = self.scope['url_route']['kwargs'].get('job_id')
+        self.job_id = int(job_id) if job_id is not None else None
+        self.group_name = job_group(self.job_id) if self.job_id is not None else JOBS_GROUP
+        self._sent = {}
+        self._poller = None
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        self._since = timezone.now()
+        await self._send_snapshot()
+
+        interval = job_options().get('WS_POLL_INTERVAL')
+        if interval is None:
+            interval = 1.0 if isinstance(self.channel_layer, InMemoryChannelLayer) else 0
+        if interval:
+            self._poller = asyncio.ensure_future(self._poll_loop(interval))
+
+    async def disconnect(self, close_code):
+        if self._poller is not None:
+            self._poller.cancel()
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def job_progress(self, event):
+        """Receive a job event from the group"""
+        await self._send_job(event['job'])
+
+    async def _send_job(self, payload):
+        # Skip duplicates (the same state from the group and the poller)
+        key = (payload['status'], payload['progress_done'], payload['progress_total'], payload['message'])
+        if self._sent.get(payload['id']) == key:
+            return
+        self._sent[payload['id']] = key
+        await self.send(text_data=json.dumps({'type': 'job_progress', 'job': payload}))
+
+    def _jobs(self):
+        if self.job_id is not None:
+            return Job.objects.filter(id=self.job_id)
+        return Job.objects.all()
+
+    async def _send_snapshot(self):
+        jobs = [job async for job in self._jobs().order_by('-id')[:RECENT_JOBS]]
+        for job in reversed(jobs):
+            await self._send_job(job_payload(job))
+
+    async def _poll_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            since, self._since = self._since, timezone.now()
+            changed = self._jobs().filter(
+                Q(status__in=(Job.STATUS_QUEUED, Job.STATUS_RUNNING))
+                | Q(finished_at__gte=since) | Q(created_at__gte=since)
+            ).order_by('id')
+            async for job in changed:
+                await self._send_job(job_payload(job))
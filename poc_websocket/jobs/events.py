@@ -0,0 +1,56 @@
+"""
+Job progress events over the channel layer.
+
+Workers publish every state change and progress update to the `jobs` group
+(all jobs) and to `job-<id>` (one job); JobProgressConsumer forwards them to
+WebSocket clients. Worker processes only reach the web process through a
+shared channel layer (Redis); with the in-memory layer the consumer polls
+the jobs table instead (see jobs.consumers).
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from poc_project.instrumentation import WS_GROUP_SEND, timed
+
+JOBS_GROUP = 'jobs'
+
+
+def job_group(job_id):
+    return f'job-{job_id}'
+
+
+def job_payload(job):
+    return {
+        'id': job.id,
+        'task': job.task,
+        'params': job.params,
+        'status': job.status,
+        'progress_done': job.progress_done,
+        'progress_total': job.progress_total,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error.splitlines()[-1] if job.error else '',
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _message(payload):
+    return {
+        'type': 'job_progress',
+        'job': payload,
+    }
+
+
+def publish_job(job):
+    """Send a job's current state to its subscribers (sync callers)"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    message = _message(job_payload(job))
+    for group in (JOBS_GROUP, job_group(job.id)):
+        with timed(WS_GROUP_SEND, group=JOBS_GROUP):
+            async_to_sync(channel_layer.group_send)(group, message)
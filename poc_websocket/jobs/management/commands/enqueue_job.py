@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs import queue
+from jobs.registry import TASKS, InvalidParams, UnknownTask
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue a background job for `run_jobs` workers, e.g.\n"
+        "  manage.py enqueue_job import_protocols --params '{\"protocols_path\": \"protocols/\"}'\n"
+        "  manage.py enqueue_job ingest_sessions --params '{\"path\": \"sessions.jsonl\"}'\n"
+        "(import paths are relative to MINDTRACE_IMPORT_ROOT)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("task", help="Registered task name")
+        parser.add_argument(
+            "--params",
+            default="{}",
+            help="Task keyword arguments as a JSON object",
+        )
+        parser.add_argument(
+            "--priority",
+            type=int,
+            default=0,
+            help="Higher runs first (default: 0)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            params = json.loads(options["params"])
+        except ValueError as exc:
+            raise CommandError(f"--params is not valid JSON: {exc}")
+        if not isinstance(params, dict):
+            raise CommandError("--params must be a JSON object")
+        try:
+            job = queue.enqueue(options["task"], params, priority=options["priority"])
+        except UnknownTask:
+            raise CommandError(f"Unknown task {options['task']!r}. Registered: {', '.join(sorted(TASKS))}")
+        except InvalidParams as exc:
+            raise CommandError(f"Invalid --params for {options['task']}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Queued job {job.id} ({job.task})"))
@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+import signal
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from jobs.worker import run_worker, worker_name
+
+
+def _exit_on_sigterm():
+    # SystemExit unwinds the running task; run_worker hands its job back to the queue
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def _worker_process(index, tasks, once, poll_interval):
+    _exit_on_sigterm()
+    try:
+        run_worker(worker_name(index), tasks=tasks, once=once, poll_interval=poll_interval)
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background job workers (jobs.Job queue) until interrupted.\n"
+        "Jobs resume from their last checkpoint after a crash; running jobs whose\n"
+        "worker stops heartbeating are reclaimed after JOBS['STALE_AFTER'] seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes (default: 1; SQLite always uses 1)",
+        )
+        parser.add_argument(
+            "--task",
+            action="append",
+            dest="tasks",
+            help="Only run jobs of this task (repeatable)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of polling",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=None,
+            help="Seconds between polls of an empty queue (default: JOBS['POLL_INTERVAL'])",
+        )
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+        workers = max(1, options["workers"])
+        tasks, once, poll_interval = options.get("tasks"), options["once"], options["poll_interval"]
+
+        if workers > 1 and connection.vendor == "sqlite":
+            # One writer at a time: parallel workers just hit "database is locked"
+            self.stderr.write(self.style.WARNING(
+                "SQLite allows a single writer; ignoring --workers. Use PostgreSQL for parallel workers."
+            ))
+            workers = 1
+
+        if workers == 1:
+            _exit_on_sigterm()
+            try:
+                ran = run_worker(worker_name(), tasks=tasks, once=once, poll_interval=poll_interval)
+            except KeyboardInterrupt:
+                self.stdout.write("Stopped.")
+                return
+            self.stdout.write(self.style.SUCCESS(f"Done. Ran {ran} job(s)"))
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=_worker_process, args=(index, tasks, once, poll_interval), daemon=False)
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            self.stdout.write("Stopped.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Done. {workers} worker(s) exited"))
@@ -0,0 +1,106 @@
+"""
+DB-backed job queue operations.
+
+Claiming is a conditional UPDATE (status still 'queued'), so several workers
+can poll the same table on any database without double-running a job.
+A running job's lease is its heartbeat_at; a job whose worker stopped
+heartbeating for JOBS['STALE_AFTER'] seconds is requeued (or failed once
+it has used up max_attempts) by reclaim_stale().
+"""
+
+import datetime
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_job
+from .models import Job
+from .registry import validate_params
+
+DEFAULT_OPTIONS = {
+    # Seconds an idle worker waits before polling the queue again
+    'POLL_INTERVAL': 1.0,
+    # Seconds without a heartbeat after which a running job is reclaimed
+    'STALE_AFTER': 300,
+    # Minimum seconds between progress writes/events from one job
+    'PROGRESS_INTERVAL': 0.5,
+    # Base delay before retrying a failed job (doubles per attempt)
+    'RETRY_DELAY': 10,
+}
+
+
+def job_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'JOBS', {})}
+
+
+def enqueue(task: str, params: Optional[dict] = None, priority: int = 0,
+            max_attempts: Optional[int] = None, run_after: Optional[datetime.datetime] = None) -> Job:
+    """Queue a registered task; raises registry.UnknownTask for unknown names
+    and registry.InvalidParams for params the task rejects."""
+    params = params or {}
+    validate_params(task, params)
+    job = Job(task=task, params=params, priority=priority)
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    if run_after is not None:
+        job.run_after = run_after
+    job.save()
+    publish_job(job)
+    return job
+
+
+def cancel(job: Job) -> bool:
+    """Cancel a queued or running job. A running task stops at its next
+    progress update or checkpoint."""
+    updated = Job.objects.filter(
+        id=job.id, status__in=(Job.STATUS_QUEUED, Job.STATUS_RUNNING),
+    ).update(status=Job.STATUS_CANCELLED, finished_at=timezone.now(), message='Cancelled')
+    job.refresh_from_db()
+    if updated:
+        publish_job(job)
+    return bool(updated)
+
+
+def claim_next(worker: str, tasks: Optional[Iterable[str]] = None) -> Optional[Job]:
+    """Take the next due job (highest priority, then oldest) for worker."""
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.STATUS_QUEUED, run_after__lte=now)
+    if tasks:
+        candidates = candidates.filter(task__in=list(tasks))
+    for job_id in candidates.order_by('-priority', 'id').values_list('id', flat=True)[:20]:
+        claimed = Job.objects.filter(id=job_id, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING,
+            worker=worker,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+            error='',
+        )
+        if claimed:
+            job = Job.objects.get(id=job_id)
+            if job.started_at is None:
+                Job.objects.filter(id=job_id).update(started_at=now)
+                job.started_at = now
+            publish_job(job)
+            return job
+        # Another worker won the race; try the next candidate
+    return None
+
+
+def reclaim_stale() -> int:
+    """Requeue running jobs whose worker stopped heartbeating."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=job_options()['STALE_AFTER'])
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED,
+        finished_at=timezone.now(),
+        error='Worker lost (heartbeat timeout)',
+        message='Failed: worker lost',
+    )
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.STATUS_QUEUED,
+        worker='',
+        message='Requeued after worker timeout; resumes from its checkpoint',
+    )
+    return failed + requeued
@@ -0,0 +1,61 @@
+"""
+Task registry for background jobs.
+
+Apps register tasks in a `tasks.py` module (autodiscovered by
+JobsConfig.ready()):
+
+    from jobs.registry import task
+
+    @task('rebuild_summaries')
+    def rebuild_summaries(ctx, chunk_size=500):
+        ...
+
+A task receives a JobContext (jobs.worker) and the job's params as keyword
+arguments; its return value (JSON-serializable) becomes Job.result.
+
+Params are checked when the job is queued (validate_params()): they must
+bind to the task's signature, and `@task(name, validate=fn)` adds a check
+of their values: fn(params) raises InvalidParams. Jobs can be queued over the API,
+so tasks taking paths or other sensitive values should validate them.
+"""
+
+import inspect
+from typing import Callable, Dict, Optional
+
+TASKS: Dict[str, Callable] = {}
+VALIDATORS: Dict[str, Callable] = {}
+
+
+class UnknownTask(KeyError):
+    pass
+
+
+class InvalidParams(ValueError):
+    pass
+
+
+def task(name: str, validate: Optional[Callable] = None):
+    def register(fn):
+        TASKS[name] = fn
+        if validate is not None:
+            VALIDATORS[name] = validate
+        return fn
+    return register
+
+
+def get_task(name: str) -> Callable:
+    try:
+        return TASKS[name]
+    except KeyError:
+        raise UnknownTask(name) from None
+
+
+def validate_params(name: str, params: dict) -> None:
+    """Raise UnknownTask or InvalidParams unless params suit the task."""
+    fn = get_task(name)
+    try:
+        inspect.signature(fn).bind(None, **params)
+    except TypeError as exc:
+        raise InvalidParams(str(exc)) from None
+    if name in VALIDATORS:
+        VALIDATORS[name](params)
@@ -0,0 +1,94 @@
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import queue, registry, worker
+from .models import Job
+
+TEST_TASK = 'tests_flaky'
+
+
+def flaky(ctx, fail=True):
+    ctx.save_checkpoint({'step': 1})
+    if fail:
+        raise RuntimeError('boom')
+    return {'resumed': ctx.resumed}
+
+
+class JobLifecycleTests(TestCase):
+    def setUp(self):
+        registry.task(TEST_TASK)(flaky)
+        self.addCleanup(registry.TASKS.pop, TEST_TASK, None)
+
+    def test_failure_is_requeued_then_retried(self):
+        job = queue.enqueue(TEST_TASK, {'fail': True}, max_attempts=2)
+        self.assertEqual(worker.run_worker('w1', once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.worker, '')
+        self.assertIsNone(job.finished_at)
+        self.assertIn('RuntimeError', job.error)
+        self.assertGreater(job.run_after, timezone.now())
+
+        # Second and last attempt fails for good
+        self._make_due(job)
+        worker.run_worker('w2', once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_retry_resumes_from_checkpoint(self):
+        job = queue.enqueue(TEST_TASK, {'fail': True})
+        worker.run_worker('w1', once=True)
+        Job.objects.filter(id=job.id).update(params={'fail': False})
+        self._make_due(job)
+        worker.run_worker('w1', once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result, {'resumed': True})
+
+    def _make_due(self, job):
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+
+    def test_release_requeues_running_job(self):
+        job = queue.enqueue(TEST_TASK)
+        claimed = queue.claim_next('w1')
+        self.assertEqual(claimed.id, job.id)
+        worker.release(claimed, 'w1')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.worker, '')
+
+    def test_release_by_other_worker_is_ignored(self):
+        queue.enqueue(TEST_TASK)
+        claimed = queue.claim_next('w1')
+        worker.release(claimed, 'w2')
+        self.assertEqual(claimed.status, Job.STATUS_RUNNING)
+        self.assertEqual(claimed.worker, 'w1')
+
+
+class EnqueueValidationTests(TestCase):
+    def test_unknown_params_are_rejected(self):
+        with self.assertRaises(registry.InvalidParams):
+            queue.enqueue('rebuild_summaries', {'chunk': 10})
+        self.assertFalse(Job.objects.exists())
+
+    def test_search_kind_is_validated(self):
+        with self.assertRaises(registry.InvalidParams):
+            queue.enqueue('rebuild_search_index', {'kind': 'sessions'})
+        queue.enqueue('rebuild_search_index', {'kind': 'users'})
+
+    def test_import_paths_are_confined_to_import_root(self):
+        with self.settings(MINDTRACE_IMPORT_ROOT='/srv/imports'):
+            for params in ({'protocols_path': '/etc'}, {'assessments_file': '../secrets.json'},
+                           {'protocols_path': 'protocols', 'glob': '../*.json'}):
+                with self.subTest(params=params), self.assertRaises(registry.InvalidParams):
+                    queue.enqueue('import_protocols', params)
+            queue.enqueue('import_protocols', {'protocols_path': 'protocols'})
+
+    def test_api_returns_400_for_invalid_params(self):
+        response = APIClient().post(
+            '/api/jobs/', {'task': 'import_protocols', 'params': {'protocols_path': '/etc'}}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('params', response.json())
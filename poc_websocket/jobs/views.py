@@ -0,0 +1,58 @@
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from . import queue
+from .events import job_payload
+from .models import Job
+from .registry import TASKS, InvalidParams, UnknownTask
+
+RECENT_JOBS = 50
+
+
+@api_view(['GET', 'POST'])
+def job_list(request):
+    """List recent jobs (?status=, ?task=) or queue a new one ({task, params, priority})"""
+    if request.method == 'GET':
+        jobs = Job.objects.all()
+        for field in ('status', 'task'):
+            if request.GET.get(field):
+                jobs = jobs.filter(**{field: request.GET[field]})
+        return Response([job_payload(job) for job in jobs[:RECENT_JOBS]])
+
+    params = request.data.get('params') or {}
+    if not isinstance(params, dict):
+        return Response({'params': 'must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        priority = int(request.data.get('priority') or 0)
+    except (TypeError, ValueError):
+        return Response({'priority': 'must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        job = queue.enqueue(str(request.data.get('task') or ''), params, priority=priority)
+    except UnknownTask:
+        return Response(
+            {'task': f"must be one of {', '.join(sorted(TASKS))}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except InvalidParams as exc:
+        return Response({'params': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(job_payload(job), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def job_detail(request, pk):
+    """One job's state and progress"""
+    return Response(job_payload(get_object_or_404(Job, pk=pk)))
+
+
+@api_view(['POST'])
+def job_cancel(request, pk):
+    """Cancel a queued or running job"""
+    job = get_object_or_404(Job, pk=pk)
+    if not queue.cancel(job):
+        return Response(
+            {'error': f'Job is already {job.status}'},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(job_payload(job))
@@ -0,0 +1,164 @@
+"""
+Job execution: the JobContext handed to tasks and the worker loop behind
+`manage.py run_jobs`.
+
+Tasks report progress with ctx.progress() and persist resume state with
+ctx.save_checkpoint(). Called inside the transaction that writes a chunk's
+results, save_checkpoint() commits the checkpoint with the work, so a job
+resumed after a crash redoes at most the chunk that was in flight.
+"""
+
+import datetime
+import logging
+import os
+import socket
+import time
+import traceback
+
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish_job
+from .models import Job
+from .queue import claim_next, job_options, reclaim_stale
+from .registry import InvalidParams, UnknownTask, get_task, validate_params
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """The job was cancelled, or its lease was reclaimed by another worker."""
+
+
+def worker_name(index: int = 0) -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{index}'
+
+
+class JobContext:
+    def __init__(self, job: Job, worker: str):
+        self.job = job
+        self.worker = worker
+        self.checkpoint = dict(job.checkpoint or {})
+        self._interval = job_options()['PROGRESS_INTERVAL']
+        self._last_write = 0.0
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.checkpoint)
+
+    def progress(self, done=None, total=None, message=None, force=False):
+        """Record progress (throttled to JOBS['PROGRESS_INTERVAL']); doubles as the heartbeat."""
+        self._apply(done, total, message)
+        if force or time.monotonic() - self._last_write >= self._interval:
+            self._write()
+
+    def save_checkpoint(self, state, done=None, total=None, message=None):
+        """Persist resume state (and progress). Not throttled."""
+        self.checkpoint = dict(state)
+        self._apply(done, total, message)
+        self._write(checkpoint=True)
+
+    def _apply(self, done, total, message):
+        if done is not None:
+            self.job.progress_done = done
+        if total is not None:
+            self.job.progress_total = total
+        if message is not None:
+            self.job.message = message[:255]
+
+    def _write(self, checkpoint=False):
+        self.job.heartbeat_at = timezone.now()
+        fields = {
+            'progress_done': self.job.progress_done,
+            'progress_total': self.job.progress_total,
+            'message': self.job.message,
+            'heartbeat_at': self.job.heartbeat_at,
+        }
+        if checkpoint:
+            self.job.checkpoint = self.checkpoint
+            fields['checkpoint'] = self.checkpoint
+        # Only while this worker still holds the lease
+        updated = Job.objects.filter(id=self.job.id, status=Job.STATUS_RUNNING, worker=self.worker).update(**fields)
+        if not updated:
+            raise JobCancelled()
+        self._last_write = time.monotonic()
+        job = self.job
+        transaction.on_commit(lambda: publish_job(job))
+
+
+def execute(job: Job, worker: str) -> None:
+    ctx = JobContext(job, worker)
+    params = job.params or {}
+    try:
+        fn = get_task(job.task)
+        validate_params(job.task, params)
+    except (UnknownTask, InvalidParams) as exc:
+        # Unknown task or bad params cannot succeed on retry
+        logger.error("Job %s (%s) rejected: %r", job.id, job.task, exc)
+        _finish(job, worker, Job.STATUS_FAILED, error=repr(exc), message=f'Failed: {exc!r}'[:255])
+        return
+    try:
+        result = fn(ctx, **params)
+    except JobCancelled:
+        logger.info("Job %s stopped: cancelled or lease lost", job.id)
+        return
+    except Exception as exc:
+        _fail(job, worker, exc)
+        return
+    _finish(job, worker, Job.STATUS_SUCCEEDED, result=result, message='Done')
+
+
+def _finish(job, owner, status, **fields):
+    """Set the final (or requeued) state, if owner still holds the lease."""
+    fields.setdefault('finished_at', timezone.now())
+    updated = Job.objects.filter(id=job.id, status=Job.STATUS_RUNNING, worker=owner).update(status=status, **fields)
+    job.refresh_from_db()
+    if updated:
+        publish_job(job)
+
+
+def _fail(job, worker, exc):
+    error = traceback.format_exc()
+    logger.error("Job %s (%s) failed: %s", job.id, job.task, exc)
+    if job.attempts >= job.max_attempts:
+        _finish(job, worker, Job.STATUS_FAILED, error=error, message=f'Failed: {exc}'[:255])
+        return
+    delay = job_options()['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+    _finish(
+        job, worker, Job.STATUS_QUEUED,
+        error=error,
+        worker='',
+        finished_at=None,
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+        message=f'Retrying in {delay}s: {exc}'[:255],
+    )
+
+
+def release(job: Job, worker: str) -> None:
+    """Hand a running job back to the queue (worker shutting down)."""
+    _finish(job, worker, Job.STATUS_QUEUED, worker='', finished_at=None,
+            message='Requeued on worker shutdown; resumes from its checkpoint')
+
+
+def run_worker(name: str, tasks=None, once=False, poll_interval=None, should_stop=lambda: False) -> int:
+    """Claim and run jobs until should_stop() (or, with once, the queue is empty).
+    Returns the number of jobs run."""
+    poll_interval = poll_interval or job_options()['POLL_INTERVAL']
+    ran = 0
+    while not should_stop():
+        reclaim_stale()
+        job = claim_next(name, tasks)
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        logger.info("Worker %s running job %s (%s)", name, job.id, job.task)
+        try:
+            execute(job, name)
+        except BaseException:
+            # KeyboardInterrupt/SystemExit mid-task: let another worker resume it
+            release(job, name)
+            raise
+        ran += 1
+    return ran
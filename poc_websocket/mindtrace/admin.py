@@ -1,4 +1,5 @@
 from django.contrib import admin
+from search.mixins import SearchIndexAdminMixin
 from .models import (
     Patient,
     Protocol,
@@ -10,13 +11,19 @@ from .models import (
     Session,
     AssessmentRun,
     Metric,
+    SessionSummary,
+    PatientProtocolSummary,
+    NormTable,
+    ArchiveSegment,
 )
 
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ("id", "external_id", "name", "created_at", "updated_at")
     search_fields = ("external_id", "name")
+    search_kind = "patients"
+    search_index_fields = search_fields
 
 
 @admin.register(Protocol)
@@ -58,10 +65,13 @@ class AssessmentAliasAdmin(admin.ModelAdmin):
 
 
 @admin.register(Session)
-class SessionAdmin(admin.ModelAdmin):
+class SessionAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ("id", "patient", "protocol", "start_time", "site", "operator", "session_type")
     list_filter = ("protocol", "site", "session_type")
     search_fields = ("patient__external_id", "patient__name", "operator")
+    search_kind = "patients"
+    search_lookup = "patient_id"
+    search_index_fields = ("patient__external_id", "patient__name")
 
 
 @admin.register(AssessmentRun)
@@ -69,6 +79,7 @@ class AssessmentRunAdmin(admin.ModelAdmin):
     list_display = ("id", "session", "assessment", "event", "start_time")
     list_filter = ("assessment",)
     search_fields = ("assessment__name", "session__patient__external_id")
+    readonly_fields = ("raw", "raw_manifest")
 
 
 @admin.register(Metric)
@@ -76,3 +87,35 @@ class MetricAdmin(admin.ModelAdmin):
     list_display = ("id", "run", "key", "value_int", "value_float", "value_text")
     list_filter = ("key",)
     search_fields = ("key", "run__assessment__name")
+
+
+@admin.register(SessionSummary)
+class SessionSummaryAdmin(admin.ModelAdmin):
+    list_display = ("session", "patient", "protocol", "start_time", "run_count", "completed_count", "expected_count", "next_assessment")
+    list_filter = ("protocol",)
+    search_fields = ("patient__external_id", "patient__name")
+    readonly_fields = [f.name for f in SessionSummary._meta.fields]
+
+
+@admin.register(PatientProtocolSummary)
+class PatientProtocolSummaryAdmin(admin.ModelAdmin):
+    list_display = ("id", "patient", "protocol", "session_count", "completed_session_count", "run_count", "last_session_at")
+    list_filter = ("protocol",)
+    search_fields = ("patient__external_id", "patient__name")
+    readonly_fields = [f.name for f in PatientProtocolSummary._meta.fields]
+
+
+@admin.register(NormTable)
+class NormTableAdmin(admin.ModelAdmin):
+    list_display = ("id", "assessment", "key", "stratum_type", "stratum", "count", "last_metric_id", "updated_at")
+    list_filter = ("stratum_type",)
+    search_fields = ("assessment__name", "key")
+    exclude = ("values",)
+    readonly_fields = [f.name for f in NormTable._meta.fields if f.name != "values"]
+
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ("id", "path", "session_count", "run_count", "metric_count", "min_start_time", "max_start_time", "size_bytes", "created_at")
+    search_fields = ("path",)
+    readonly_fields = [f.name for f in ArchiveSegment._meta.fields]
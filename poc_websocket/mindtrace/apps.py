@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MindtraceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mindtrace'
+
+    def ready(self):
+        from . import signals  # noqa: F401
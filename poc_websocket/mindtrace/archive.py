@@ -0,0 +1,454 @@
+"""
+Cold archive for the runs and metrics of old sessions.
+
+archive_sessions() moves the AssessmentRun and Metric rows of sessions that
+started before a cutoff out of the hot tables into compressed columnar
+segment files: a zip (DEFLATE) with one JSON array per column plus a
+manifest indexing each session's row ranges. The Session rows (and their
+summaries) stay, pointing at their ArchiveSegment, so listings, summaries
+and mindtrace.services.session_detail() keep working; only the run/metric
+payload of an archived session is read from the file (segments are cached
+per process).
+
+A segment file is written inside the transaction that locks the batch,
+records the segment and deletes the hot rows, so a crash leaves at worst
+an unreferenced file, removed by remove_orphans(). restore_segment() moves
+a segment back.
+
+The sessions still pointing at a segment decide which of its rows are live:
+deleting an archived session releases its runs' RawBlob references
+(session_deleting()), restore and recount skip its rows, and a segment
+whose last session is deleted is removed with its file (session_deleted()).
+
+Archived rows are still part of the data set: the norm tables' full
+rebuild and the exports read them from the segments (metric_rows(),
+iter_sessions()).
+
+Settings:
+    MINDTRACE_ARCHIVE_DIR         where segment files live (default: BASE_DIR / 'archive')
+    MINDTRACE_ARCHIVE_AFTER_DAYS  default age cutoff for archive_sessions (default 730)
+"""
+
+import collections
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import rawstore, summaries
+from .models import ArchiveSegment, Assessment, AssessmentRun, Metric, Session
+
+FORMAT_VERSION = 2
+RUN_COLUMNS = ('id', 'session_id', 'assessment_id', 'event', 'start_time', 'pagelink', 'raw_manifest')
+# Version 1 segments hold the raw payloads themselves
+READ_RUN_COLUMNS = {
+    1: ('id', 'session_id', 'assessment_id', 'event', 'start_time', 'pagelink', 'raw'),
+    2: RUN_COLUMNS,
+}
+METRIC_COLUMNS = ('id', 'run_id', 'key', 'value_int', 'value_float', 'value_text')
+DEFAULT_SESSIONS_PER_SEGMENT = 500
+CACHE_SEGMENTS = 4
+# Ids per DELETE statement (SQLite variable limit)
+DELETE_CHUNK = 900
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_dir() -> Path:
+    return Path(getattr(settings, 'MINDTRACE_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def default_cutoff() -> datetime.datetime:
+    days = getattr(settings, 'MINDTRACE_ARCHIVE_AFTER_DAYS', 730)
+    return timezone.now() - datetime.timedelta(days=days)
+
+
+# ---- segment files ----
+
+def _columns(rows: Iterable[Tuple], names: Tuple[str, ...]) -> Dict[str, List[Any]]:
+    columns: Dict[str, List[Any]] = {name: [] for name in names}
+    for row in rows:
+        for name, value in zip(names, row):
+            columns[name].append(value)
+    return columns
+
+
+def write_segment(session_ids: List[int]) -> Tuple[str, Dict[str, Any]]:
+    """Write the runs/metrics of session_ids to a new segment file.
+    Returns (file name, manifest)."""
+    runs = _columns(
+        AssessmentRun.objects.filter(session_id__in=session_ids)
+        .order_by('session_id', 'id')
+        .values_list(*RUN_COLUMNS)
+        .iterator(chunk_size=2000),
+        RUN_COLUMNS,
+    )
+    # Full precision (DjangoJSONEncoder drops microseconds)
+    runs['start_time'] = [value.isoformat() if value else None for value in runs['start_time']]
+    # Same session order as runs, so each session's metrics are one contiguous range
+    metrics = _columns(
+        Metric.objects.filter(run__session_id__in=session_ids)
+        .order_by('run__session_id', 'run_id', 'id')
+        .values_list(*METRIC_COLUMNS)
+        .iterator(chunk_size=5000),
+        METRIC_COLUMNS,
+    )
+
+    run_session = dict(zip(runs['id'], runs['session_id']))
+    index: Dict[str, List[int]] = {}
+    for position, session_id in enumerate(runs['session_id']):
+        span = index.setdefault(str(session_id), [position, position + 1, 0, 0])
+        span[1] = position + 1
+    for position, run_id in enumerate(metrics['run_id']):
+        span = index[str(run_session[run_id])]
+        if span[3] == 0:
+            span[2] = position
+        span[3] = position + 1
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'sessions': session_ids,
+        'run_count': len(runs['id']),
+        'metric_count': len(metrics['id']),
+        'index': index,
+    }
+
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"segment-{timezone.now():%Y%m%d}-{uuid.uuid4().hex[:12]}.zip"
+    tmp_path = directory / f".{name}.tmp"
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        zf.writestr('manifest.json', json.dumps(manifest))
+        for table, columns in (('runs', runs), ('metrics', metrics)):
+            for column, values in columns.items():
+                zf.writestr(f'{table}/{column}.json', json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':')))
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, directory / name)
+    return name, manifest
+
+
+def _file_info(path: Path) -> Tuple[int, str]:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return path.stat().st_size, digest.hexdigest()
+
+
+class _Segment:
+    """Decoded segment: column lists plus the session index."""
+
+    def __init__(self, path: Path):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                self.manifest = json.loads(zf.read('manifest.json'))
+                self.run_columns = READ_RUN_COLUMNS.get(self.manifest.get('version'))
+                if self.run_columns is None:
+                    raise ArchiveError(f"{path.name}: unsupported archive version {self.manifest.get('version')}")
+                self.runs = {c: json.loads(zf.read(f'runs/{c}.json')) for c in self.run_columns}
+                self.metrics = {c: json.loads(zf.read(f'metrics/{c}.json')) for c in METRIC_COLUMNS}
+        except (OSError, KeyError, zipfile.BadZipFile) as exc:
+            raise ArchiveError(f"Cannot read archive segment {path.name}: {exc}") from exc
+
+    def rows(self, session_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        if session_id is None:
+            run_range, metric_range = (0, len(self.runs['id'])), (0, len(self.metrics['id']))
+        else:
+            span = self.manifest['index'].get(str(session_id))
+            if span is None:
+                return [], []
+            run_range, metric_range = (span[0], span[1]), (span[2], span[3])
+        runs = [
+            {c: self.runs[c][i] for c in self.run_columns}
+            for i in range(*run_range)
+        ]
+        for run in runs:
+            run['start_time'] = parse_datetime(run['start_time']) if run['start_time'] else None
+        metrics = [
+            {c: self.metrics[c][i] for c in METRIC_COLUMNS}
+            for i in range(*metric_range)
+        ]
+        return runs, metrics
+
+
+_cache: 'collections.OrderedDict[int, _Segment]' = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _load(segment: ArchiveSegment) -> _Segment:
+    with _cache_lock:
+        decoded = _cache.get(segment.id)
+        if decoded is not None:
+            _cache.move_to_end(segment.id)
+            return decoded
+    decoded = _Segment(archive_dir() / segment.path)
+    with _cache_lock:
+        _cache[segment.id] = decoded
+        while len(_cache) > CACHE_SEGMENTS:
+            _cache.popitem(last=False)
+    return decoded
+
+
+def session_rows(segment_id: int, session_id: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Archived runs (with assessment__name) and metrics of one session, shaped
+    like the value rows mindtrace.services reads from the hot tables."""
+    segment = ArchiveSegment.objects.get(id=segment_id)
+    runs, metrics = _load(segment).rows(session_id)
+    names = dict(
+        Assessment.objects.filter(id__in={run['assessment_id'] for run in runs}).values_list('id', 'name')
+    )
+    for run in runs:
+        run['assessment__name'] = names.get(run['assessment_id'])
+    return runs, metrics
+
+
+def iter_sessions(sessions) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]]:
+    """(session, runs, metrics) for each session of a values() queryset of
+    archived sessions, which must include 'id' and 'archive_segment_id'.
+    Sessions are read segment by segment, so each file is decoded once."""
+    current, decoded = None, None
+    for session in sessions.order_by('archive_segment_id', 'id').iterator(chunk_size=2000):
+        if session['archive_segment_id'] != current:
+            current = session['archive_segment_id']
+            decoded = _load(ArchiveSegment.objects.get(id=current))
+        runs, metrics = decoded.rows(session['id'])
+        yield session, runs, metrics
+
+
+def metric_rows() -> Iterator[Tuple]:
+    """Archived metrics of live sessions as (id, assessment_id, key,
+    value_int, value_float, site, protocol_id) tuples, the shape of
+    mindtrace.norms.METRIC_FIELDS."""
+    sessions = Session.objects.filter(archive_segment__isnull=False).values(
+        'id', 'archive_segment_id', 'site', 'protocol_id',
+    )
+    for session, runs, metrics in iter_sessions(sessions):
+        assessments = {run['id']: run['assessment_id'] for run in runs}
+        for metric in metrics:
+            yield (
+                metric['id'], assessments[metric['run_id']], metric['key'], metric['value_int'],
+                metric['value_float'], session['site'], session['protocol_id'],
+            )
+
+
+# ---- archive / restore ----
+
+def _delete_ids(model, ids: List[int]) -> None:
+    # Raw DELETEs: the ORM would load every row to send (suppressed) delete signals
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), DELETE_CHUNK):
+            chunk = ids[start:start + DELETE_CHUNK]
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+
+def archive_sessions(cutoff: Optional[datetime.datetime] = None,
+                     sessions_per_segment: int = DEFAULT_SESSIONS_PER_SEGMENT,
+                     limit: Optional[int] = None, progress=None) -> Dict[str, int]:
+    """Archive sessions that started before cutoff, one segment per batch."""
+    cutoff = cutoff or default_cutoff()
+    remove_orphans()
+    candidates = (
+        Session.objects.filter(start_time__lt=cutoff, archive_segment__isnull=True)
+        .order_by('start_time', 'id')
+        .values_list('id', flat=True)
+    )
+    totals = {'segments': 0, 'sessions': 0, 'runs': 0, 'metrics': 0}
+    while limit is None or totals['sessions'] < limit:
+        size = sessions_per_segment if limit is None else min(sessions_per_segment, limit - totals['sessions'])
+        batch = list(candidates[:size])
+        if not batch:
+            break
+        archived = _archive_batch(batch)
+        if archived is None:
+            # Deleted or archived by someone else since the candidate query
+            continue
+        totals['segments'] += 1
+        for key in ('sessions', 'runs', 'metrics'):
+            totals[key] += archived[key]
+        if progress:
+            progress(totals)
+    return totals
+
+
+def _archive_batch(batch: List[int]) -> Optional[Dict[str, int]]:
+    """Archive one batch of sessions into a new segment; None when none of
+    them is left to archive.
+
+    The sessions, runs and metrics are locked before the file is written
+    and the hot rows are deleted in the same transaction, so a run or
+    metric edited meanwhile is either in the file or waits for the delete.
+    (SQLite has no row locks, but a transaction that has read cannot
+    commit over a later write.) A crash after writing the file leaves an
+    unreferenced file for remove_orphans().
+    """
+    path = None
+    try:
+        with transaction.atomic(), summaries.suppressed():
+            live = list(
+                Session.objects.select_for_update()
+                .filter(id__in=batch, archive_segment__isnull=True)
+                .order_by('id')
+                .values_list('id', 'start_time')
+            )
+            if not live:
+                return None
+            session_ids = [session_id for session_id, _ in live]
+            starts = [start_time for _, start_time in live]
+            if connection.features.has_select_for_update:
+                # Editing a run or metric does not touch its session row
+                list(AssessmentRun.objects.select_for_update().filter(session_id__in=session_ids).values_list('id'))
+                list(Metric.objects.select_for_update().filter(run__session_id__in=session_ids).values_list('id'))
+            # Summaries must describe the data before it leaves the hot tables
+            summaries.refresh_sessions(session_ids)
+
+            name, manifest = write_segment(session_ids)
+            path = archive_dir() / name
+            size_bytes, sha256 = _file_info(path)
+            segment = ArchiveSegment.objects.create(
+                path=name,
+                session_count=len(session_ids),
+                run_count=manifest['run_count'],
+                metric_count=manifest['metric_count'],
+                min_start_time=min(starts),
+                max_start_time=max(starts),
+                size_bytes=size_bytes,
+                sha256=sha256,
+            )
+            Session.objects.filter(id__in=session_ids).update(archive_segment=segment)
+            # Exactly the rows written to the file
+            with zipfile.ZipFile(path) as zf:
+                run_ids = json.loads(zf.read('runs/id.json'))
+                metric_ids = json.loads(zf.read('metrics/id.json'))
+            _delete_ids(Metric, metric_ids)
+            _delete_ids(AssessmentRun, run_ids)
+    except BaseException:
+        if path is not None:
+            path.unlink(missing_ok=True)
+        raise
+    return {'sessions': len(session_ids), 'runs': manifest['run_count'], 'metrics': manifest['metric_count']}
+
+
+def _live_sessions(segment_id: int) -> set:
+    return set(Session.objects.filter(archive_segment_id=segment_id).values_list('id', flat=True))
+
+
+def restore_segment(segment: ArchiveSegment) -> Dict[str, int]:
+    """Move a segment's runs and metrics back into the hot tables."""
+    runs, metrics = _load(segment).rows()
+    with transaction.atomic(), summaries.suppressed():
+        # Sessions deleted since archiving released their rows already
+        live = _live_sessions(segment.id)
+        runs = [row for row in runs if row['session_id'] in live]
+        run_ids = {row['id'] for row in runs}
+        metrics = [row for row in metrics if row['run_id'] in run_ids]
+        # Archived manifests kept their RawBlob references; version 1 payloads are stored anew
+        AssessmentRun.objects.bulk_create(
+            [AssessmentRun(**row) for row in runs], batch_size=1000,
+        )
+        Metric.objects.bulk_create(
+            [Metric(**row) for row in metrics], batch_size=5000,
+        )
+        Session.objects.filter(archive_segment=segment).update(archive_segment=None)
+        path = archive_dir() / segment.path
+        segment_id = segment.id
+        segment.delete()
+        transaction.on_commit(lambda: path.unlink(missing_ok=True))
+    with _cache_lock:
+        _cache.pop(segment_id, None)
+    return {'runs': len(runs), 'metrics': len(metrics)}
+
+
+def archived_raw_manifests() -> Iterable[Any]:
+    """Raw manifests of every archived run of a live session (they hold
+    RawBlob references)."""
+    for segment_id, path in ArchiveSegment.objects.order_by('id').values_list('id', 'path'):
+        try:
+            with zipfile.ZipFile(archive_dir() / path) as zf:
+                if json.loads(zf.read('manifest.json')).get('version', 1) < 2:
+                    continue
+                session_ids = json.loads(zf.read('runs/session_id.json'))
+                manifests = json.loads(zf.read('runs/raw_manifest.json'))
+        except (OSError, KeyError, zipfile.BadZipFile) as exc:
+            raise ArchiveError(f"Cannot read archive segment {path}: {exc}") from exc
+        live = _live_sessions(segment_id)
+        yield from (manifest for session_id, manifest in zip(session_ids, manifests) if session_id in live)
+
+
+def session_deleting(session: Session) -> None:
+    """A session is about to be deleted: if it is archived, release the
+    RawBlob references of its archived runs. The instance may predate the
+    archiving, so archive_segment_id is read from the row."""
+    session.archive_segment_id = (
+        Session.objects.filter(id=session.id).values_list('archive_segment_id', flat=True).first()
+    )
+    if session.archive_segment_id is None:
+        return
+    segment = ArchiveSegment.objects.get(id=session.archive_segment_id)
+    decoded = _load(segment)
+    if decoded.manifest.get('version', 1) < 2:
+        return
+    runs, _ = decoded.rows(session.id)
+    for run in runs:
+        rawstore.release_run(run['raw_manifest'])
+
+
+def session_deleted(segment_id: int) -> None:
+    """Remove a segment (and, on commit, its file) once no session points at it."""
+    if Session.objects.filter(archive_segment_id=segment_id).exists():
+        return
+    path = ArchiveSegment.objects.filter(id=segment_id).values_list('path', flat=True).first()
+    if path is None:
+        # Already removed by an earlier session of the same delete
+        return
+    ArchiveSegment.objects.filter(id=segment_id).delete()
+    path = archive_dir() / path
+
+    def cleanup():
+        path.unlink(missing_ok=True)
+        with _cache_lock:
+            _cache.pop(segment_id, None)
+    transaction.on_commit(cleanup)
+
+
+def verify_segment(segment: ArchiveSegment) -> bool:
+    path = archive_dir() / segment.path
+    if not path.is_file():
+        return False
+    size_bytes, sha256 = _file_info(path)
+    return size_bytes == segment.size_bytes and sha256 == segment.sha256
+
+
+def remove_orphans(min_age_seconds: int = 3600) -> int:
+    """Delete segment files no ArchiveSegment references (left by a crash
+    between writing a file and committing it)."""
+    directory = archive_dir()
+    if not directory.is_dir():
+        return 0
+    known = set(ArchiveSegment.objects.values_list('path', flat=True))
+    removed = 0
+    now = time.time()
+    for path in directory.glob('segment-*.zip'):
+        if path.name not in known and now - path.stat().st_mtime > min_age_seconds:
+            path.unlink(missing_ok=True)
+            removed += 1
+    for path in directory.glob('.segment-*.zip.tmp'):
+        if now - path.stat().st_mtime > min_age_seconds:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
@@ -0,0 +1,106 @@
+"""
+Native async versions of the MindTrace API (see user_app/async_views.py).
+"""
+
+from django.db import IntegrityError
+from django.http import Http404, HttpResponse
+
+from poc_project.async_api import aget_object_or_404, async_api_view, json_response
+from . import services
+from .models import Patient, PatientProtocolSummary, SessionSummary
+from .serializers import PatientSerializer
+from .views import _patient_summary_data, _session_summary_data
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _page_bounds(request):
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        offset, limit = 0, DEFAULT_PAGE_SIZE
+    return offset, limit
+
+
+async def _external_id_taken(external_id, exclude_pk=None):
+    qs = Patient.objects.filter(external_id=external_id)
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return await qs.aexists()
+
+
+def _duplicate_error():
+    return json_response({'external_id': ['patient with this external id already exists.']}, status=400)
+
+
+@async_api_view(['GET', 'POST'])
+async def patient_list(request):
+    """List patients (offset/limit paginated) or create a patient"""
+    if request.method == 'GET':
+        offset, limit = _page_bounds(request)
+        patients = [p async for p in Patient.objects.order_by('id')[offset:offset + limit]]
+        return json_response(PatientSerializer(patients, many=True).data)
+
+    serializer = PatientSerializer(data=request.data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+    if await _external_id_taken(serializer.validated_data['external_id']):
+        return _duplicate_error()
+    patient = Patient(**serializer.validated_data)
+    try:
+        await patient.asave()
+    except IntegrityError:
+        return _duplicate_error()
+    return json_response(PatientSerializer(patient).data, status=201)
+
+
+@async_api_view(['GET', 'PATCH', 'DELETE'])
+async def patient_detail(request, pk):
+    """Retrieve, update or delete a patient"""
+    patient = await aget_object_or_404(Patient.objects.all(), pk=pk)
+
+    if request.method == 'GET':
+        return json_response(PatientSerializer(patient).data)
+
+    if request.method == 'PATCH':
+        serializer = PatientSerializer(patient, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        external_id = serializer.validated_data.get('external_id')
+        if external_id and await _external_id_taken(external_id, exclude_pk=patient.pk):
+            return _duplicate_error()
+        for field, value in serializer.validated_data.items():
+            setattr(patient, field, value)
+        try:
+            await patient.asave()
+        except IntegrityError:
+            return _duplicate_error()
+        return json_response(PatientSerializer(patient).data)
+
+    await patient.adelete()
+    return HttpResponse(status=204)
+
+
+@async_api_view(['GET'])
+async def session_detail(request, session_id):
+    """Session with its runs and metrics"""
+    payload = await services.asession_detail(session_id)
+    if payload is None:
+        raise Http404
+    return json_response(payload)
+
+
+@async_api_view(['GET'])
+async def session_summary(request, session_id):
+    """Dashboard row for one session (single-row lookup)"""
+    summary = await aget_object_or_404(SessionSummary.objects.all(), session_id=session_id)
+    return json_response(_session_summary_data(summary))
+
+
+@async_api_view(['GET'])
+async def patient_summaries(request, patient_id):
+    """Per-protocol roll-ups for one patient"""
+    rows = PatientProtocolSummary.objects.filter(patient_id=patient_id).order_by('protocol_id')
+    return json_response([_patient_summary_data(row) async for row in rows])
@@ -0,0 +1,360 @@
+"""
+Streaming bulk export of sessions, runs and metrics.
+
+Rows are read with QuerySet.values_list().iterator(chunk_size=...) and
+encoded one chunk at a time, so memory stays flat regardless of export size.
+Used by the export view (StreamingHttpResponse) and the export_data
+management command. Under ASGI the view wraps the stream in achunks():
+Django would otherwise buffer a sync iterator into a list before sending.
+
+Runs and metrics of archived sessions are read from their segment files
+(mindtrace.archive) and follow the hot rows.
+
+Formats: csv, ndjson and parquet. Parquet needs the optional pyarrow
+package; each chunk becomes one row group.
+"""
+
+import csv
+import datetime
+import io
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import archive
+from .models import Assessment, AssessmentRun, Metric, Session
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# (column name, ORM lookup, type) per dataset; type drives the Parquet schema
+DATASETS: Dict[str, List[Tuple[str, str, str]]] = {
+    'sessions': [
+        ('session_id', 'id', 'int'),
+        ('patient_external_id', 'patient__external_id', 'str'),
+        ('protocol', 'protocol__name', 'str'),
+        ('start_time', 'start_time', 'timestamp'),
+        ('site', 'site', 'str'),
+        ('operator', 'operator', 'str'),
+        ('session_type', 'session_type', 'str'),
+        ('app_version', 'app_version', 'str'),
+        ('exp_version', 'exp_version', 'str'),
+    ],
+    'runs': [
+        ('run_id', 'id', 'int'),
+        ('session_id', 'session_id', 'int'),
+        ('patient_external_id', 'session__patient__external_id', 'str'),
+        ('protocol', 'session__protocol__name', 'str'),
+        ('site', 'session__site', 'str'),
+        ('assessment', 'assessment__name', 'str'),
+        ('event', 'event', 'str'),
+        ('start_time', 'start_time', 'timestamp'),
+    ],
+    'metrics': [
+        ('metric_id', 'id', 'int'),
+        ('run_id', 'run_id', 'int'),
+        ('session_id', 'run__session_id', 'int'),
+        ('patient_external_id', 'run__session__patient__external_id', 'str'),
+        ('protocol', 'run__session__protocol__name', 'str'),
+        ('site', 'run__session__site', 'str'),
+        ('session_start_time', 'run__session__start_time', 'timestamp'),
+        ('assessment', 'run__assessment__name', 'str'),
+        ('key', 'key', 'str'),
+        ('value_int', 'value_int', 'int'),
+        ('value_float', 'value_float', 'float'),
+        ('value_text', 'value_text', 'str'),
+    ],
+}
+
+# Path from each dataset's model to Session, for the shared filters
+_SESSION_PATH = {'sessions': '', 'runs': 'session__', 'metrics': 'run__session__'}
+
+
+class ExportError(ValueError):
+    """Invalid export request (unknown dataset/format, bad filter, missing dependency)."""
+
+
+class ExportStats:
+    """Row count and throughput of one export, filled in while streaming."""
+
+    def __init__(self):
+        self.rows = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.rows} rows in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s)"
+
+
+# ---- filters ----
+
+def _parse_day(value: str) -> Optional[datetime.date]:
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def _parse_bound(value: Optional[str], end: bool = False) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    # Bare dates first: parse_datetime also accepts them on Python 3.11+
+    day = _parse_day(value)
+    if day is not None:
+        if end:
+            # Inclusive end date -> exclusive start of the next day
+            day += datetime.timedelta(days=1)
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ExportError(f"Invalid date: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def build_queryset(dataset: str, filters: Optional[Dict[str, Any]] = None):
+    """Filtered, ordered queryset for one dataset's hot rows (iter_rows()
+    adds the archived ones).
+    Filters: protocol (name or id), site, assessment (name), date_from, date_to
+    (session start_time; date_to is inclusive when given as a date).
+    """
+    if dataset not in DATASETS:
+        raise ExportError(f"Unknown dataset {dataset!r} (expected one of {', '.join(DATASETS)})")
+    filters = filters or {}
+    model = {'sessions': Session, 'runs': AssessmentRun, 'metrics': Metric}[dataset]
+    prefix = _SESSION_PATH[dataset]
+    qs = model.objects.all()
+
+    protocol = filters.get('protocol')
+    if protocol:
+        cond = Q(**{f'{prefix}protocol__name': protocol})
+        if str(protocol).isdigit():
+            cond |= Q(**{f'{prefix}protocol_id': int(protocol)})
+        qs = qs.filter(cond)
+    if filters.get('site'):
+        qs = qs.filter(**{f'{prefix}site': filters['site']})
+    date_from = _parse_bound(filters.get('date_from'))
+    if date_from:
+        qs = qs.filter(**{f'{prefix}start_time__gte': date_from})
+    date_to_raw = filters.get('date_to')
+    date_to = _parse_bound(date_to_raw, end=True)
+    if date_to:
+        # A bare date is an inclusive day, a datetime an inclusive instant
+        lookup = 'lt' if _parse_day(date_to_raw) else 'lte'
+        qs = qs.filter(**{f'{prefix}start_time__{lookup}': date_to})
+
+    assessment = filters.get('assessment')
+    if assessment:
+        if dataset == 'sessions':
+            qs = qs.filter(Exists(
+                AssessmentRun.objects.filter(session_id=OuterRef('pk'), assessment__name=assessment)
+            ))
+        elif dataset == 'runs':
+            qs = qs.filter(assessment__name=assessment)
+        else:
+            qs = qs.filter(run__assessment__name=assessment)
+    return qs.order_by('id')
+
+
+def _archived_rows(dataset: str, filters: Dict[str, Any]) -> Iterator[tuple]:
+    """Rows of archived runs and metrics, read from their segments
+    (mindtrace.archive) and filtered like build_queryset(). Session rows are
+    never archived; they only come from here when the assessment filter
+    matches an archived run and no hot one."""
+    assessment = filters.get('assessment')
+    if dataset == 'sessions' and not assessment:
+        return
+    session_lookups = [lookup for _, lookup, _ in DATASETS['sessions']]
+    sessions = build_queryset('sessions', {**filters, 'assessment': None}).filter(archive_segment__isnull=False)
+    if dataset == 'sessions':
+        sessions = sessions.exclude(Exists(
+            AssessmentRun.objects.filter(session_id=OuterRef('pk'), assessment__name=assessment)
+        ))
+    names = dict(Assessment.objects.values_list('id', 'name'))
+
+    for session, runs, metrics in archive.iter_sessions(sessions.values('archive_segment_id', *session_lookups)):
+        run_names = {run['id']: names.get(run['assessment_id']) for run in runs}
+        if dataset == 'sessions':
+            if assessment in run_names.values():
+                yield tuple(session[lookup] for lookup in session_lookups)
+        elif dataset == 'runs':
+            for run in runs:
+                if not assessment or run_names[run['id']] == assessment:
+                    yield (
+                        run['id'], session['id'], session['patient__external_id'], session['protocol__name'],
+                        session['site'], run_names[run['id']], run['event'], run['start_time'],
+                    )
+        else:
+            for metric in metrics:
+                if not assessment or run_names[metric['run_id']] == assessment:
+                    yield (
+                        metric['id'], metric['run_id'], session['id'], session['patient__external_id'],
+                        session['protocol__name'], session['site'], session['start_time'],
+                        run_names[metric['run_id']], metric['key'], metric['value_int'], metric['value_float'],
+                        metric['value_text'],
+                    )
+
+
+def iter_rows(dataset: str, filters: Optional[Dict[str, Any]] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[tuple]]:
+    """Yield lists of at most chunk_size row tuples, in DATASETS column order:
+    the hot rows in id order, then the archived ones."""
+    lookups = [lookup for _, lookup, _ in DATASETS[dataset]]
+    qs = build_queryset(dataset, filters).values_list(*lookups)
+    chunk: List[tuple] = []
+    for row in itertools.chain(qs.iterator(chunk_size=chunk_size), _archived_rows(dataset, filters or {})):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---- encoders ----
+
+def _encode_csv(dataset: str, chunks: Iterable[List[tuple]]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _, _ in DATASETS[dataset]])
+    for chunk in chunks:
+        writer.writerows(
+            [v.isoformat() if isinstance(v, datetime.datetime) else v for v in row] for row in chunk
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _encode_ndjson(dataset: str, chunks: Iterable[List[tuple]]) -> Iterator[str]:
+    names = [name for name, _, _ in DATASETS[dataset]]
+    encoder = DjangoJSONEncoder()
+    for chunk in chunks:
+        yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
+
+
+class _ByteSink(io.RawIOBase):
+    """Write-only file object that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data, self._parts = b''.join(self._parts), []
+        return data
+
+
+def _encode_parquet(dataset: str, chunks: Iterable[List[tuple]]) -> Iterator[bytes]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ExportError("Parquet export requires the 'pyarrow' package") from exc
+
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'timestamp': pa.timestamp('us', tz='UTC')}
+    columns = DATASETS[dataset]
+    schema = pa.schema([(name, types[kind]) for name, _, kind in columns])
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for chunk in chunks:
+            arrays = [
+                pa.array([row[i] for row in chunk], type=schema.field(i).type)
+                for i in range(len(columns))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+_ENCODERS = {'csv': _encode_csv, 'ndjson': _encode_ndjson, 'parquet': _encode_parquet}
+
+
+def stream_export(dataset: str, fmt: str, filters: Optional[Dict[str, Any]] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  stats: Optional[ExportStats] = None) -> Iterator[Any]:
+    """Encoded export chunks (str for text formats, bytes for parquet).
+    Validation happens eagerly so callers can turn ExportError into a 400
+    before the response starts streaming.
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as exc:
+            raise ExportError("Parquet export requires the 'pyarrow' package") from exc
+    build_queryset(dataset, filters)
+    stats = stats or ExportStats()
+
+    def counted():
+        for chunk in iter_rows(dataset, filters, chunk_size):
+            stats.rows += len(chunk)
+            yield chunk
+
+    def generate():
+        yield from _ENCODERS[fmt](dataset, counted())
+        stats.finished = time.monotonic()
+        logger.info("export %s.%s: %s", dataset, fmt, stats)
+
+    return generate()
+
+
+_DONE = object()
+
+
+async def achunks(stream: Iterator[Any]) -> AsyncIterator[Any]:
+    """Async iteration over a stream_export() stream, one chunk at a time.
+    Every step runs in the request's sync thread, which owns the DB cursor."""
+    step = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await step(stream, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        # Client gone or export finished: close the server-side cursor
+        await sync_to_async(stream.close, thread_sensitive=True)()
@@ -0,0 +1,160 @@
+"""
+Assessment and protocol definition import, shared by the import_protocols
+management command and the import_protocols background job.
+
+The job can be queued over the API, so its paths are confined to
+MINDTRACE_IMPORT_ROOT (default: <BASE_DIR>/imports): relative paths are
+resolved against it and anything outside it is rejected (import_path()).
+The management command reads whatever paths the operator gives it.
+"""
+
+import glob
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Assessment, Protocol, ProtocolAssessment
+
+
+class ImportFileError(ValueError):
+    """Missing or malformed import file."""
+
+
+def import_root() -> str:
+    return os.path.realpath(getattr(settings, 'MINDTRACE_IMPORT_ROOT', os.path.join(settings.BASE_DIR, 'imports')))
+
+
+def import_path(path: str) -> str:
+    """Real path of a job import file or directory, which must be inside import_root()."""
+    root = import_root()
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ImportFileError(f"Import paths must be inside {root}: {path}")
+    return resolved
+
+
+def check_pattern(pattern: str) -> None:
+    """Protocol file globs select files in one directory; no separators or '..'."""
+    if not pattern or '..' in pattern or '/' in pattern or os.sep in pattern:
+        raise ImportFileError(f"Invalid protocol file pattern: {pattern!r}")
+
+
+def load_assessments(path: str) -> List[Dict[str, Any]]:
+    """Read the 'assessments' array of AllAssessments.json."""
+    if not os.path.isfile(path):
+        raise ImportFileError(f"Assessments file not found: {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        content = json.load(f)
+    assessments = content.get("assessments")
+    if not isinstance(assessments, list):
+        raise ImportFileError("Invalid AllAssessments.json: missing 'assessments' array")
+    return assessments
+
+
+def import_assessments(assessments: List[Dict[str, Any]]) -> int:
+    """Create missing assessments and refresh psyexp; returns the number created."""
+    created_count = 0
+    with transaction.atomic():
+        for item in assessments:
+            name = str(item.get("name") or "").strip()
+            if not name:
+                continue
+            psyexp = str(item.get("psyexp") or "").strip()
+            obj, created = Assessment.objects.get_or_create(
+                name=name,
+                defaults={"psyexp": psyexp},
+            )
+            if created:
+                created_count += 1
+            else:
+                if psyexp and obj.psyexp != psyexp:
+                    Assessment.objects.filter(id=obj.id).update(psyexp=psyexp)
+    return created_count
+
+
+def protocol_files(path: str, pattern: str = "*.json", exclude: Optional[str] = None) -> List[str]:
+    """Protocol JSON files under path, in a stable order (resumable jobs rely on it)."""
+    files = sorted(
+        p for p in glob.glob(os.path.join(path, pattern))
+        if os.path.isfile(p)
+    )
+    # Skip the AllAssessments.json itself
+    if exclude:
+        files = [p for p in files if os.path.abspath(p) != os.path.abspath(exclude)]
+    return files
+
+
+def read_protocol_file(fp: str) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """Parse one protocol file; the name falls back to the file name."""
+    with open(fp, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    proto_name, items = extract_protocol(data)
+    if not proto_name:
+        # infer from filename
+        proto_name = os.path.splitext(os.path.basename(fp))[0]
+    return proto_name, items
+
+
+def import_protocol(proto_name: str, items: List[Dict[str, str]]) -> Dict[str, int]:
+    """Create/refresh one protocol and its assessment ordering; returns created counts."""
+    counts = {"assessments": 0, "protocols": 0, "links": 0}
+    with transaction.atomic():
+        protocol, p_created = Protocol.objects.get_or_create(name=proto_name)
+        if p_created:
+            counts["protocols"] += 1
+        # Clear existing ordering for idempotency
+        ProtocolAssessment.objects.filter(protocol=protocol).delete()
+
+        for order, item in enumerate(items):
+            aname = (item.get("name") or "").strip()
+            psyexp = (item.get("psyexp") or "").strip()
+            if not aname:
+                continue
+            assessment, a_created = Assessment.objects.get_or_create(
+                name=aname,
+                defaults={"psyexp": psyexp},
+            )
+            if a_created:
+                counts["assessments"] += 1
+            elif psyexp and assessment.psyexp != psyexp:
+                Assessment.objects.filter(id=assessment.id).update(psyexp=psyexp)
+            ProtocolAssessment.objects.create(
+                protocol=protocol,
+                assessment=assessment,
+                order=order,
+            )
+            counts["links"] += 1
+    return counts
+
+
+def extract_protocol(data: Dict[str, Any]) -> Tuple[str | None, List[Dict[str, str]]]:
+    """Best-effort parse of a protocol JSON file.
+    Accepts structures like:
+    - { "name": "MyProtocol", "assessments": ["A", "B", ...] }
+    - { "name": "MyProtocol", "assessments": [{"name": "A", "psyexp": "..."}, {"name": "B"}] }
+    - { "protocol": "MyProtocol", "items": [ ... names ... ] }
+    Returns (protocol_name, list of {name, psyexp?}).
+    """
+    name = None
+    items: List[Dict[str, str]] = []
+
+    if isinstance(data, dict):
+        name = data.get("name") or data.get("protocol")
+        assessments = data.get("assessments") or data.get("items")
+        if isinstance(assessments, list):
+            for it in assessments:
+                if isinstance(it, str):
+                    n = it.strip()
+                    if n:
+                        items.append({"name": n})
+                elif isinstance(it, dict):
+                    n = it.get("name") or it.get("assessment")
+                    if n:
+                        items.append({
+                            "name": str(n).strip(),
+                            "psyexp": str(it.get("psyexp") or "").strip(),
+                        })
+    return (str(name).strip() if name else None, [i for i in items if i.get("name")])
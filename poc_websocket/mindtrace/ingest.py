@@ -0,0 +1,192 @@
+"""
+Bulk ingestion of recorded sessions, behind the ingest_sessions background
+job (mindtrace.tasks).
+
+The input is a JSON Lines file, one session per line:
+
+    {"patient": "P-001", "patient_name": "Ada Lovelace", "protocol": "Baseline",
+     "start_time": "2025-03-01T09:30:00Z", "site": "Boston", "operator": "jd",
+     "runs": [{"assessment": "Stroop", "start_time": "...", "event": "",
+               "raw": {...}, "metrics": {"accuracy": 0.93, "rt_ms": 512}}]}
+
+patient and start_time are required. Missing patients are created;
+protocols and assessments must exist already (import_protocols), and
+assessments may be named by an AssessmentAlias term. Session fields that
+are left out keep their model defaults. Integer metrics go to value_int,
+floats to value_float, anything else to value_text.
+
+Chunks of lines are written with bulk_create, which bypasses the model
+signals, so ingest_chunk() does their work itself: it indexes new patients
+for search, refreshes the session summaries of the chunk and schedules a
+norm refresh once the transaction commits. A line that cannot be ingested
+is reported and skipped; the rest of its chunk still goes in.
+"""
+
+import datetime
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from search.backends import get_backend
+
+from . import norms, summaries
+from .models import Assessment, AssessmentAlias, AssessmentRun, Metric, Patient, Protocol, Session
+
+SESSION_FIELDS = ('site', 'operator', 'session_type', 'app_version', 'exp_version', 'notes', 'frontmatter')
+RUN_FIELDS = ('event', 'pagelink')
+
+
+class IngestError(ValueError):
+    """A line that cannot be ingested."""
+
+
+def read_lines(path: str, start: int = 0) -> Iterator[Tuple[int, str]]:
+    """(line number, text) of the non-blank lines after the first start lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            if number > start and line.strip():
+                yield number, line
+
+
+def count_lines(path: str) -> int:
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def _datetime(value, field):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise IngestError(f"{field} must be an ISO 8601 datetime, got {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+def _metric_columns(value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'value_int': int(value)}
+    if isinstance(value, int):
+        return {'value_int': value}
+    if isinstance(value, float):
+        return {'value_float': value}
+    return {'value_text': value if isinstance(value, str) else json.dumps(value)}
+
+
+class _Lookups:
+    """Name -> id maps for one chunk, one query per model."""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        protocols = {r['protocol'] for r in records if r.get('protocol')}
+        assessments = {run.get('assessment') for r in records for run in r.get('runs') or ()}
+        self.protocols = dict(Protocol.objects.filter(name__in=protocols).values_list('name', 'id'))
+        self.assessments = dict(
+            AssessmentAlias.objects.filter(term__in=assessments).values_list('term', 'assessment_id')
+        )
+        self.assessments.update(Assessment.objects.filter(name__in=assessments).values_list('name', 'id'))
+
+    def protocol(self, name):
+        if not name:
+            return None
+        if name not in self.protocols:
+            raise IngestError(f"Unknown protocol {name!r}")
+        return self.protocols[name]
+
+    def assessment(self, name):
+        if name not in self.assessments:
+            raise IngestError(f"Unknown assessment {name!r}")
+        return self.assessments[name]
+
+
+def _parse(line: str) -> Dict[str, Any]:
+    try:
+        record = json.loads(line)
+    except ValueError as exc:
+        raise IngestError(f"invalid JSON ({exc})") from None
+    if not isinstance(record, dict):
+        raise IngestError("expected a JSON object")
+    if not record.get('patient'):
+        raise IngestError("patient is required")
+    record['patient'] = str(record['patient'])
+    if not isinstance(record.get('runs', []), list):
+        raise IngestError("runs must be a list")
+    return record
+
+
+def _build(record, lookups):
+    """Unsaved Session (without its patient) plus [(AssessmentRun, metric
+    columns)] for one record."""
+    session = Session(
+        protocol_id=lookups.protocol(record.get('protocol')),
+        start_time=_datetime(record.get('start_time'), 'start_time'),
+        **{field: record[field] for field in SESSION_FIELDS if record.get(field) is not None},
+    )
+    runs = []
+    for item in record.get('runs') or ():
+        if not isinstance(item, dict):
+            raise IngestError("each run must be a JSON object")
+        run = AssessmentRun(
+            assessment_id=lookups.assessment(item.get('assessment')),
+            start_time=_datetime(item['start_time'], 'run start_time') if item.get('start_time') else None,
+            **{field: item[field] for field in RUN_FIELDS if item.get(field) is not None},
+        )
+        if item.get('raw') is not None:
+            run.raw = item['raw']
+        metrics = item.get('metrics') or {}
+        if not isinstance(metrics, dict):
+            raise IngestError("metrics must be an object of key -> value")
+        runs.append((run, [(key, _metric_columns(value)) for key, value in metrics.items() if value is not None]))
+    return session, runs
+
+
+def ingest_chunk(lines: List[Tuple[int, str]]) -> Tuple[Dict[str, int], List[str]]:
+    """Ingest (line number, text) pairs; call inside a transaction.
+    Returns created row counts and the messages of skipped lines."""
+    skipped = []
+    records = []
+    for number, line in lines:
+        try:
+            records.append((number, _parse(line)))
+        except IngestError as exc:
+            skipped.append(f"line {number}: {exc}")
+
+    lookups = _Lookups([record for _, record in records])
+    built = []
+    for number, record in records:
+        try:
+            built.append((record, *_build(record, lookups)))
+        except IngestError as exc:
+            skipped.append(f"line {number}: {exc}")
+
+    # Patients are only created for lines that are going in
+    names = {record['patient']: record.get('patient_name') or '' for record, _, _ in built}
+    patient_ids = dict(Patient.objects.filter(external_id__in=names).values_list('external_id', 'id'))
+    new_patients = Patient.objects.bulk_create(
+        [Patient(external_id=external_id, name=name) for external_id, name in names.items() if external_id not in patient_ids]
+    )
+    patient_ids.update((patient.external_id, patient.id) for patient in new_patients)
+    get_backend().index_many('patients', [(p.id, (p.external_id, p.name)) for p in new_patients])
+    for record, session, _ in built:
+        session.patient_id = patient_ids[record['patient']]
+
+    sessions = Session.objects.bulk_create([session for _, session, _ in built])
+    runs = []
+    for _, session, session_runs in built:
+        for run, _ in session_runs:
+            run.session_id = session.id
+            runs.append(run)
+    AssessmentRun.objects.bulk_create(runs)
+    metrics = [
+        Metric(run_id=run.id, key=key, **columns)
+        for _, _, session_runs in built
+        for run, run_metrics in session_runs
+        for key, columns in run_metrics
+    ]
+    Metric.objects.bulk_create(metrics, batch_size=5000)
+
+    summaries.refresh_sessions(session.id for session in sessions)
+    if metrics:
+        norms.schedule_refresh()
+    counts = {'patients': len(new_patients), 'sessions': len(sessions), 'runs': len(runs), 'metrics': len(metrics)}
+    return counts, skipped
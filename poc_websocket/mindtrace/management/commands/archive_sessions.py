@@ -0,0 +1,125 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from mindtrace import archive
+from mindtrace.models import ArchiveSegment, Session
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the runs and metrics of old sessions into compressed archive\n"
+        "segments (MINDTRACE_ARCHIVE_DIR). Sessions and their summaries stay;\n"
+        "session detail reads archived rows from the segment files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=None,
+            help="Archive sessions that started more than N days ago (default: MINDTRACE_ARCHIVE_AFTER_DAYS)",
+        )
+        parser.add_argument(
+            "--before",
+            default=None,
+            help="Archive sessions that started before this date/datetime (ISO)",
+        )
+        parser.add_argument(
+            "--sessions-per-segment",
+            type=int,
+            default=archive.DEFAULT_SESSIONS_PER_SEGMENT,
+            help=f"Sessions per segment file (default: {archive.DEFAULT_SESSIONS_PER_SEGMENT})",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Archive at most N sessions",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count what would be archived",
+        )
+        parser.add_argument(
+            "--restore",
+            type=int,
+            metavar="SEGMENT_ID",
+            default=None,
+            help="Move a segment back into the hot tables",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Check every segment file against its recorded size and checksum",
+        )
+
+    def _cutoff(self, options):
+        if options["before"]:
+            value = parse_datetime(options["before"])
+            if value is None:
+                day = parse_date(options["before"])
+                if day is None:
+                    raise CommandError(f"Invalid --before value: {options['before']}")
+                value = datetime.datetime.combine(day, datetime.time.min)
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            return value
+        if options["older_than_days"] is not None:
+            return timezone.now() - datetime.timedelta(days=options["older_than_days"])
+        return archive.default_cutoff()
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            bad = 0
+            for segment in ArchiveSegment.objects.order_by("id"):
+                if not archive.verify_segment(segment):
+                    bad += 1
+                    self.stdout.write(self.style.ERROR(f"Segment {segment.id} ({segment.path}) is missing or corrupt"))
+            if bad:
+                raise CommandError(f"{bad} segment(s) failed verification")
+            self.stdout.write(self.style.SUCCESS("All segments verified"))
+            return
+
+        if options["restore"] is not None:
+            segment = ArchiveSegment.objects.filter(id=options["restore"]).first()
+            if segment is None:
+                raise CommandError(f"No archive segment {options['restore']}")
+            try:
+                counts = archive.restore_segment(segment)
+            except archive.ArchiveError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored {counts['runs']} runs and {counts['metrics']} metrics from segment {options['restore']}"
+            ))
+            return
+
+        cutoff = self._cutoff(options)
+        if options["dry_run"]:
+            sessions = Session.objects.filter(start_time__lt=cutoff, archive_segment__isnull=True)
+            count = sessions.count()
+            if options["limit"] is not None:
+                count = min(count, options["limit"])
+            self.stdout.write(f"{count} session(s) started before {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        started = time.monotonic()
+
+        def progress(totals):
+            self.stdout.write(f"  segment {totals['segments']}: {totals['sessions']} session(s) archived")
+
+        totals = archive.archive_sessions(
+            cutoff,
+            sessions_per_segment=options["sessions_per_segment"],
+            limit=options["limit"],
+            progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Archived {totals['sessions']} sessions ({totals['runs']} runs, {totals['metrics']} metrics) "
+            f"into {totals['segments']} segment(s) in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,67 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mindtrace import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream MindTrace sessions, runs or metrics to CSV, NDJSON or Parquet.\n"
+        "Rows are read in chunks so memory stays constant; throughput is reported at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "dataset",
+            choices=sorted(exports.DATASETS),
+            help="What to export",
+        )
+        parser.add_argument(
+            "--format",
+            dest="fmt",
+            choices=sorted(exports.FORMATS),
+            default="csv",
+            help="Output format (default: csv)",
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Output file path, '-' for stdout (default)",
+        )
+        parser.add_argument("--protocol", help="Protocol name or id")
+        parser.add_argument("--site", help="Session site")
+        parser.add_argument("--assessment", help="Assessment name")
+        parser.add_argument("--date-from", help="Sessions starting at/after this date or datetime")
+        parser.add_argument("--date-to", help="Sessions starting on/before this date or datetime")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=exports.DEFAULT_CHUNK_SIZE,
+            help=f"Rows fetched and encoded per chunk (default: {exports.DEFAULT_CHUNK_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        dataset, fmt, output = options["dataset"], options["fmt"], options["output"]
+        filters = {
+            key: options.get(key)
+            for key in ("protocol", "site", "assessment", "date_from", "date_to")
+        }
+        stats = exports.ExportStats()
+        try:
+            stream = exports.stream_export(dataset, fmt, filters, chunk_size=options["chunk_size"], stats=stats)
+        except exports.ExportError as exc:
+            raise CommandError(str(exc))
+
+        binary = fmt == "parquet"
+        if output == "-":
+            out = sys.stdout.buffer if binary else sys.stdout
+            for part in stream:
+                out.write(part)
+            out.flush()
+        else:
+            with open(output, "wb" if binary else "w", encoding=None if binary else "utf-8", newline=None if binary else "") as out:
+                for part in stream:
+                    out.write(part)
+
+        self.stderr.write(self.style.SUCCESS(f"Exported {dataset} as {fmt}: {stats}"))
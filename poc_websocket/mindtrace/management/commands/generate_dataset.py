@@ -0,0 +1,400 @@
+import datetime
+import math
+import multiprocessing
+import random
+import time
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from mindtrace import rawstore, summaries
+from mindtrace.models import (
+    AssessmentRun,
+    Metric,
+    Patient,
+    PatientProtocolSummary,
+    Protocol,
+    Session,
+    SessionSummary,
+)
+from search.backends import get_backend
+from user_app import cache, changes
+from user_app.models import User, UserChange
+
+EXTERNAL_ID_PREFIX = "SYN-"
+DEFAULT_END_DATE = "2026-01-01"
+
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Carlos", "Karen",
+    "Wei", "Priya", "Mohammed", "Aisha", "Hiroshi", "Olga", "Mateo", "Fatima", "Noah", "Emma",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Nguyen", "Patel", "Kim", "Chen", "Singh", "Kowalski", "Ivanova", "Okafor", "Haddad",
+]
+SITES = ["Boston", "Chicago", "Denver", "Seattle", "Austin", "Atlanta", "Portland", "Phoenix"]
+SESSION_TYPES = [("baseline", 5), ("follow-up", 4), ("screening", 2)]
+APP_VERSIONS = [("2.3.1", 1), ("2.4.0", 3), ("2.5.2", 6)]
+
+# Metric keys an assessment may report: (key, kind)
+METRIC_POOL = [
+    ("score", "score"),
+    ("accuracy", "accuracy"),
+    ("rt_mean_ms", "rt"),
+    ("rt_sd_ms", "rt_sd"),
+    ("errors", "count"),
+    ("omissions", "count"),
+    ("trials", "trials"),
+    ("duration_s", "duration"),
+]
+
+
+def _zipf_weights(n: int) -> List[float]:
+    return [1 / (i + 1) for i in range(n)]
+
+
+def _metric_keys(assessment_name: str) -> List[Tuple[str, str]]:
+    """Stable per-assessment subset of METRIC_POOL (same keys every run, every seed)."""
+    rng = random.Random(zlib.crc32(assessment_name.encode("utf-8")))
+    count = rng.randint(2, 6)
+    return [METRIC_POOL[0]] + rng.sample(METRIC_POOL[1:], count - 1)
+
+
+def _metric_value(rng: random.Random, kind: str, ability: float) -> Dict[str, Any]:
+    """Values with plausible distributions, shifted by the patient's latent ability."""
+    if kind == "score":
+        p = 1 / (1 + math.exp(-(0.8 * ability + 0.6)))
+        return {"value_int": sum(rng.random() < p for _ in range(30))}
+    if kind == "accuracy":
+        p = 1 / (1 + math.exp(-(ability + 1.2)))
+        return {"value_float": round(min(1.0, max(0.0, rng.betavariate(p * 20, (1 - p) * 20))), 4)}
+    if kind == "rt":
+        return {"value_float": round(rng.lognormvariate(6.6 - 0.12 * ability, 0.3), 1)}
+    if kind == "rt_sd":
+        return {"value_float": round(rng.lognormvariate(5.2 - 0.1 * ability, 0.35), 1)}
+    if kind == "count":
+        # Poisson-ish, more errors for lower ability
+        lam = max(0.2, 2.5 - ability)
+        return {"value_int": int(rng.expovariate(1 / lam))}
+    if kind == "trials":
+        return {"value_int": rng.choice([20, 24, 30, 40])}
+    return {"value_float": round(rng.gauss(240, 60), 1)}
+
+
+def _weighted(rng: random.Random, choices):
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def _generate_users(task) -> int:
+    seed, shard, start, count, batch_size = task
+    _prepare_worker()
+    rng = random.Random(f"users:{seed}:{shard}")
+    first = _zipf_weights(len(FIRST_NAMES))
+    last = _zipf_weights(len(LAST_NAMES))
+    created = 0
+    for offset in range(0, count, batch_size):
+        n = min(batch_size, count - offset)
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    first_name=rng.choices(FIRST_NAMES, weights=first)[0],
+                    last_name=rng.choices(LAST_NAMES, weights=last)[0],
+                    synthetic=True,
+                )
+                for _ in range(n)
+            ], batch_size=batch_size)
+            # bulk_create sends no signals: log the creates and index the names here
+            changes.record_many(users, batch_size=batch_size)
+            get_backend().index_many("users", [(user.id, (user.first_name, user.last_name)) for user in users])
+        created += n
+    return created
+
+
+def _generate_patients(task) -> Tuple[int, int, int, int]:
+    """Create one shard of patients with their sessions, runs and metrics."""
+    (seed, shard, start, count, batch_size, sessions_mean, completion, years, end,
+     protocols, with_raw, with_summaries) = task
+    _prepare_worker()
+    rng = random.Random(f"patients:{seed}:{shard}")
+    now = end
+    span = datetime.timedelta(days=365 * years)
+    site_weights = _zipf_weights(len(SITES))
+    protocol_weights = _zipf_weights(len(protocols))
+
+    with transaction.atomic():
+        patients = Patient.objects.bulk_create([
+            Patient(external_id=f"{EXTERNAL_ID_PREFIX}{seed}-{start + i:09d}", name=f"Synthetic {start + i}")
+            for i in range(count)
+        ], batch_size=batch_size)
+        get_backend().index_many("patients", [(p.id, (p.external_id, p.name)) for p in patients])
+
+        # Sessions: geometric count per patient, time-ordered, one home site
+        session_objs, session_meta = [], []
+        for patient in patients:
+            ability = rng.gauss(0, 1)
+            site = rng.choices(SITES, weights=site_weights)[0]
+            n_sessions = 1 + int(rng.expovariate(1 / max(sessions_mean - 1, 0.01)))
+            first_at = now - span * rng.random()
+            for k in range(n_sessions):
+                protocol = rng.choices(protocols, weights=protocol_weights)[0]
+                start_time = min(now, first_at + datetime.timedelta(days=rng.uniform(20, 200) * k))
+                session_objs.append(Session(
+                    patient=patient,
+                    protocol_id=protocol["id"],
+                    start_time=start_time,
+                    site=site,
+                    operator=f"op{rng.randint(1, 40):02d}",
+                    session_type=_weighted(rng, SESSION_TYPES) if k else "baseline",
+                    app_version=_weighted(rng, APP_VERSIONS),
+                    exp_version="1.0",
+                ))
+                session_meta.append((ability, protocol))
+        sessions = Session.objects.bulk_create(session_objs, batch_size=batch_size)
+
+        run_count = metric_count = 0
+        runs_buffer: List[AssessmentRun] = []
+        run_values: List[List[Tuple[str, Dict[str, Any]]]] = []
+
+        def flush_runs():
+            nonlocal run_count, metric_count
+            if not runs_buffer:
+                return
+            created = AssessmentRun.objects.bulk_create(runs_buffer, batch_size=batch_size)
+            metric_count += _insert_metrics(
+                (run.id, key, value.get("value_int"), value.get("value_float"), "")
+                for run, values in zip(created, run_values)
+                for key, value in values
+            )
+            run_count += len(created)
+            runs_buffer.clear()
+            run_values.clear()
+
+        # Runs follow the protocol ordering; each step may be where the session stopped
+        for session, (ability, protocol) in zip(sessions, session_meta):
+            at = session.start_time
+            for assessment_id, aname in protocol["assessments"]:
+                if rng.random() > completion:
+                    break
+                at += datetime.timedelta(seconds=rng.randint(60, 600))
+                raw = {}
+                if with_raw:
+                    raw = {
+                        "config": {"assessment": aname, "version": "1.0", "trials": 24, "randomize": True},
+                        "responses": [round(rng.lognormvariate(6.6, 0.3), 1) for _ in range(24)],
+                    }
+                runs_buffer.append(AssessmentRun(
+                    session_id=session.id, assessment_id=assessment_id, event="completed",
+                    start_time=at, raw=raw,
+                ))
+                # Drawn here, not at flush time, so the data does not depend on --batch-size
+                run_values.append([(key, _metric_value(rng, kind, ability)) for key, kind in _metric_keys(aname)])
+                if len(runs_buffer) >= batch_size:
+                    flush_runs()
+        flush_runs()
+
+    if with_summaries:
+        summaries.refresh_sessions(s.id for s in sessions)
+    return len(patients), len(sessions), run_count, metric_count
+
+
+def _insert_metrics(rows) -> int:
+    """INSERT (run_id, key, value_int, value_float, value_text) rows without
+    building Metric instances, which dominated bulk_create's cost here."""
+    rows = list(rows)
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(column) for column in ("run_id", "key", "value_int", "value_float", "value_text"))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote(Metric._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s, %s)", rows,
+        )
+    return len(rows)
+
+
+def _raw_delete(queryset) -> int:
+    """DELETE ... WHERE for the queryset: no collector, cascades or signals."""
+    return queryset._raw_delete(queryset.db)
+
+
+def _prepare_worker():
+    """Fresh DB connections in forked/spawned workers (never share the parent's)."""
+    if multiprocessing.parent_process() is not None:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large deterministic synthetic dataset for benchmarking:\n"
+        "User rows plus MindTrace patients, sessions, runs and metrics linked to the\n"
+        "imported protocols (run import_protocols --apply first). Rows are written with\n"
+        "bulk_create in batches; the same --seed always produces the same data,\n"
+        "independent of --workers and --batch-size. Synthetic patients use external\n"
+        "ids starting with 'SYN-', synthetic users are flagged User.synthetic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=0, help="User rows to create (default: 0)")
+        parser.add_argument("--patients", type=int, default=0, help="Patients to create (default: 0)")
+        parser.add_argument(
+            "--sessions-per-patient",
+            type=float,
+            default=3.0,
+            help="Mean sessions per patient, geometric distribution (default: 3)",
+        )
+        parser.add_argument(
+            "--completion",
+            type=float,
+            default=0.97,
+            help="Probability each next assessment in the protocol is run (default: 0.97)",
+        )
+        parser.add_argument("--years", type=float, default=3.0, help="Spread session dates over this many years (default: 3)")
+        parser.add_argument(
+            "--end-date",
+            default=DEFAULT_END_DATE,
+            help=f"Latest session date, YYYY-MM-DD; fixed so runs are reproducible (default: {DEFAULT_END_DATE})",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk_create (default: 5000)")
+        parser.add_argument(
+            "--shard-size",
+            type=int,
+            default=1000,
+            help="Patients (or 50x users) per unit of work; fixed so output does not depend on --workers (default: 1000)",
+        )
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+        parser.add_argument("--raw", action="store_true", help="Fill AssessmentRun.raw with config/response payloads")
+        parser.add_argument(
+            "--with-summaries",
+            action="store_true",
+            help="Refresh session summaries while generating (otherwise run rebuild_summaries afterwards)",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete previously generated synthetic users and patients first",
+        )
+
+    def handle(self, *args, **options):
+        seed, batch_size = options["seed"], options["batch_size"]
+        shard_size, workers = options["shard_size"], max(1, options["workers"])
+        if batch_size <= 0 or shard_size <= 0:
+            raise CommandError("--batch-size and --shard-size must be positive")
+        end_date = parse_date(options["end_date"] or "")
+        if end_date is None:
+            raise CommandError(f"Invalid --end-date: {options['end_date']!r}")
+        end = timezone.make_aware(datetime.datetime.combine(end_date, datetime.time(18, 0)), datetime.timezone.utc)
+
+        protocols = [
+            {
+                "id": protocol.id,
+                "assessments": list(
+                    protocol.protocol_assessments.order_by("order", "id").values_list("assessment_id", "assessment__name")
+                ),
+            }
+            for protocol in Protocol.objects.order_by("id")
+        ]
+        protocols = [p for p in protocols if p["assessments"]]
+        if options["patients"] and not protocols:
+            raise CommandError("No protocols with assessments found. Run import_protocols --apply first.")
+
+        if workers > 1 and connection.vendor == "sqlite":
+            # One writer at a time: parallel shard transactions just hit "database is locked"
+            self.stderr.write(self.style.WARNING(
+                "SQLite allows a single writer; ignoring --workers. Use PostgreSQL for parallel loads."
+            ))
+            workers = 1
+
+        if options["flush"]:
+            self._flush()
+
+        user_tasks = [
+            (seed, shard, start, min(shard_size * 50, options["users"] - start), batch_size)
+            for shard, start in enumerate(range(0, options["users"], shard_size * 50))
+        ]
+        patient_tasks = [
+            (seed, shard, start, min(shard_size, options["patients"] - start), batch_size,
+             options["sessions_per_patient"], options["completion"], options["years"], end,
+             protocols, options["raw"], options["with_summaries"])
+            for shard, start in enumerate(range(0, options["patients"], shard_size))
+        ]
+
+        started = time.monotonic()
+        totals = {"users": 0, "patients": 0, "sessions": 0, "runs": 0, "metrics": 0}
+        # Signal-driven summary refreshes are per row; bulk loads handle them explicitly
+        with summaries.suppressed():
+            if workers > 1:
+                connections.close_all()
+                with multiprocessing.get_context("fork").Pool(workers) as pool:
+                    users_iter = pool.imap_unordered(_generate_users, user_tasks)
+                    patients_iter = pool.imap_unordered(_generate_patients, patient_tasks)
+                    self._collect(totals, users_iter, patients_iter, started)
+            else:
+                self._collect(totals, map(_generate_users, user_tasks), map(_generate_patients, patient_tasks), started)
+
+        elapsed = time.monotonic() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s): {totals}"
+        ))
+        if totals["sessions"] and not options["with_summaries"]:
+            self.stdout.write("Run `manage.py rebuild_summaries` to materialize session summaries.")
+
+    def _flush(self):
+        """Delete synthetic rows with plain DELETE statements, children first.
+        The ORM's delete() would collect every row and send per-row signals;
+        what those handlers do (blob references, search index, change log,
+        cache) is done here in bulk instead."""
+        started = time.monotonic()
+        patients = Patient.objects.filter(external_id__startswith=EXTERNAL_ID_PREFIX)
+        sessions = Session.objects.filter(patient__in=patients)
+        with summaries.suppressed(), rawstore.deferred():
+            # Archived sessions also own a segment file: keep the signal path for them
+            sessions.filter(archive_segment__isnull=False).delete()
+
+        deleted = 0
+        with transaction.atomic():
+            runs = AssessmentRun.objects.filter(session__in=sessions)
+            manifests = [manifest for manifest in runs.values_list("raw_manifest", flat=True) if manifest]
+            patient_ids = list(patients.values_list("id", flat=True))
+            for queryset in (
+                Metric.objects.filter(run__in=runs),
+                runs,
+                SessionSummary.objects.filter(patient__in=patients),
+                PatientProtocolSummary.objects.filter(patient__in=patients),
+                sessions,
+                patients,
+            ):
+                deleted += _raw_delete(queryset)
+            rawstore.release(manifests)
+            get_backend().remove_many("patients", patient_ids)
+
+        with transaction.atomic():
+            users = list(User.objects.filter(synthetic=True).only("id"))
+            # Tombstones for the changes feed, as the delete signal would log them
+            changes.record_many(users, UserChange.ACTION_DELETE)
+            user_count = _raw_delete(User.objects.filter(synthetic=True))
+            get_backend().remove_many("users", [user.id for user in users])
+        cache.invalidate_users(user.id for user in users)
+        self.stdout.write(
+            f"Flushed {deleted} rows of synthetic patients and {user_count} synthetic users "
+            f"({time.monotonic() - started:.1f}s)"
+        )
+
+    def _collect(self, totals, users_iter, patients_iter, started):
+        for created in users_iter:
+            totals["users"] += created
+        for patients, sessions, runs, metrics in patients_iter:
+            totals["patients"] += patients
+            totals["sessions"] += sessions
+            totals["runs"] += runs
+            totals["metrics"] += metrics
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"  {totals['patients']} patients, {totals['sessions']} sessions, "
+                f"{totals['runs']} runs, {totals['metrics']} metrics ({elapsed:.1f}s)"
+            )
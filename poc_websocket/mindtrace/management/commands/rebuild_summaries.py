@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mindtrace import summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute SessionSummary and PatientProtocolSummary rows from AssessmentRun/Metric.\n"
+        "Use after bulk loads that bypass signals, or to backfill existing data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--session",
+            action="append",
+            type=int,
+            dest="sessions",
+            help="Only rebuild the given session id (repeatable)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Sessions refreshed per transaction (default: 500)",
+        )
+        parser.add_argument(
+            "--verbose",
+            action="store_true",
+            help="Verbose output",
+        )
+
+    def handle(self, *args, **options):
+        verbose = options.get("verbose", False)
+        started = time.monotonic()
+
+        def progress(done):
+            if verbose:
+                self.stdout.write(f"  {done} session(s) refreshed")
+
+        done = summaries.rebuild(
+            session_ids=options.get("sessions"),
+            chunk_size=options["chunk_size"],
+            progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Done. Rebuilt {done} session summaries in {elapsed:.1f}s"))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mindtrace import rawstore
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute RawBlob reference counts from AssessmentRun.raw_manifest and the\n"
+        "archive segments, and delete blobs nothing references (needed after runs\n"
+        "were removed without signals, e.g. raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Only print blob counts and sizes",
+        )
+
+    def handle(self, *args, **options):
+        if not options["stats"]:
+            started = time.monotonic()
+            result = rawstore.recount()
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"Done. {result['blobs']} blob(s) kept, {result['deleted']} deleted, "
+                f"{result['corrected']} count(s) corrected in {elapsed:.1f}s"
+            ))
+            if result["missing"]:
+                self.stdout.write(self.style.WARNING(f"{result['missing']} referenced blob(s) are missing"))
+
+        stats = rawstore.stats()
+        self.stdout.write(
+            f"{stats['blobs']} blob(s), {stats['references'] or 0} reference(s), "
+            f"{stats['size'] or 0} bytes of JSON stored as {stats['stored_bytes']} bytes"
+        )
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mindtrace import norms
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the percentile tables (NormTable) from Metric.\n"
+        "Incremental by default (metrics above the tables' watermark); --full\n"
+        "rebuilds after edits/deletes or a change to MINDTRACE_NORM_STRATA."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild every table from scratch",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Metric rows fetched per query (default: 5000)",
+        )
+        parser.add_argument(
+            "--verbose",
+            action="store_true",
+            help="Verbose output",
+        )
+
+    def handle(self, *args, **options):
+        verbose = options.get("verbose", False)
+        started = time.monotonic()
+
+        def progress(scanned):
+            if verbose:
+                self.stdout.write(f"  {scanned} metric(s) read")
+
+        stats = norms.refresh(full=options["full"], chunk_size=options["chunk_size"], progress=progress)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Merged {stats['metrics']} metrics into {stats['tables']} table(s) in {elapsed:.1f}s"
+        ))
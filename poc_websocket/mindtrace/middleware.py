@@ -0,0 +1,46 @@
+"""
+Request-scoped batching of summary refreshes.
+
+Outside a transaction every run or metric save refreshes its session's
+summary straight away (see mindtrace.summaries), so a request saving twenty
+metrics recomputed the same session twenty times. SummaryBatchMiddleware
+wraps requests with an unsafe method in summaries.deferred(), so each
+session a request touches is refreshed once when the response is ready.
+Safe methods do not write and pass straight through.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from poc_project.db_router import SAFE_METHODS
+
+from . import summaries
+
+
+class SummaryBatchMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method in SAFE_METHODS:
+            return self.get_response(request)
+        with summaries.deferred():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method in SAFE_METHODS:
+            return await self.get_response(request)
+        # The batch is thread-local: open and flush it on the thread the
+        # request's ORM calls run on (thread-sensitive, one per request)
+        batch = summaries.deferred()
+        await sync_to_async(batch.__enter__)()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(batch.__exit__)(None, None, None)
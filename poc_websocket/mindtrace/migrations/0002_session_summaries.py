@@ -0,0 +1,54 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionSummary',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='mindtrace.session')),
+                ('start_time', models.DateTimeField()),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('metric_count', models.PositiveIntegerField(default=0)),
+                ('expected_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('completed_assessment_ids', models.JSONField(blank=True, default=list)),
+                ('key_scores', models.JSONField(blank=True, default=dict)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('next_assessment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mindtrace.assessment')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_summaries', to='mindtrace.patient')),
+                ('protocol', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='session_summaries', to='mindtrace.protocol')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'protocol'], name='mindtrace_s_patient_04e1f2_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PatientProtocolSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('completed_session_count', models.PositiveIntegerField(default=0)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('first_session_at', models.DateTimeField(blank=True, null=True)),
+                ('last_session_at', models.DateTimeField(blank=True, null=True)),
+                ('latest_key_scores', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('latest_session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='mindtrace.session')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='protocol_summaries', to='mindtrace.patient')),
+                ('protocol', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='patient_summaries', to='mindtrace.protocol')),
+            ],
+            options={
+                'unique_together': {('patient', 'protocol')},
+            },
+        ),
+    ]
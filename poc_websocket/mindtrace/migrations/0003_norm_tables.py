@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0002_session_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NormTable',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200)),
+                ('stratum_type', models.CharField(choices=[('all', 'All sessions'), ('site', 'Site'), ('protocol', 'Protocol')], default='all', max_length=20)),
+                ('stratum', models.CharField(blank=True, max_length=200)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('values', models.BinaryField()),
+                ('last_metric_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='norm_tables', to='mindtrace.assessment')),
+            ],
+            options={
+                'unique_together': {('assessment', 'key', 'stratum_type', 'stratum')},
+            },
+        ),
+    ]
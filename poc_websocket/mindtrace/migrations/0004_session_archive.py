@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0003_norm_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('metric_count', models.PositiveIntegerField(default=0)),
+                ('min_start_time', models.DateTimeField(blank=True, null=True)),
+                ('max_start_time', models.DateTimeField(blank=True, null=True)),
+                ('size_bytes', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='archive_segment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sessions', to='mindtrace.archivesegment'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+import collections
+import hashlib
+import json
+import zlib
+
+from django.db import migrations, models
+from django.db.models import F
+
+# Kept in step with mindtrace.rawstore (encode/split)
+COMPRESS_LEVEL = 6
+BATCH = 500
+
+
+def _encode(value):
+    text = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+    return hashlib.sha256(text).hexdigest(), zlib.compress(text, COMPRESS_LEVEL), len(text)
+
+
+def _split(raw):
+    if isinstance(raw, dict):
+        manifest, blobs = {}, {}
+        for key, value in raw.items():
+            digest, data, size = _encode(value)
+            manifest[key] = digest
+            blobs[digest] = (data, size)
+        return manifest, blobs
+    digest, data, size = _encode(raw)
+    return [digest], {digest: (data, size)}
+
+
+def move_raw_to_blobs(apps, schema_editor):
+    AssessmentRun = apps.get_model('mindtrace', 'AssessmentRun')
+    RawBlob = apps.get_model('mindtrace', 'RawBlob')
+
+    last_id = 0
+    while True:
+        runs = list(
+            AssessmentRun.objects.filter(id__gt=last_id).exclude(raw={})
+            .order_by('id').only('id', 'raw')[:BATCH]
+        )
+        if not runs:
+            break
+        blobs, counts = {}, collections.Counter()
+        for run in runs:
+            manifest, run_blobs = _split(run.raw)
+            blobs.update(run_blobs)
+            counts.update(manifest.values() if isinstance(manifest, dict) else manifest)
+            run.raw_manifest = manifest
+        RawBlob.objects.bulk_create(
+            [RawBlob(digest=digest, data=data, size=size, refcount=0) for digest, (data, size) in blobs.items()],
+            ignore_conflicts=True,
+        )
+        by_count = collections.defaultdict(list)
+        for digest, count in counts.items():
+            by_count[count].append(digest)
+        for count, digests in by_count.items():
+            RawBlob.objects.filter(digest__in=digests).update(refcount=F('refcount') + count)
+        AssessmentRun.objects.bulk_update(runs, ['raw_manifest'])
+        last_id = runs[-1].id
+
+
+def restore_raw(apps, schema_editor):
+    AssessmentRun = apps.get_model('mindtrace', 'AssessmentRun')
+    RawBlob = apps.get_model('mindtrace', 'RawBlob')
+
+    last_id = 0
+    while True:
+        runs = list(
+            AssessmentRun.objects.filter(id__gt=last_id).exclude(raw_manifest={})
+            .order_by('id').only('id', 'raw_manifest')[:BATCH]
+        )
+        if not runs:
+            break
+        digests = set()
+        for run in runs:
+            digests.update(run.raw_manifest.values() if isinstance(run.raw_manifest, dict) else run.raw_manifest)
+        values = {
+            digest: json.loads(zlib.decompress(bytes(data)))
+            for digest, data in RawBlob.objects.filter(digest__in=digests).values_list('digest', 'data')
+        }
+        for run in runs:
+            manifest = run.raw_manifest
+            if isinstance(manifest, dict):
+                run.raw = {key: values[digest] for key, digest in manifest.items()}
+            else:
+                run.raw = values[manifest[0]]
+        AssessmentRun.objects.bulk_update(runs, ['raw'])
+        last_id = runs[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0004_session_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='assessmentrun',
+            name='raw_manifest',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(move_raw_to_blobs, restore_raw),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0005_raw_blobs'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='assessmentrun',
+            name='raw',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.9 on 2026-10-19 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mindtrace', '0006_remove_assessmentrun_raw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NormGap',
+            fields=[
+                ('metric_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('noticed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
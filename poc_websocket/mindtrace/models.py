@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 
 class Patient(models.Model):
@@ -79,6 +79,23 @@ class AssessmentAlias(models.Model):
         return f"{self.term} -> {self.assessment.name}"
 
 
+class ArchiveSegment(models.Model):
+    """A compressed columnar file holding the runs and metrics of archived
+    sessions. Written and read by mindtrace.archive."""
+    path = models.CharField(max_length=255, unique=True)
+    session_count = models.PositiveIntegerField(default=0)
+    run_count = models.PositiveIntegerField(default=0)
+    metric_count = models.PositiveIntegerField(default=0)
+    min_start_time = models.DateTimeField(null=True, blank=True)
+    max_start_time = models.DateTimeField(null=True, blank=True)
+    size_bytes = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive {self.path} ({self.session_count} sessions)"
+
+
 class Session(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='sessions')
     protocol = models.ForeignKey(Protocol, on_delete=models.SET_NULL, null=True, blank=True, related_name='sessions')
@@ -90,18 +107,115 @@ class Session(models.Model):
     exp_version = models.CharField(max_length=50, blank=True)
     notes = models.TextField(blank=True)
     frontmatter = models.JSONField(default=dict, blank=True)
+    # Set once the session's runs and metrics have moved to an archive file
+    archive_segment = models.ForeignKey(ArchiveSegment, on_delete=models.PROTECT, null=True, blank=True, related_name='sessions')
+
+    @property
+    def is_archived(self):
+        return self.archive_segment_id is not None
 
     def __str__(self):
         return f"Session {self.id} - {self.patient} @ {self.start_time}"
 
 
+class RawBlob(models.Model):
+    """One deduplicated value of AssessmentRun raw payloads, keyed by the
+    sha256 of its canonical JSON. Maintained by mindtrace.rawstore."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    # zlib-compressed canonical JSON
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.digest[:12]} ({self.size} bytes, {self.refcount} refs)"
+
+
+class AssessmentRunQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import rawstore
+
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            rawstore.store_pending(objs)
+            created = super().bulk_create(objs, *args, **kwargs)
+        for run in objs:
+            run._raw_stored_manifest = run.raw_manifest
+            run._raw_pending = False
+        return created
+
+
 class AssessmentRun(models.Model):
     session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='assessment_runs')
     assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name='runs')
     event = models.CharField(max_length=200, blank=True)
     start_time = models.DateTimeField(null=True, blank=True)
     pagelink = models.TextField(blank=True)
-    raw = models.JSONField(default=dict, blank=True)
+    # Top-level key of the raw payload -> RawBlob digest (see the raw property)
+    raw_manifest = models.JSONField(default=dict, blank=True)
+
+    objects = AssessmentRunQuerySet.as_manager()
+
+    def __init__(self, *args, **kwargs):
+        self._raw = None
+        self._raw_loaded = False
+        self._raw_pending = False
+        self._raw_stored_manifest = None
+        super().__init__(*args, **kwargs)
+        if not self._raw_pending:
+            # __dict__: a deferred manifest must not trigger a query here
+            self._raw_stored_manifest = self.__dict__.get('raw_manifest')
+
+    @property
+    def raw(self):
+        """The full raw payload, loaded from RawBlob on first access."""
+        if not self._raw_loaded:
+            from . import rawstore
+
+            self._set_loaded_raw(rawstore.raw_for(self.raw_manifest))
+        return self._raw
+
+    @raw.setter
+    def raw(self, value):
+        self._raw = value
+        self._raw_loaded = True
+        self._raw_pending = True
+
+    def refresh_from_db(self, using=None, fields=None):
+        """Reloading the manifest also drops the payload loaded or assigned
+        for the old one; 'raw' in fields stands for raw_manifest."""
+        # Django loads a deferred field through refresh_from_db(); keep a
+        # payload assigned before that
+        deferred = 'raw_manifest' not in self.__dict__
+        if fields is not None:
+            fields = ['raw_manifest' if f == 'raw' else f for f in fields]
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'raw_manifest' in fields:
+            self._raw_stored_manifest = self.raw_manifest
+            if not (deferred and self._raw_pending):
+                self._raw = None
+                self._raw_loaded = False
+                self._raw_pending = False
+
+    def _set_loaded_raw(self, value):
+        self._raw = value
+        self._raw_loaded = True
+
+    def save(self, *args, **kwargs):
+        if not self._raw_pending:
+            return super().save(*args, **kwargs)
+        from . import rawstore
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = ['raw_manifest' if f == 'raw' else f for f in update_fields]
+        with transaction.atomic():
+            replaced = rawstore.store_pending([self])
+            super().save(*args, **kwargs)
+            rawstore.release(replaced)
+        self._raw_stored_manifest = self.raw_manifest
+        self._raw_pending = False
 
     def __str__(self):
         return f"Run {self.id} - {self.assessment.name} ({self.session_id})"
@@ -122,3 +236,95 @@ class Metric(models.Model):
 
     def __str__(self):
         return f"{self.key}={self.value_int or self.value_float or self.value_text}"
+
+
+class SessionSummary(models.Model):
+    """Materialized per-session progress, maintained by mindtrace.summaries."""
+    session = models.OneToOneField(Session, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='session_summaries')
+    protocol = models.ForeignKey(Protocol, on_delete=models.SET_NULL, null=True, blank=True, related_name='session_summaries')
+    start_time = models.DateTimeField()
+    run_count = models.PositiveIntegerField(default=0)
+    metric_count = models.PositiveIntegerField(default=0)
+    expected_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    completed_assessment_ids = models.JSONField(default=list, blank=True)
+    next_assessment = models.ForeignKey(Assessment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    key_scores = models.JSONField(default=dict, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'protocol']),
+        ]
+
+    @property
+    def is_complete(self):
+        return self.expected_count > 0 and self.completed_count >= self.expected_count
+
+    def __str__(self):
+        return f"Summary(session={self.session_id}, {self.completed_count}/{self.expected_count})"
+
+
+class PatientProtocolSummary(models.Model):
+    """Materialized per patient/protocol roll-up of SessionSummary rows."""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='protocol_summaries')
+    protocol = models.ForeignKey(Protocol, on_delete=models.CASCADE, null=True, blank=True, related_name='patient_summaries')
+    session_count = models.PositiveIntegerField(default=0)
+    completed_session_count = models.PositiveIntegerField(default=0)
+    run_count = models.PositiveIntegerField(default=0)
+    first_session_at = models.DateTimeField(null=True, blank=True)
+    last_session_at = models.DateTimeField(null=True, blank=True)
+    latest_session = models.ForeignKey(Session, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latest_key_scores = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('patient', 'protocol')
+
+    def __str__(self):
+        return f"Summary({self.patient} / {self.protocol or '-'})"
+
+
+class NormTable(models.Model):
+    """Sorted population values of one metric key, for percentile lookups.
+    Maintained by mindtrace.norms."""
+    STRATUM_ALL = 'all'
+    STRATUM_SITE = 'site'
+    STRATUM_PROTOCOL = 'protocol'
+    STRATUM_CHOICES = [
+        (STRATUM_ALL, 'All sessions'),
+        (STRATUM_SITE, 'Site'),
+        (STRATUM_PROTOCOL, 'Protocol'),
+    ]
+
+    assessment = models.ForeignKey(Assessment, on_delete=models.CASCADE, related_name='norm_tables')
+    key = models.CharField(max_length=200)
+    stratum_type = models.CharField(max_length=20, choices=STRATUM_CHOICES, default=STRATUM_ALL)
+    # Site name or protocol id; empty for STRATUM_ALL
+    stratum = models.CharField(max_length=200, blank=True)
+    count = models.PositiveIntegerField(default=0)
+    # Ascending little-endian float64 values
+    values = models.BinaryField()
+    # Every Metric with id <= last_metric_id is included
+    last_metric_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('assessment', 'key', 'stratum_type', 'stratum')
+
+    def __str__(self):
+        stratum = f" [{self.stratum_type}={self.stratum}]" if self.stratum else ''
+        return f"Norms({self.assessment_id}/{self.key}{stratum}, n={self.count})"
+
+
+class NormGap(models.Model):
+    """A metric id below the norm tables' watermark that was missing when they
+    were refreshed (not committed yet, or rolled back). Maintained by
+    mindtrace.norms, which merges it once it appears or drops it on expiry."""
+    metric_id = models.BigIntegerField(primary_key=True)
+    noticed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"NormGap({self.metric_id})"
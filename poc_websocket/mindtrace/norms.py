@@ -0,0 +1,403 @@
+"""
+Normative percentile tables.
+
+NormTable keeps the sorted numeric values of one metric key per assessment
+and stratum (all sessions, per site, per protocol) as a packed float64
+blob, so placing a value in its population is a binary search (O(log n))
+instead of a scan over comparable Metric rows.
+
+Tables are refreshed incrementally: refresh() reads only metrics above the
+tables' last_metric_id watermark and merges them into the affected tables.
+Signals (mindtrace.signals) queue a debounced `refresh_norms` job when runs
+or metrics are saved; the refresh_norms command or `refresh(full=True)`
+rebuilds from scratch, streaming one (assessment, key) population at a
+time, then merging in the metrics of archived sessions read from their
+segments. The incremental path assumes metrics are append-only: edits,
+deletes and sessions moving site/protocol only show up after a full
+rebuild. Archiving deletes hot metrics without touching the tables.
+
+Ids are assigned at insert, so a metric whose transaction commits after a
+refresh can sit below the new watermark. Missing ids in the top
+MINDTRACE_NORM_GAP_WINDOW ids below it are stored as NormGap rows and
+looked up again by each refresh until they appear (and are merged) or are
+older than MINDTRACE_NORM_GAP_SECONDS (rolled back or deleted).
+
+Settings:
+    MINDTRACE_NORM_STRATA         stratum types to build (default: all, site, protocol)
+    MINDTRACE_NORM_MIN_COUNT      smallest population a percentile is reported for (default 20)
+    MINDTRACE_NORM_REFRESH_DELAY  seconds new metrics are batched before the refresh
+                                  job runs; None disables scheduling (default 60)
+    MINDTRACE_NORM_GAP_WINDOW     ids below the watermark checked for late commits (default 10000)
+    MINDTRACE_NORM_GAP_SECONDS    how long a missing id is looked up again (default 600)
+"""
+
+import array
+import bisect
+import collections
+import datetime
+import itertools
+import math
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import archive
+from .models import Metric, NormGap, NormTable
+
+CACHE_TABLES = 512
+# Archived metrics a rebuild reads before merging them into the tables
+ARCHIVE_MERGE_METRICS = 1_000_000
+
+# (assessment_id, key, stratum_type, stratum)
+Bucket = Tuple[int, str, str, str]
+
+
+def _strata() -> Tuple[str, ...]:
+    return tuple(getattr(settings, 'MINDTRACE_NORM_STRATA', (
+        NormTable.STRATUM_ALL, NormTable.STRATUM_SITE, NormTable.STRATUM_PROTOCOL,
+    )))
+
+
+def _min_count() -> int:
+    return getattr(settings, 'MINDTRACE_NORM_MIN_COUNT', 20)
+
+
+def session_strata(site: str, protocol_id: Optional[int]) -> List[Tuple[str, str]]:
+    """(stratum_type, stratum) pairs a session's metrics belong to."""
+    strata = []
+    for stratum_type in _strata():
+        if stratum_type == NormTable.STRATUM_ALL:
+            strata.append((stratum_type, ''))
+        elif stratum_type == NormTable.STRATUM_SITE and site:
+            strata.append((stratum_type, site))
+        elif stratum_type == NormTable.STRATUM_PROTOCOL and protocol_id is not None:
+            strata.append((stratum_type, str(protocol_id)))
+    return strata
+
+
+def numeric_value(value_int, value_float) -> Optional[float]:
+    value = value_float if value_float is not None else value_int
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+# ---- packing ----
+
+def pack(values: Iterable[float]) -> bytes:
+    packed = array.array('d', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(blob) -> array.array:
+    values = array.array('d')
+    values.frombytes(bytes(blob))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def percentile_rank(values, value: float) -> Optional[float]:
+    """Mid-rank percentile (0-100) of value within the sorted values."""
+    n = len(values)
+    if not n:
+        return None
+    below = bisect.bisect_left(values, value)
+    at_or_below = bisect.bisect_right(values, value, lo=below)
+    return round(100.0 * (below + at_or_below) / 2 / n, 1)
+
+
+# ---- refresh ----
+
+METRIC_FIELDS = ('id', 'run__assessment_id', 'key', 'value_int', 'value_float',
+                 'run__session__site', 'run__session__protocol_id')
+# Metric ids per IN (...) query (SQLite variable limit)
+GAP_CHUNK = 900
+
+
+def _gap_window() -> int:
+    return getattr(settings, 'MINDTRACE_NORM_GAP_WINDOW', 10000)
+
+
+def _gap_expiry() -> float:
+    return getattr(settings, 'MINDTRACE_NORM_GAP_SECONDS', 600)
+
+
+def _add_value(new_values, assessment_id, key, value_int, value_float, site, protocol_id) -> None:
+    value = numeric_value(value_int, value_float)
+    if value is None:
+        return
+    for stratum_type, stratum in session_strata(site, protocol_id):
+        new_values[(assessment_id, key, stratum_type, stratum)].append(value)
+
+
+def _gaps(ranges, high) -> List[int]:
+    """Missing ids from (first, last) ranges, limited to the top gap window below high."""
+    floor = high - _gap_window()
+    return [
+        metric_id
+        for first, last in ranges if last > floor
+        for metric_id in range(max(first, floor + 1), last + 1)
+    ]
+
+
+def _save_gaps(gap_ids: List[int], found: Iterable[int] = ()) -> None:
+    """Record new gaps, drop the ones that turned up and the expired ones."""
+    found = list(found)
+    for start in range(0, len(found), GAP_CHUNK):
+        NormGap.objects.filter(metric_id__in=found[start:start + GAP_CHUNK]).delete()
+    NormGap.objects.filter(noticed_at__lt=timezone.now() - datetime.timedelta(seconds=_gap_expiry())).delete()
+    NormGap.objects.bulk_create([NormGap(metric_id=metric_id) for metric_id in gap_ids],
+                                batch_size=GAP_CHUNK, ignore_conflicts=True)
+
+
+def refresh(full: bool = False, chunk_size: int = 5000, progress=None) -> Dict[str, int]:
+    """Merge metrics above the watermark, and earlier gaps that have committed
+    since, into the tables (rebuild every table with full)."""
+    watermark = None if full else NormTable.objects.aggregate(w=Min('last_metric_id'))['w']
+    if watermark is None:
+        # Full rebuild, or no tables yet
+        return rebuild(chunk_size, progress)
+
+    new_values: Dict[Bucket, array.array] = collections.defaultdict(lambda: array.array('d'))
+    scanned = 0
+
+    # Ids an earlier refresh skipped because their transaction had not committed
+    gap_ids = list(NormGap.objects.order_by('metric_id').values_list('metric_id', flat=True))
+    found = []
+    for start in range(0, len(gap_ids), GAP_CHUNK):
+        rows = Metric.objects.filter(id__in=gap_ids[start:start + GAP_CHUNK]).values_list(*METRIC_FIELDS)
+        for metric_id, *fields in rows:
+            found.append(metric_id)
+            _add_value(new_values, *fields)
+    scanned += len(found)
+
+    # Rows are read in id order; holes between consecutive ids are the gaps
+    high, ranges = watermark, []
+    rows = Metric.objects.filter(id__gt=watermark).order_by('id').values_list(*METRIC_FIELDS)
+    for metric_id, *fields in rows.iterator(chunk_size=chunk_size):
+        if metric_id > high + 1:
+            ranges.append((high + 1, metric_id - 1))
+        high = metric_id
+        scanned += 1
+        _add_value(new_values, *fields)
+        if progress and scanned % chunk_size == 0:
+            progress(scanned)
+
+    with transaction.atomic():
+        _save_gaps(_gaps(ranges, high), found)
+        if not new_values and high == watermark:
+            return {'metrics': scanned, 'tables': 0}
+        _merge(new_values, high)
+        # Tables without new values are current up to the same watermark
+        NormTable.objects.filter(last_metric_id__lt=high).update(last_metric_id=high)
+
+    if progress:
+        progress(scanned)
+    return {'metrics': scanned, 'tables': len(new_values)}
+
+
+def _merge(new_values: Dict[Bucket, array.array], high: int) -> None:
+    """Merge values into their tables, creating the missing ones."""
+    assessment_ids = {bucket[0] for bucket in new_values}
+    keys = {bucket[1] for bucket in new_values}
+    existing = {
+        (t.assessment_id, t.key, t.stratum_type, t.stratum): t
+        for t in NormTable.objects.filter(assessment_id__in=assessment_ids, key__in=keys)
+    }
+    for bucket, values in new_values.items():
+        table = existing.get(bucket)
+        if table is None:
+            assessment_id, key, stratum_type, stratum = bucket
+            table = NormTable(assessment_id=assessment_id, key=key, stratum_type=stratum_type, stratum=stratum)
+            merged = sorted(values)
+        else:
+            # Timsort merges the two sorted runs in linear time
+            merged = sorted(itertools.chain(unpack(table.values), values))
+        table.values = pack(merged)
+        table.count = len(merged)
+        table.last_metric_id = high
+        table.save()
+
+
+def rebuild(chunk_size: int = 5000, progress=None) -> Dict[str, int]:
+    """Recompute every table. Hot metrics are streamed one key at a time,
+    ordered by assessment, so only one (assessment, key) population is in
+    memory; archived metrics (mindtrace.archive) are then read segment by
+    segment and merged in every ARCHIVE_MERGE_METRICS metrics."""
+    high = Metric.objects.aggregate(high=Max('id'))['high'] or 0
+    keys = sorted(Metric.objects.filter(id__lte=high).order_by().values_list('key', flat=True).distinct())
+    floor = high - _gap_window()
+    seen = set()
+    scanned = 0
+
+    with transaction.atomic():
+        NormTable.objects.all().delete()
+        for key in keys:
+            rows = (
+                Metric.objects.filter(key=key, id__lte=high)
+                .order_by('run__assessment_id')
+                .values_list(*METRIC_FIELDS)
+            )
+            groups = itertools.groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row[1])
+            for assessment_id, group in groups:
+                new_values: Dict[Bucket, array.array] = collections.defaultdict(lambda: array.array('d'))
+                for metric_id, *fields in group:
+                    if metric_id > floor:
+                        seen.add(metric_id)
+                    scanned += 1
+                    _add_value(new_values, *fields)
+                    if progress and scanned % chunk_size == 0:
+                        progress(scanned)
+                NormTable.objects.bulk_create([
+                    NormTable(
+                        assessment_id=bucket[0], key=bucket[1], stratum_type=bucket[2], stratum=bucket[3],
+                        values=pack(sorted(values)), count=len(values), last_metric_id=high,
+                    )
+                    for bucket, values in new_values.items()
+                ])
+
+        pending: Dict[Bucket, array.array] = collections.defaultdict(lambda: array.array('d'))
+        for count, (metric_id, *fields) in enumerate(archive.metric_rows(), start=1):
+            if metric_id > floor:
+                seen.add(metric_id)
+            scanned += 1
+            _add_value(pending, *fields)
+            if count % ARCHIVE_MERGE_METRICS == 0:
+                _merge(pending, high)
+                pending.clear()
+            if progress and scanned % chunk_size == 0:
+                progress(scanned)
+        _merge(pending, high)
+        tables = NormTable.objects.count()
+        NormGap.objects.all().delete()
+        _save_gaps([metric_id for metric_id in range(max(floor, 0) + 1, high + 1) if metric_id not in seen])
+
+    if progress:
+        progress(scanned)
+    return {'metrics': scanned, 'tables': tables}
+
+
+_schedule_lock = threading.Lock()
+_last_scheduled = 0.0
+
+
+def schedule_refresh() -> None:
+    """Queue a delayed incremental refresh job after the current transaction
+    commits, at most once per MINDTRACE_NORM_REFRESH_DELAY per process."""
+    if getattr(settings, 'MINDTRACE_NORM_REFRESH_DELAY', 60) is None:
+        return
+    transaction.on_commit(_enqueue_refresh)
+
+
+def _enqueue_refresh():
+    global _last_scheduled
+    delay = getattr(settings, 'MINDTRACE_NORM_REFRESH_DELAY', 60)
+    with _schedule_lock:
+        now = time.monotonic()
+        if _last_scheduled and now - _last_scheduled < delay:
+            return
+        _last_scheduled = now
+
+    from jobs.models import Job
+    from jobs.queue import enqueue
+
+    if Job.objects.filter(task='refresh_norms', status=Job.STATUS_QUEUED).exists():
+        return
+    enqueue('refresh_norms', run_after=timezone.now() + datetime.timedelta(seconds=delay))
+
+
+# ---- lookup ----
+
+_cache: 'collections.OrderedDict[Tuple[int, Any], array.array]' = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+TABLE_META_FIELDS = ('id', 'assessment_id', 'key', 'stratum_type', 'stratum', 'count', 'updated_at')
+
+
+def _cache_get(cache_key):
+    with _cache_lock:
+        values = _cache.get(cache_key)
+        if values is not None:
+            _cache.move_to_end(cache_key)
+        return values
+
+
+def _cache_put(cache_key, values):
+    with _cache_lock:
+        _cache[cache_key] = values
+        while len(_cache) > CACHE_TABLES:
+            _cache.popitem(last=False)
+
+
+def _meta_queryset(assessment_ids, site, protocol_id):
+    strata = Q()
+    for stratum_type, stratum in session_strata(site, protocol_id):
+        strata |= Q(stratum_type=stratum_type, stratum=stratum)
+    return (
+        NormTable.objects.filter(assessment_id__in=list(assessment_ids), count__gte=_min_count())
+        .filter(strata)
+        .values(*TABLE_META_FIELDS)
+    )
+
+
+def _index(meta_rows, blobs) -> Dict[Bucket, array.array]:
+    index = {}
+    for row in meta_rows:
+        cache_key = (row['id'], row['updated_at'])
+        values = _cache_get(cache_key)
+        if values is None:
+            values = unpack(blobs[row['id']])
+            _cache_put(cache_key, values)
+        index[(row['assessment_id'], row['key'], row['stratum_type'], row['stratum'])] = values
+    return index
+
+
+def _missing(meta_rows) -> List[int]:
+    return [row['id'] for row in meta_rows if _cache_get((row['id'], row['updated_at'])) is None]
+
+
+def load_tables(assessment_ids: Iterable[int], site: str, protocol_id: Optional[int]) -> Dict[Bucket, array.array]:
+    """Tables for a session's assessments and strata. Only metadata is queried
+    when the tables are cached in this process."""
+    meta_rows = list(_meta_queryset(assessment_ids, site, protocol_id))
+    missing = _missing(meta_rows)
+    blobs = dict(NormTable.objects.filter(id__in=missing).values_list('id', 'values')) if missing else {}
+    return _index(meta_rows, blobs)
+
+
+async def aload_tables(assessment_ids: Iterable[int], site: str, protocol_id: Optional[int]) -> Dict[Bucket, array.array]:
+    meta_rows = [row async for row in _meta_queryset(assessment_ids, site, protocol_id)]
+    missing = _missing(meta_rows)
+    blobs = {}
+    if missing:
+        blobs = {pk: blob async for pk, blob in NormTable.objects.filter(id__in=missing).values_list('id', 'values')}
+    return _index(meta_rows, blobs)
+
+
+def percentiles(tables: Dict[Bucket, array.array], assessment_id: int, key: str, value,
+                site: str, protocol_id: Optional[int]) -> Dict[str, float]:
+    """{stratum_type: percentile} for one metric value."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return {}
+    ranks = {}
+    for stratum_type, stratum in session_strata(site, protocol_id):
+        values = tables.get((assessment_id, key, stratum_type, stratum))
+        if values is not None:
+            ranks[stratum_type] = percentile_rank(values, float(value))
+    return ranks
+
+
+def lookup(assessment_id: int, key: str, value: float, site: str = '', protocol_id: Optional[int] = None) -> Dict[str, float]:
+    """Percentile ranks of a single value, e.g. for a run not stored yet."""
+    tables = load_tables([assessment_id], site, protocol_id)
+    return percentiles(tables, assessment_id, key, value, site, protocol_id)
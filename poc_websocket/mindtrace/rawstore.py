@@ -0,0 +1,242 @@
+"""
+Content-addressed storage for AssessmentRun.raw payloads.
+
+A run stores only raw_manifest, mapping each top-level key of its raw
+payload to the sha256 digest of that value's canonical JSON; the values
+live once each in RawBlob, zlib-compressed and reference counted. Identical
+substructures (stimulus lists, config blocks) shared by many runs are
+stored once, and loading runs no longer pulls the payloads along:
+AssessmentRun.raw assembles the payload on first access, load_raw() does it
+for many runs in one query.
+
+Writing: assigning run.raw (or AssessmentRun(raw=...)) marks the payload
+pending; save() and AssessmentRun.objects.bulk_create() store it and take
+references, replacing a payload or deleting a run releases them (blobs at
+zero references are deleted) in the same transaction, so a rollback keeps
+them; wrap bulk deletes in deferred() to release once at the end instead of
+per run. Archived runs keep their references: the
+segment files (mindtrace.archive) hold the manifests, not the payloads.
+Rows removed without signals (raw SQL) leave counts too high; recount()
+rebuilds them from the hot runs and the archive.
+"""
+
+import collections
+import hashlib
+import json
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import AssessmentRun, RawBlob
+
+COMPRESS_LEVEL = 6
+# Digests per IN (...) query (SQLite variable limit)
+CHUNK = 900
+# Rows per acquire() upsert, five parameters each
+UPSERT_CHUNK = CHUNK // 5
+
+_state = threading.local()
+
+
+def encode(value: Any) -> Tuple[str, bytes, int]:
+    """(digest, compressed data, uncompressed size) of one JSON value."""
+    text = json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+    return hashlib.sha256(text).hexdigest(), zlib.compress(text, COMPRESS_LEVEL), len(text)
+
+
+def decode(data) -> Any:
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def _digests(manifest) -> List[str]:
+    # Dict payloads map key -> digest; any other JSON value is stored whole as [digest]
+    if isinstance(manifest, dict):
+        return list(manifest.values())
+    return list(manifest or [])
+
+
+def split(raw: Any) -> Tuple[Any, Dict[str, Tuple[bytes, int]]]:
+    """(manifest, {digest: (data, size)}) for a raw payload."""
+    if isinstance(raw, dict):
+        manifest, blobs = {}, {}
+        for key, value in raw.items():
+            digest, data, size = encode(value)
+            manifest[key] = digest
+            blobs[digest] = (data, size)
+        return manifest, blobs
+    digest, data, size = encode(raw)
+    return [digest], {digest: (data, size)}
+
+
+def assemble(manifest, values: Dict[str, Any]) -> Any:
+    if isinstance(manifest, dict):
+        return {key: values[digest] for key, digest in manifest.items()}
+    return values[manifest[0]] if manifest else {}
+
+
+# ---- references ----
+
+def _chunks(digests: List[str]):
+    for start in range(0, len(digests), CHUNK):
+        yield digests[start:start + CHUNK]
+
+
+def _set_counts(counts: Dict[str, int], value) -> None:
+    """refcount = value(count) for each digest, one UPDATE per distinct count."""
+    by_count = collections.defaultdict(list)
+    for digest, count in counts.items():
+        by_count[count].append(digest)
+    for count, digests in by_count.items():
+        for chunk in _chunks(digests):
+            RawBlob.objects.filter(digest__in=chunk).update(refcount=value(count))
+
+
+def acquire(blobs: Dict[str, Tuple[bytes, int]], counts: Dict[str, int]) -> None:
+    """Insert missing blobs and add counts[digest] references to each.
+
+    One upsert (INSERT ... ON CONFLICT DO UPDATE, SQLite 3.24+ and
+    PostgreSQL) per chunk: with a separate insert and increment, a
+    concurrent release could delete the blob in between and the increment
+    would miss it.
+    """
+    if not counts:
+        return
+    table = connection.ops.quote_name(RawBlob._meta.db_table)
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    digests = list(counts)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(digests), UPSERT_CHUNK):
+            chunk = digests[start:start + UPSERT_CHUNK]
+            params = []
+            for digest in chunk:
+                data, size = blobs[digest]
+                params += [digest, data, size, counts[digest], created_at]
+            cursor.execute(
+                f"INSERT INTO {table} (digest, data, size, refcount, created_at) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (digest) DO UPDATE SET refcount = {table}.refcount + excluded.refcount",
+                params,
+            )
+            if cursor.rowcount != len(chunk):
+                raise RuntimeError(f"RawBlob upsert touched {cursor.rowcount} rows for {len(chunk)} digests")
+
+
+def release(manifests: Iterable[Any]) -> None:
+    """Drop the references of the given manifests; delete unreferenced blobs."""
+    counts = collections.Counter(digest for manifest in manifests for digest in _digests(manifest))
+    if not counts:
+        return
+    with transaction.atomic():
+        _set_counts(counts, lambda count: F('refcount') - count)
+        for chunk in _chunks(list(counts)):
+            RawBlob.objects.filter(digest__in=chunk, refcount__lte=0).delete()
+
+
+@contextmanager
+def deferred():
+    """Collect manifests released inside the block and release them together
+    when it exits normally, in the caller's transaction. If the block raises
+    nothing is released: its deletes may have rolled back, and releasing
+    their references would delete blobs still in use. Deletes that did commit
+    then leave counts too high until recount()."""
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = []
+    try:
+        yield
+    except BaseException:
+        _state.pending = None
+        raise
+    pending, _state.pending = _state.pending, None
+    release(pending)
+
+
+def release_run(manifest) -> None:
+    """Entry point for the run delete signal handler."""
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.append(manifest)
+        return
+    release([manifest])
+
+
+def store_pending(runs: Iterable[AssessmentRun]) -> List[Any]:
+    """Store the pending raw payloads of runs and set their manifests.
+    Returns the manifests they replace (for release())."""
+    blobs: Dict[str, Tuple[bytes, int]] = {}
+    counts: collections.Counter = collections.Counter()
+    replaced = []
+    for run in runs:
+        if not run._raw_pending:
+            continue
+        manifest, run_blobs = split(run._raw)
+        blobs.update(run_blobs)
+        counts.update(_digests(manifest))
+        if run._raw_stored_manifest:
+            replaced.append(run._raw_stored_manifest)
+        run.raw_manifest = manifest
+    acquire(blobs, counts)
+    return replaced
+
+
+# ---- reads ----
+
+def load_values(digests: Iterable[str]) -> Dict[str, Any]:
+    values = {}
+    for chunk in _chunks(list(set(digests))):
+        for digest, data in RawBlob.objects.filter(digest__in=chunk).values_list('digest', 'data'):
+            values[digest] = decode(data)
+    return values
+
+
+def load_raw(runs: Iterable[AssessmentRun]) -> None:
+    """Fill the raw payload of many runs with one blob query."""
+    runs = [run for run in runs if not run._raw_loaded]
+    values = load_values(digest for run in runs for digest in _digests(run.raw_manifest))
+    for run in runs:
+        run._set_loaded_raw(assemble(run.raw_manifest, values))
+
+
+def raw_for(manifest) -> Any:
+    return assemble(manifest, load_values(_digests(manifest)))
+
+
+# ---- maintenance ----
+
+def recount(progress=None) -> Dict[str, int]:
+    """Recompute every refcount from hot runs and archived segments, and
+    delete blobs nothing references."""
+    from . import archive
+
+    counts: collections.Counter = collections.Counter()
+    for manifest in AssessmentRun.objects.values_list('raw_manifest', flat=True).iterator(chunk_size=5000):
+        counts.update(_digests(manifest))
+    for manifest in archive.archived_raw_manifests():
+        counts.update(_digests(manifest))
+    if progress:
+        progress(len(counts))
+
+    with transaction.atomic():
+        stored = dict(RawBlob.objects.values_list('digest', 'refcount'))
+        unreferenced = [digest for digest in stored if digest not in counts]
+        for chunk in _chunks(unreferenced):
+            RawBlob.objects.filter(digest__in=chunk).delete()
+        changed = {digest: count for digest, count in counts.items() if digest in stored and stored[digest] != count}
+        _set_counts(changed, lambda count: count)
+    missing = sum(1 for digest in counts if digest not in stored)
+    return {'blobs': len(stored) - len(unreferenced), 'deleted': len(unreferenced),
+            'corrected': len(changed), 'missing': missing}
+
+
+def stats() -> Dict[str, Optional[int]]:
+    totals = RawBlob.objects.aggregate(
+        blobs=Count('digest'), references=Sum('refcount'), size=Sum('size'),
+    )
+    stored = sum(len(data) for data in RawBlob.objects.values_list('data', flat=True).iterator(chunk_size=2000))
+    return {**totals, 'stored_bytes': stored}
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+from .models import Patient
+
+
+class PatientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Patient
+        fields = ['id', 'external_id', 'name', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+        # Uniqueness is checked by the views (the default UniqueValidator
+        # queries synchronously and cannot run inside async views)
+        extra_kwargs = {'external_id': {'validators': []}}
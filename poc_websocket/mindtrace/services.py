@@ -0,0 +1,112 @@
+"""
+Read services for MindTrace session data.
+
+session_detail()/asession_detail() return the same JSON-ready payload (a
+session with its runs and their metrics) for sync and async callers; the
+payload is assembled by build_session_payload() from plain value rows so
+both paths issue the same queries. Numeric metrics carry percentile ranks
+from the precomputed norm tables (mindtrace.norms); with the tables cached
+in the process that costs one small metadata query.
+
+Runs and metrics of archived sessions are read from their segment file
+(mindtrace.archive); the payload marks them with "archived": true.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+
+from . import archive, norms
+from .models import AssessmentRun, Metric, Session
+from .summaries import metric_value
+
+SESSION_FIELDS = (
+    'id', 'patient_id', 'patient__external_id', 'protocol_id', 'protocol__name',
+    'start_time', 'site', 'operator', 'session_type', 'app_version', 'exp_version', 'notes',
+    'archive_segment_id',
+)
+RUN_FIELDS = ('id', 'assessment_id', 'assessment__name', 'event', 'start_time')
+METRIC_FIELDS = ('run_id', 'key', 'value_int', 'value_float', 'value_text')
+
+
+def _runs(session_id):
+    return AssessmentRun.objects.filter(session_id=session_id).order_by('start_time', 'id').values(*RUN_FIELDS)
+
+
+def _metrics(session_id):
+    return Metric.objects.filter(run__session_id=session_id).order_by('id').values(*METRIC_FIELDS)
+
+
+def _with_archived(session, runs, metrics):
+    """Add the session's archived rows to the hot ones (runs or metrics saved
+    after archiving stay hot)."""
+    if not session['archive_segment_id']:
+        return runs, metrics
+    cold_runs, cold_metrics = archive.session_rows(session['archive_segment_id'], session['id'])
+    runs = sorted(cold_runs + runs, key=lambda run: (run['start_time'] is not None, run['start_time'], run['id']))
+    return runs, cold_metrics + metrics
+
+
+def _percentiles(session, run, values, tables):
+    ranks = {}
+    for key, value in values.items():
+        run_ranks = norms.percentiles(tables, run['assessment_id'], key, value, session['site'], session['protocol_id'])
+        if run_ranks:
+            ranks[key] = run_ranks
+    return ranks
+
+
+def build_session_payload(session: Dict[str, Any], runs: List[Dict[str, Any]],
+                          metrics: List[Dict[str, Any]], tables=None) -> Dict[str, Any]:
+    by_run: Dict[int, Dict[str, Any]] = {}
+    for row in metrics:
+        by_run.setdefault(row['run_id'], {})[row['key']] = metric_value(row)
+    tables = tables or {}
+    return {
+        'id': session['id'],
+        'patient': {'id': session['patient_id'], 'external_id': session['patient__external_id']},
+        'protocol': (
+            {'id': session['protocol_id'], 'name': session['protocol__name']}
+            if session['protocol_id'] else None
+        ),
+        'start_time': session['start_time'],
+        'site': session['site'],
+        'operator': session['operator'],
+        'session_type': session['session_type'],
+        'app_version': session['app_version'],
+        'exp_version': session['exp_version'],
+        'notes': session['notes'],
+        'archived': bool(session['archive_segment_id']),
+        'runs': [
+            {
+                'id': run['id'],
+                'assessment': {'id': run['assessment_id'], 'name': run['assessment__name']},
+                'event': run['event'],
+                'start_time': run['start_time'],
+                'metrics': by_run.get(run['id'], {}),
+                'percentiles': _percentiles(session, run, by_run.get(run['id'], {}), tables),
+            }
+            for run in runs
+        ],
+    }
+
+
+def session_detail(session_id: int) -> Optional[Dict[str, Any]]:
+    session = Session.objects.filter(id=session_id).values(*SESSION_FIELDS).first()
+    if session is None:
+        return None
+    runs, metrics = _with_archived(session, list(_runs(session_id)), list(_metrics(session_id)))
+    tables = norms.load_tables({run['assessment_id'] for run in runs}, session['site'], session['protocol_id'])
+    return build_session_payload(session, runs, metrics, tables)
+
+
+async def asession_detail(session_id: int) -> Optional[Dict[str, Any]]:
+    session = await Session.objects.filter(id=session_id).values(*SESSION_FIELDS).afirst()
+    if session is None:
+        return None
+    runs = [row async for row in _runs(session_id)]
+    metrics = [row async for row in _metrics(session_id)]
+    if session['archive_segment_id']:
+        runs, metrics = await sync_to_async(_with_archived)(session, runs, metrics)
+    tables = await norms.aload_tables({run['assessment_id'] for run in runs}, session['site'], session['protocol_id'])
+    return build_session_payload(session, runs, metrics, tables)
@@ -0,0 +1,66 @@
+"""
+Signal handlers keeping derived MindTrace tables in sync with writes.
+Connected from MindtraceConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import archive, norms, rawstore, summaries
+from .models import AssessmentRun, Metric, ProtocolAssessment, Session
+
+
+@receiver(post_save, sender=AssessmentRun)
+@receiver(post_delete, sender=AssessmentRun)
+def run_changed(sender, instance, **kwargs):
+    summaries.schedule_run(instance.id, instance.session_id)
+
+
+@receiver(post_delete, sender=AssessmentRun)
+def run_deleted(sender, instance, **kwargs):
+    rawstore.release_run(instance.raw_manifest)
+
+
+@receiver(post_save, sender=Metric)
+@receiver(post_delete, sender=Metric)
+def metric_changed(sender, instance, **kwargs):
+    # Run -> session lookups are cached per transaction
+    summaries.schedule_run(instance.run_id)
+
+
+@receiver(pre_delete, sender=AssessmentRun)
+def run_deleting(sender, instance, **kwargs):
+    # Cascades delete metrics before their run: remember its session first
+    summaries.schedule_run(instance.id, instance.session_id)
+
+
+@receiver(pre_delete, sender=Session)
+def session_deleting(sender, instance, **kwargs):
+    summaries.session_deleting(instance.id)
+    archive.session_deleting(instance)
+
+
+@receiver(post_save, sender=Session)
+def session_saved(sender, instance, **kwargs):
+    summaries.schedule_session(instance.id)
+
+
+@receiver(post_delete, sender=Session)
+def session_deleted(sender, instance, **kwargs):
+    summaries.session_deleted(instance.patient_id, instance.protocol_id)
+    if instance.archive_segment_id:
+        archive.session_deleted(instance.archive_segment_id)
+
+
+@receiver(post_save, sender=Metric)
+def metric_saved(sender, instance, created, **kwargs):
+    # New population values: percentile tables catch up in a batched job
+    if created:
+        norms.schedule_refresh()
+
+
+@receiver(post_save, sender=ProtocolAssessment)
+@receiver(post_delete, sender=ProtocolAssessment)
+def protocol_assessment_changed(sender, instance, **kwargs):
+    # Expected/completed counts of every session on the protocol move with it
+    summaries.schedule_protocol(instance.protocol_id)
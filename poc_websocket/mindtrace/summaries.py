@@ -0,0 +1,379 @@
+"""
+Materialized dashboard summaries.
+
+SessionSummary holds one row per session (run counts, completion against the
+protocol's ProtocolAssessment ordering, key scores) and PatientProtocolSummary
+rolls those rows up per patient/protocol, so dashboards read a single row
+instead of aggregating over AssessmentRun and Metric.
+
+Rows are refreshed incrementally: signals (see mindtrace.signals) schedule
+the session a run or metric belongs to, and each transaction refreshes the
+sessions it touched once on commit (sessions it deletes are skipped). Bulk
+ingestion paths that bypass signals (bulk_create, queryset.update) should
+call refresh_sessions() with the ids they touched, or wrap the writes in
+deferred() so each session is refreshed once at the end. The
+rebuild_summaries management command recomputes everything for backfills.
+"""
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from .models import (
+    AssessmentRun,
+    Metric,
+    PatientProtocolSummary,
+    ProtocolAssessment,
+    Session,
+    SessionSummary,
+)
+
+_state = threading.local()
+
+
+def _summary_keys() -> Optional[set]:
+    """Metric keys copied into key_scores; None means every numeric metric."""
+    keys = getattr(settings, 'MINDTRACE_SUMMARY_KEYS', None)
+    return set(keys) if keys is not None else None
+
+
+def metric_value(metric: Dict[str, Any]):
+    if metric['value_float'] is not None:
+        return metric['value_float']
+    if metric['value_int'] is not None:
+        return metric['value_int']
+    return metric['value_text']
+
+
+# ---- deferral ----
+
+class _Batch:
+    """Sessions touched by one transaction (or deferred() block), refreshed
+    once when it ends. Also caches run -> session lookups for metric signals
+    and skips sessions deleted in the same batch."""
+
+    def __init__(self):
+        self.session_ids = set()
+        self.deleted_ids = set()
+        self.protocol_ids = set()
+        self.run_sessions: Dict[int, int] = {}
+
+    def flush(self):
+        if _current_batch_is(self):
+            _state.batch = None
+        for protocol_id in self.protocol_ids:
+            refresh_protocol(protocol_id)
+        refresh_sessions(self.session_ids - self.deleted_ids)
+
+
+def _current_batch_is(batch) -> bool:
+    return getattr(_state, 'batch', None) is batch
+
+
+def _batch() -> _Batch:
+    """The deferred() batch, else the batch of the current transaction. A new
+    transaction batch registers a single on_commit flush; it is replaced once
+    that callback has run or was discarded by a rollback."""
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        return pending
+    connection = transaction.get_connection()
+    batch = getattr(_state, 'batch', None)
+    if batch is not None and connection.in_atomic_block and any(
+        entry[1] == batch.flush for entry in connection.run_on_commit
+    ):
+        return batch
+    batch = _state.batch = _Batch()
+    if connection.in_atomic_block:
+        transaction.on_commit(batch.flush)
+    return batch
+
+
+@contextmanager
+def deferred():
+    """Collect session ids touched inside the block and refresh each once on exit."""
+    outer = getattr(_state, 'pending', None)
+    if outer is not None:
+        # Nested: the outermost block does the refresh
+        yield
+        return
+    _state.pending = _Batch()
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+        pending.flush()
+
+
+@contextmanager
+def suppressed():
+    """Disable signal-driven refreshes inside the block (e.g. archival, deletes)."""
+    previous = getattr(_state, 'suppressed', False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def _active() -> bool:
+    return not getattr(_state, 'suppressed', False)
+
+
+def schedule_session(session_id: Optional[int]) -> None:
+    """Entry point for signal handlers."""
+    if not _active() or session_id is None:
+        return
+    batch = _batch()
+    batch.session_ids.add(session_id)
+    _flush_autocommit(batch)
+
+
+def _flush_autocommit(batch: _Batch) -> None:
+    if not transaction.get_connection().in_atomic_block and batch is not getattr(_state, 'pending', None):
+        # Autocommit: nothing to wait for
+        batch.flush()
+
+
+def schedule_run(run_id: int, session_id: Optional[int] = None) -> None:
+    """Schedule the session of a run; session_id skips the lookup when known."""
+    if not _active():
+        return
+    batch = _batch()
+    if session_id is None:
+        session_id = batch.run_sessions.get(run_id)
+        if session_id is None:
+            session_id = AssessmentRun.objects.filter(id=run_id).values_list('session_id', flat=True).first()
+    if session_id is not None:
+        batch.run_sessions[run_id] = session_id
+    schedule_session(session_id)
+
+
+def schedule_protocol(protocol_id: Optional[int]) -> None:
+    """A protocol's assessment ordering changed: its sessions' completion is stale."""
+    if not _active() or protocol_id is None:
+        return
+    batch = _batch()
+    batch.protocol_ids.add(protocol_id)
+    _flush_autocommit(batch)
+
+
+def session_deleting(session_id: int) -> None:
+    """A session is about to be deleted: its own refresh is pointless."""
+    if _active():
+        _batch().deleted_ids.add(session_id)
+
+
+def session_deleted(patient_id: int, protocol_id: Optional[int]) -> None:
+    """A session was deleted: refresh its patient/protocol roll-up on commit."""
+    if _active():
+        transaction.on_commit(lambda: refresh_patient_protocol(patient_id, protocol_id))
+
+
+# ---- refresh ----
+
+def refresh_sessions(session_ids: Iterable[int]) -> int:
+    count = 0
+    for session_id in set(session_ids):
+        refresh_session(session_id)
+        count += 1
+    return count
+
+
+def refresh_session(session_id: int) -> Optional[SessionSummary]:
+    """Recompute the summary row for one session and its patient/protocol roll-up."""
+    session = (
+        Session.objects.filter(id=session_id)
+        .only('id', 'patient_id', 'protocol_id', 'start_time', 'archive_segment_id')
+        .first()
+    )
+    if session is None:
+        # Session deleted; SessionSummary cascades, only the roll-up is stale
+        return None
+    previous = SessionSummary.objects.filter(session_id=session_id).values('patient_id', 'protocol_id').first()
+    if session.archive_segment_id and previous:
+        # Runs and metrics live in the archive (mindtrace.archive); the summary
+        # was computed before they moved, only the session fields can change
+        SessionSummary.objects.filter(session_id=session_id).update(
+            patient_id=session.patient_id, protocol_id=session.protocol_id, start_time=session.start_time,
+        )
+        refresh_patient_protocol(session.patient_id, session.protocol_id)
+        if (previous['patient_id'], previous['protocol_id']) != (session.patient_id, session.protocol_id):
+            refresh_patient_protocol(previous['patient_id'], previous['protocol_id'])
+        return SessionSummary.objects.get(session_id=session_id)
+
+    runs = AssessmentRun.objects.filter(session_id=session_id)
+    run_stats = runs.aggregate(run_count=Count('id'), last_run_at=Max('start_time'))
+    done_ids = set(runs.values_list('assessment_id', flat=True).distinct())
+
+    expected_ids = []
+    if session.protocol_id:
+        expected_ids = list(
+            ProtocolAssessment.objects.filter(protocol_id=session.protocol_id)
+            .order_by('order', 'id')
+            .values_list('assessment_id', flat=True)
+        )
+    completed = [aid for aid in expected_ids if aid in done_ids]
+    next_assessment_id = next((aid for aid in expected_ids if aid not in done_ids), None)
+
+    keys = _summary_keys()
+    metrics = Metric.objects.filter(run__session_id=session_id)
+    if keys is not None:
+        metrics = metrics.filter(key__in=keys)
+    key_scores: Dict[str, Dict[str, Any]] = {}
+    metric_count = 0
+    rows = metrics.order_by('run__start_time', 'run_id', 'id').values(
+        'key', 'value_int', 'value_float', 'value_text', 'run__assessment__name',
+    )
+    for row in rows:
+        metric_count += 1
+        if keys is None and row['value_int'] is None and row['value_float'] is None:
+            continue
+        # Later runs of the same assessment overwrite earlier ones
+        key_scores.setdefault(row['run__assessment__name'], {})[row['key']] = metric_value(row)
+    if keys is not None:
+        metric_count = Metric.objects.filter(run__session_id=session_id).count()
+
+    summary, _ = SessionSummary.objects.update_or_create(
+        session_id=session_id,
+        defaults={
+            'patient_id': session.patient_id,
+            'protocol_id': session.protocol_id,
+            'start_time': session.start_time,
+            'run_count': run_stats['run_count'],
+            'metric_count': metric_count,
+            'expected_count': len(expected_ids),
+            'completed_count': len(completed),
+            'completed_assessment_ids': completed if session.protocol_id else sorted(done_ids),
+            'next_assessment_id': next_assessment_id,
+            'key_scores': key_scores,
+            'last_run_at': run_stats['last_run_at'],
+        },
+    )
+    refresh_patient_protocol(session.patient_id, session.protocol_id)
+    if previous and (previous['patient_id'], previous['protocol_id']) != (session.patient_id, session.protocol_id):
+        refresh_patient_protocol(previous['patient_id'], previous['protocol_id'])
+    return summary
+
+
+def refresh_protocol(protocol_id: int, chunk_size: int = 500) -> int:
+    """Re-derive the completion fields of every session summary on a protocol
+    from its current ordering, in chunks of sessions. Archived sessions have
+    no hot runs; their previously completed assessments are kept where the
+    protocol still expects them."""
+    expected_ids = list(
+        ProtocolAssessment.objects.filter(protocol_id=protocol_id)
+        .order_by('order', 'id')
+        .values_list('assessment_id', flat=True)
+    )
+    summaries = SessionSummary.objects.filter(protocol_id=protocol_id).order_by('session_id')
+    patient_ids = set()
+    done = 0
+    last_id = 0
+    while True:
+        chunk = list(
+            summaries.filter(session_id__gt=last_id)
+            .select_related('session')
+            .only('session_id', 'patient_id', 'completed_assessment_ids', 'session__archive_segment_id')[:chunk_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].session_id
+        done_ids = defaultdict(set)
+        runs = AssessmentRun.objects.filter(session_id__in=[summary.session_id for summary in chunk])
+        for session_id, assessment_id in runs.values_list('session_id', 'assessment_id').distinct():
+            done_ids[session_id].add(assessment_id)
+        for summary in chunk:
+            if summary.session.archive_segment_id:
+                finished = set(summary.completed_assessment_ids)
+            else:
+                finished = done_ids[summary.session_id]
+            completed = [aid for aid in expected_ids if aid in finished]
+            summary.expected_count = len(expected_ids)
+            summary.completed_count = len(completed)
+            summary.completed_assessment_ids = completed
+            summary.next_assessment_id = next((aid for aid in expected_ids if aid not in finished), None)
+            patient_ids.add(summary.patient_id)
+        SessionSummary.objects.bulk_update(
+            chunk, ['expected_count', 'completed_count', 'completed_assessment_ids', 'next_assessment_id'],
+        )
+        done += len(chunk)
+    for patient_id in patient_ids:
+        refresh_patient_protocol(patient_id, protocol_id)
+    return done
+
+
+def refresh_patient_protocol(patient_id: int, protocol_id: Optional[int]) -> Optional[PatientProtocolSummary]:
+    """Roll SessionSummary rows up into the patient/protocol row (one small query)."""
+    summaries = SessionSummary.objects.filter(patient_id=patient_id, protocol_id=protocol_id)
+    stats = summaries.aggregate(
+        session_count=Count('session_id'),
+        first_session_at=Min('start_time'),
+        last_session_at=Max('start_time'),
+    )
+    if not stats['session_count']:
+        PatientProtocolSummary.objects.filter(patient_id=patient_id, protocol_id=protocol_id).delete()
+        return None
+
+    run_count = 0
+    completed = 0
+    for row in summaries.values('run_count', 'expected_count', 'completed_count'):
+        run_count += row['run_count']
+        if row['expected_count'] and row['completed_count'] >= row['expected_count']:
+            completed += 1
+    latest = summaries.order_by('-start_time', '-session_id').values('session_id', 'key_scores').first()
+
+    summary, _ = PatientProtocolSummary.objects.update_or_create(
+        patient_id=patient_id,
+        protocol_id=protocol_id,
+        defaults={
+            'session_count': stats['session_count'],
+            'completed_session_count': completed,
+            'run_count': run_count,
+            'first_session_at': stats['first_session_at'],
+            'last_session_at': stats['last_session_at'],
+            'latest_session_id': latest['session_id'],
+            'latest_key_scores': latest['key_scores'],
+        },
+    )
+    return summary
+
+
+def rebuild(session_ids: Optional[Iterable[int]] = None, chunk_size: int = 500, progress=None) -> int:
+    """Recompute summaries for the given sessions (default: all) in chunks."""
+    qs = Session.objects.order_by('id').values_list('id', flat=True)
+    if session_ids is not None:
+        qs = qs.filter(id__in=list(session_ids))
+    done = 0
+    batch = []
+    for session_id in qs.iterator(chunk_size=chunk_size):
+        batch.append(session_id)
+        if len(batch) >= chunk_size:
+            with transaction.atomic():
+                done += refresh_sessions(batch)
+            batch = []
+            if progress:
+                progress(done)
+    if batch:
+        with transaction.atomic():
+            done += refresh_sessions(batch)
+        if progress:
+            progress(done)
+    if session_ids is None:
+        drop_stale_patient_summaries()
+    return done
+
+
+def drop_stale_patient_summaries() -> int:
+    """Drop roll-ups whose sessions have all been deleted."""
+    stale = [
+        row for row in PatientProtocolSummary.objects.values_list('id', 'patient_id', 'protocol_id')
+        if not SessionSummary.objects.filter(patient_id=row[1], protocol_id=row[2]).exists()
+    ]
+    deleted, _ = PatientProtocolSummary.objects.filter(id__in=[row[0] for row in stale]).delete()
+    return deleted
@@ -0,0 +1,158 @@
+"""
+Background job tasks for MindTrace (see jobs.registry).
+
+Queue them from the API (POST /api/jobs/) or `manage.py enqueue_job`;
+`manage.py run_jobs` executes them.
+"""
+
+import datetime
+import itertools
+import os
+
+from django.db import transaction
+from django.utils import timezone
+
+from jobs.registry import InvalidParams, task
+
+from . import archive, importers, ingest, norms, summaries
+from .models import Session
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _check_import_params(params):
+    try:
+        for key in ('assessments_file', 'protocols_path'):
+            if params.get(key):
+                importers.import_path(params[key])
+        importers.check_pattern(params.get('glob', '*.json'))
+    except importers.ImportFileError as exc:
+        raise InvalidParams(str(exc)) from None
+
+
+@task('import_protocols', validate=_check_import_params)
+def import_protocols(ctx, assessments_file=None, protocols_path=None, glob='*.json'):
+    """import_protocols --apply as a job; checkpoints after each protocol file.
+    Paths are relative to (and confined to) MINDTRACE_IMPORT_ROOT."""
+    if assessments_file:
+        assessments_file = importers.import_path(assessments_file)
+    if protocols_path:
+        protocols_path = importers.import_path(protocols_path)
+    counts = ctx.checkpoint.get('counts') or {"assessments": 0, "protocols": 0, "links": 0}
+    skipped = ctx.checkpoint.get('skipped') or []
+    files = importers.protocol_files(protocols_path, glob, exclude=assessments_file) if protocols_path else []
+    total = len(files) + (1 if assessments_file else 0)
+
+    if assessments_file and not ctx.checkpoint.get('assessments_done'):
+        assessments = importers.load_assessments(assessments_file)
+        with transaction.atomic():
+            counts["assessments"] += importers.import_assessments(assessments)
+            ctx.save_checkpoint(
+                {'assessments_done': True, 'next_file': 0, 'counts': counts, 'skipped': skipped},
+                done=1, total=total, message=f"Imported {len(assessments)} assessments",
+            )
+
+    done_before = 1 if assessments_file else 0
+    for index in range(ctx.checkpoint.get('next_file', 0), len(files)):
+        fp = files[index]
+        try:
+            proto_name, items = importers.read_protocol_file(fp)
+        except Exception as exc:
+            skipped.append(f"{fp}: {exc}")
+            proto_name, items = None, []
+        with transaction.atomic():
+            if proto_name and items:
+                for key, count in importers.import_protocol(proto_name, items).items():
+                    counts[key] += count
+            ctx.save_checkpoint(
+                {'assessments_done': True, 'next_file': index + 1, 'counts': counts, 'skipped': skipped},
+                done=done_before + index + 1, total=total, message=f"Imported {proto_name or fp}",
+            )
+    return {'created': counts, 'skipped': skipped}
+
+
+def _check_ingest_params(params):
+    try:
+        importers.import_path(params.get('path', ''))
+    except importers.ImportFileError as exc:
+        raise InvalidParams(str(exc)) from None
+    chunk_size = params.get('chunk_size', 500)
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise InvalidParams("chunk_size must be a positive integer")
+
+
+@task('ingest_sessions', validate=_check_ingest_params)
+def ingest_sessions(ctx, path, chunk_size=500):
+    """Bulk-ingest sessions with their runs and metrics from a JSON Lines file
+    (format in mindtrace.ingest), relative to MINDTRACE_IMPORT_ROOT. Each chunk
+    commits with its checkpoint, so a resumed job continues after it."""
+    path = importers.import_path(path)
+    if not os.path.isfile(path):
+        raise importers.ImportFileError(f"Ingest file not found: {path}")
+    counts = ctx.checkpoint.get('counts') or {'patients': 0, 'sessions': 0, 'runs': 0, 'metrics': 0}
+    skipped = ctx.checkpoint.get('skipped') or []
+    total = ingest.count_lines(path)
+    ctx.progress(done=ctx.checkpoint.get('line', 0), total=total, message='Ingesting sessions', force=True)
+
+    lines = ingest.read_lines(path, start=ctx.checkpoint.get('line', 0))
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            break
+        with transaction.atomic():
+            chunk_counts, chunk_skipped = ingest.ingest_chunk(chunk)
+            for key, count in chunk_counts.items():
+                counts[key] += count
+            # Keep the first errors; a bad file should not grow the checkpoint without bound
+            skipped = (skipped + chunk_skipped)[:MAX_REPORTED_ERRORS]
+            ctx.save_checkpoint(
+                {'line': chunk[-1][0], 'counts': counts, 'skipped': skipped},
+                done=chunk[-1][0], total=total, message=f"Ingested {counts['sessions']} sessions",
+            )
+    ctx.progress(done=total, total=total, force=True)
+    return {'created': counts, 'skipped': skipped}
+
+
+@task('rebuild_summaries')
+def rebuild_summaries(ctx, chunk_size=500):
+    """Re-score: recompute session summaries in id order, one checkpoint per chunk."""
+    last_id = ctx.checkpoint.get('last_id', 0)
+    done = ctx.checkpoint.get('done', 0)
+    total = done + Session.objects.filter(id__gt=last_id).count()
+    ctx.progress(done=done, total=total, message='Rebuilding session summaries', force=True)
+
+    while True:
+        batch = list(
+            Session.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not batch:
+            break
+        with transaction.atomic():
+            done += summaries.refresh_sessions(batch)
+            last_id = batch[-1]
+            ctx.save_checkpoint({'last_id': last_id, 'done': done}, done=done, total=total)
+
+    summaries.drop_stale_patient_summaries()
+    return {'sessions': done}
+
+
+@task('refresh_norms')
+def refresh_norms(ctx, full=False, chunk_size=5000):
+    """Merge new metrics into the percentile tables (rebuild them with full)."""
+    ctx.progress(done=0, message='Rebuilding norm tables' if full else 'Refreshing norm tables', force=True)
+    return norms.refresh(full=full, chunk_size=chunk_size, progress=lambda scanned: ctx.progress(done=scanned))
+
+
+@task('archive_sessions')
+def archive_sessions(ctx, older_than_days=None, sessions_per_segment=archive.DEFAULT_SESSIONS_PER_SEGMENT):
+    """Move old sessions' runs and metrics into archive segments. Each segment
+    commits on its own, so a resumed job simply continues with what is left."""
+    cutoff = archive.default_cutoff()
+    if older_than_days is not None:
+        cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    total = Session.objects.filter(start_time__lt=cutoff, archive_segment__isnull=True).count()
+    ctx.progress(done=0, total=total, message='Archiving sessions', force=True)
+    return archive.archive_sessions(
+        cutoff, sessions_per_segment=sessions_per_segment,
+        progress=lambda totals: ctx.progress(done=totals['sessions'], total=total),
+    )
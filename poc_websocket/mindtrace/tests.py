@@ -0,0 +1,621 @@
+import csv
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from jobs import queue, worker
+from jobs.models import Job
+from jobs.registry import InvalidParams
+from search.backends import search
+from user_app.models import User, UserChange
+
+from . import archive, exports, importers, ingest, norms, rawstore, summaries
+from .middleware import SummaryBatchMiddleware
+from .models import (
+    ArchiveSegment,
+    Assessment,
+    AssessmentRun,
+    Metric,
+    NormGap,
+    NormTable,
+    Patient,
+    PatientProtocolSummary,
+    Protocol,
+    ProtocolAssessment,
+    RawBlob,
+    Session,
+    SessionSummary,
+)
+
+
+def make_session(external_id='P-1', site='Boston', **fields):
+    patient = Patient.objects.create(external_id=external_id)
+    return Session.objects.create(patient=patient, start_time=timezone.now(), site=site, **fields)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None, MINDTRACE_NORM_STRATA=('all',))
+class NormRefreshTests(TestCase):
+    def setUp(self):
+        self.assessment = Assessment.objects.create(name='Stroop')
+        self.run = AssessmentRun.objects.create(session=make_session(), assessment=self.assessment)
+
+    def add(self, value, **fields):
+        return Metric.objects.create(run=self.run, key='score', value_text=str(value), value_float=value, **fields)
+
+    def table(self):
+        table = NormTable.objects.get(assessment=self.assessment, key='score')
+        return list(norms.unpack(table.values))
+
+    def test_full_rebuild(self):
+        for value in (3.0, 1.0, 2.0):
+            self.add(value)
+        self.assertEqual(norms.refresh(full=True)['tables'], 1)
+        self.assertEqual(self.table(), [1.0, 2.0, 3.0])
+
+    def test_late_commit_below_watermark_is_merged(self):
+        self.add(1.0)
+        norms.refresh(full=True)
+        late = self.add(2.0)
+        self.add(3.0)
+        # The middle metric's transaction has not committed when the refresh scans
+        row = Metric.objects.filter(id=late.id).values().get()
+        Metric.objects.filter(id=late.id).delete()
+        norms.refresh()
+        self.assertEqual(self.table(), [1.0, 3.0])
+        self.assertTrue(NormGap.objects.filter(metric_id=late.id).exists())
+
+        Metric.objects.create(**row)
+        norms.refresh()
+        self.assertEqual(self.table(), [1.0, 2.0, 3.0])
+        self.assertFalse(NormGap.objects.exists())
+
+    @override_settings(MINDTRACE_NORM_GAP_SECONDS=0)
+    def test_rolled_back_ids_expire(self):
+        self.add(1.0)
+        norms.refresh(full=True)
+        self.add(2.0).delete()
+        self.add(3.0)
+        norms.refresh()
+        norms.refresh()
+        self.assertFalse(NormGap.objects.exists())
+        self.assertEqual(self.table(), [1.0, 3.0])
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class SummaryTests(TestCase):
+    def setUp(self):
+        self.names = ['Stroop', 'Flanker', 'Digit Span']
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_protocol('Baseline', [{'name': name} for name in self.names])
+            self.protocol = Protocol.objects.get(name='Baseline')
+            self.assessments = {a.name: a for a in Assessment.objects.all()}
+            self.session = make_session(protocol=self.protocol)
+
+    def add_run(self, name, **scores):
+        with self.captureOnCommitCallbacks(execute=True):
+            run = AssessmentRun.objects.create(session=self.session, assessment=self.assessments[name])
+            for key, value in scores.items():
+                Metric.objects.create(run=run, key=key, value_text=str(value), value_float=value)
+        return run
+
+    def summary(self):
+        return SessionSummary.objects.get(session=self.session)
+
+    def test_runs_and_metrics_update_incrementally(self):
+        self.assertEqual((self.summary().expected_count, self.summary().completed_count), (3, 0))
+        self.add_run('Stroop', score=1.0)
+        self.add_run('Stroop', score=2.0)
+        summary = self.summary()
+        self.assertEqual((summary.run_count, summary.metric_count, summary.completed_count), (2, 2, 1))
+        self.assertEqual(summary.next_assessment_id, self.assessments['Flanker'].id)
+        # The later run of an assessment wins
+        self.assertEqual(summary.key_scores, {'Stroop': {'score': 2.0}})
+        rollup = PatientProtocolSummary.objects.get(protocol=self.protocol)
+        self.assertEqual((rollup.run_count, rollup.latest_key_scores), (2, summary.key_scores))
+
+    def test_cascading_deletes(self):
+        run = self.add_run('Stroop', score=1.0)
+        self.add_run('Flanker', rt=350.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            run.delete()
+        summary = self.summary()
+        self.assertEqual((summary.run_count, summary.metric_count), (1, 1))
+        self.assertEqual(summary.key_scores, {'Flanker': {'rt': 350.0}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session.patient.delete()
+        self.assertFalse(SessionSummary.objects.exists())
+        self.assertFalse(PatientProtocolSummary.objects.exists())
+
+    def test_protocol_changes_refresh_its_sessions(self):
+        for name in self.names[:2]:
+            self.add_run(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProtocolAssessment.objects.get(protocol=self.protocol, assessment__name='Digit Span').delete()
+        summary = self.summary()
+        self.assertEqual((summary.expected_count, summary.completed_count, summary.next_assessment_id), (2, 2, None))
+        self.assertEqual(PatientProtocolSummary.objects.get(protocol=self.protocol).completed_session_count, 1)
+
+        # Re-importing replaces the ordering in one transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_protocol('Baseline', [{'name': 'Digit Span'}, {'name': 'Stroop'}])
+        summary = self.summary()
+        self.assertEqual((summary.expected_count, summary.completed_count), (2, 1))
+        self.assertEqual(summary.completed_assessment_ids, [self.assessments['Stroop'].id])
+        self.assertEqual(summary.next_assessment_id, self.assessments['Digit Span'].id)
+        self.assertEqual(PatientProtocolSummary.objects.get(protocol=self.protocol).completed_session_count, 0)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class SummaryBatchMiddlewareTests(TransactionTestCase):
+    def test_request_refreshes_each_session_once(self):
+        session = make_session()
+        assessment = Assessment.objects.create(name='Stroop')
+
+        def view(request):
+            # Autocommit writes, as in a view without ATOMIC_REQUESTS
+            run = AssessmentRun.objects.create(session=session, assessment=assessment)
+            for index in range(5):
+                Metric.objects.create(run=run, key=f'k{index}', value_float=index)
+            return HttpResponse()
+
+        with mock.patch.object(summaries, 'refresh_session', wraps=summaries.refresh_session) as refresh:
+            SummaryBatchMiddleware(view)(RequestFactory().post('/'))
+        self.assertEqual(refresh.call_count, 1)
+        summary = SessionSummary.objects.get(session=session)
+        self.assertEqual((summary.run_count, summary.metric_count), (1, 5))
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class ExportTests(TestCase):
+    def setUp(self):
+        protocol = Protocol.objects.create(name='Baseline')
+        stroop, flanker = Assessment.objects.create(name='Stroop'), Assessment.objects.create(name='Flanker')
+        day = timezone.make_aware(datetime.datetime(2024, 3, 1, 9))
+        for index, (site, assessment) in enumerate([('Boston', stroop), ('Boston', flanker), ('Denver', stroop)]):
+            session = make_session(f'P-{index}', site=site, protocol=protocol)
+            Session.objects.filter(id=session.id).update(start_time=day + datetime.timedelta(days=index))
+            run = AssessmentRun.objects.create(session=session, assessment=assessment)
+            Metric.objects.create(run=run, key='score', value_float=index + 0.5)
+
+    def get(self, path, **params):
+        response = self.client.get(f'/mindtrace/api/export/{path}', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, body = self.get('metrics.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([row['patient_external_id'] for row in rows], ['P-0', 'P-1', 'P-2'])
+        self.assertEqual(rows[0]['assessment'], 'Stroop')
+        self.assertEqual(rows[2]['value_float'], '2.5')
+        self.assertEqual(rows[0]['session_start_time'], '2024-03-01T09:00:00+00:00')
+
+    def test_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        _, body = self.get('runs.parquet', chunk_size=1)
+        parquet = pq.ParquetFile(io.BytesIO(body))
+        # One row group per chunk
+        self.assertEqual(parquet.num_row_groups, 3)
+        self.assertEqual(parquet.read().column('site').to_pylist(), ['Boston', 'Boston', 'Denver'])
+
+    def test_filters(self):
+        def sessions(**filters):
+            return [row[1] for chunk in exports.iter_rows('sessions', filters) for row in chunk]
+
+        self.assertEqual(sessions(site='Boston'), ['P-0', 'P-1'])
+        self.assertEqual(sessions(assessment='Stroop'), ['P-0', 'P-2'])
+        self.assertEqual(sessions(protocol='Baseline', date_from='2024-03-02'), ['P-1', 'P-2'])
+        # A bare date_to includes the whole day
+        self.assertEqual(sessions(date_to='2024-03-02'), ['P-0', 'P-1'])
+        self.assertEqual(sessions(date_to='2024-03-02T08:00:00Z'), ['P-0'])
+        self.assertEqual(sessions(protocol='Other'), [])
+
+        response = self.client.get('/mindtrace/api/export/sessions.csv', {'date_from': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/mindtrace/api/export/users.csv').status_code, 400)
+
+    def test_streams_one_chunk_at_a_time(self):
+        stats = exports.ExportStats()
+        stream = exports.stream_export('metrics', 'ndjson', chunk_size=2, stats=stats)
+        first = next(stream)
+        self.assertEqual((first.count('\n'), stats.rows), (2, 2))
+        self.assertEqual(len(list(stream)), 1)
+        self.assertEqual(stats.rows, 3)
+        self.assertIsNotNone(stats.finished)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            importers.import_protocol('Baseline', [{'name': 'Stroop'}])
+            self.session = make_session(protocol=Protocol.objects.get(name='Baseline'))
+            run = AssessmentRun.objects.create(session=self.session, assessment=Assessment.objects.get())
+            Metric.objects.create(run=run, key='score', value_float=1.5)
+
+    async def test_payloads_match_sync_views(self):
+        client = AsyncClient()
+        paths = [
+            f'/mindtrace/api/sessions/{self.session.id}/',
+            f'/mindtrace/api/sessions/{self.session.id}/summary/',
+            f'/mindtrace/api/patients/{self.session.patient_id}/summaries/',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                response = await client.get(path.replace('/api/', '/api/async/'))
+                expected = await client.get(path)
+                self.assertEqual(response.status_code, 200)
+                # Same encoder: datetimes keep their microseconds
+                self.assertEqual(response.content, expected.content)
+
+    async def test_patient_crud(self):
+        client = AsyncClient()
+        url = '/mindtrace/api/async/patients/'
+        created = await client.post(url, {'external_id': 'P-2'}, content_type='application/json')
+        self.assertEqual(created.status_code, 201)
+        duplicate = await client.post(url, {'external_id': 'P-2'}, content_type='application/json')
+        self.assertEqual(duplicate.status_code, 400)
+        pk = created.json()['id']
+        patched = await client.patch(f'{url}{pk}/', {'name': 'Ada'}, content_type='application/json')
+        self.assertEqual(patched.json()['name'], 'Ada')
+        page = (await client.get(url, {'offset': 1, 'limit': 1})).json()
+        self.assertEqual([patient['external_id'] for patient in page], ['P-2'])
+        self.assertEqual((await client.delete(f'{url}{pk}/')).status_code, 204)
+        self.assertEqual((await client.get(f'{url}{pk}/')).status_code, 404)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class GenerateDatasetTests(TestCase):
+    def setUp(self):
+        importers.import_protocol('Baseline', [{'name': name} for name in ('Stroop', 'Flanker', 'Digit Span')])
+
+    def generate(self, **options):
+        call_command('generate_dataset', users=30, patients=12, seed=5, raw=True, stdout=io.StringIO(), **options)
+
+    def metrics(self):
+        return list(Metric.objects.order_by('id').values_list('run__session__patient__external_id', 'key',
+                                                              'value_int', 'value_float'))
+
+    def indexed(self, kind):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM search_fts_{kind}')
+            return cursor.fetchone()[0]
+
+    def test_data_does_not_depend_on_batch_size(self):
+        self.generate(batch_size=7)
+        small = self.metrics()
+        self.generate(batch_size=5000, flush=True)
+        self.assertTrue(small)
+        self.assertEqual(self.metrics(), small)
+
+    def test_flush_cleans_up_derived_rows(self):
+        self.generate()
+        self.assertEqual((self.indexed('users'), self.indexed('patients')), (30, 12))
+        self.assertEqual(UserChange.objects.filter(action='create').count(), 30)
+        summaries.rebuild()
+
+        call_command('generate_dataset', flush=True, stdout=io.StringIO())
+        for model in (User, Patient, Session, AssessmentRun, Metric, SessionSummary, PatientProtocolSummary, RawBlob):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertEqual((self.indexed('users'), self.indexed('patients')), (0, 0))
+        self.assertEqual(UserChange.objects.filter(action='delete').count(), 30)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class IngestSessionsTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(MINDTRACE_IMPORT_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        importers.import_protocol('Baseline', [{'name': 'Stroop'}, {'name': 'Flanker'}])
+        Patient.objects.create(external_id='P-1', name='Ada Lovelace')
+
+    def write(self, lines):
+        with open(os.path.join(self.root, 'sessions.jsonl'), 'w') as f:
+            f.write('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines) + '\n')
+
+    def session(self, patient, day, **fields):
+        return {
+            'patient': patient, 'protocol': 'Baseline', 'start_time': f'2025-03-{day:02d}T09:30:00Z', 'site': 'Boston',
+            'runs': [
+                {'assessment': 'Stroop', 'raw': {'responses': [day]}, 'metrics': {'accuracy': 0.9, 'errors': day}},
+                {'assessment': 'Flanker', 'metrics': {'note': 'ok'}},
+            ],
+            **fields,
+        }
+
+    def run_job(self, **params):
+        job = queue.enqueue('ingest_sessions', {'path': 'sessions.jsonl', **params}, max_attempts=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            worker.run_worker('w1', once=True)
+        job.refresh_from_db()
+        return job
+
+    def test_ingests_sessions_runs_and_metrics(self):
+        self.write([
+            self.session('P-1', 1),
+            self.session('P-2', 2, patient_name='Grace Hopper', operator='jd'),
+            '{not json',
+            self.session('P-3', 3, protocol='Unknown'),
+            '',
+            self.session('P-4', 4, runs=[{'assessment': 'Nope'}]),
+        ])
+        job = self.run_job(chunk_size=2)
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(job.result['created'], {'patients': 1, 'sessions': 2, 'runs': 4, 'metrics': 6})
+        self.assertEqual([message.split(':')[0] for message in job.result['skipped']], ['line 3', 'line 4', 'line 6'])
+        # Failed lines create no patients
+        self.assertFalse(Patient.objects.filter(external_id__in=['P-3', 'P-4']).exists())
+
+        session = Session.objects.get(patient__external_id='P-2')
+        self.assertEqual((session.operator, session.protocol.name), ('jd', 'Baseline'))
+        run = session.assessment_runs.get(assessment__name='Stroop')
+        self.assertEqual(run.raw, {'responses': [2]})
+        self.assertEqual(
+            {m.key: (m.value_int, m.value_float, m.value_text) for m in Metric.objects.filter(run__session=session)},
+            {'accuracy': (None, 0.9, ''), 'errors': (2, None, ''), 'note': (None, None, 'ok')},
+        )
+        self.assertEqual(SessionSummary.objects.get(session=session).run_count, 2)
+        self.assertEqual([hit.label for hit in search('patients', 'grace hopper')[0]], ['P-2 Grace Hopper'])
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        self.write([self.session(f'P-{index}', index) for index in range(1, 6)])
+        ingest_chunk = ingest.ingest_chunk
+        calls = []
+
+        def crash_on_second_chunk(lines):
+            calls.append(lines[0][0])
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return ingest_chunk(lines)
+
+        with mock.patch.object(ingest, 'ingest_chunk', side_effect=crash_on_second_chunk):
+            with self.assertLogs('jobs.worker', 'ERROR'):
+                job = self.run_job(chunk_size=2)
+            self.assertEqual(job.status, Job.STATUS_QUEUED)
+            self.assertEqual(job.checkpoint['line'], 2)
+            Job.objects.filter(id=job.id).update(run_after=timezone.now())
+            worker.run_worker('w1', once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(calls, [1, 3, 3, 5])
+        self.assertEqual(job.result['created']['sessions'], 5)
+        self.assertEqual(Session.objects.count(), 5)
+
+    def test_params_are_validated(self):
+        for params in ({'path': '../outside.jsonl'}, {'path': 'sessions.jsonl', 'chunk_size': 0}, {}):
+            with self.subTest(params=params), self.assertRaises(InvalidParams):
+                queue.enqueue('ingest_sessions', params)
+
+
+def refcounts():
+    return dict(RawBlob.objects.values_list('digest', 'refcount'))
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(MINDTRACE_ARCHIVE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        assessment = Assessment.objects.create(name='Stroop')
+        self.sessions = []
+        for index in range(2):
+            session = make_session(f'P-{index}')
+            Session.objects.filter(id=session.id).update(start_time=timezone.now() - datetime.timedelta(days=1000))
+            run = AssessmentRun.objects.create(
+                session=session, assessment=assessment,
+                raw={'config': {'trials': 24}, 'responses': [index, 1, 2]},
+            )
+            Metric.objects.create(run=run, key='score', value_int=10 + index)
+            self.sessions.append(session)
+        self.before = refcounts()
+
+    def archive(self):
+        totals = archive.archive_sessions(timezone.now())
+        self.assertEqual(totals['sessions'], 2)
+        return ArchiveSegment.objects.get()
+
+    def test_round_trip(self):
+        segment = self.archive()
+        self.assertFalse(AssessmentRun.objects.exists())
+        self.assertFalse(Metric.objects.exists())
+        # Archived runs keep their blob references
+        self.assertEqual(refcounts(), self.before)
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+        self.assertEqual(archive.restore_segment(segment), {'runs': 2, 'metrics': 2})
+        self.assertFalse(Session.objects.filter(archive_segment__isnull=False).exists())
+        self.assertEqual(
+            sorted(run.raw['responses'][0] for run in AssessmentRun.objects.all()), [0, 1],
+        )
+        self.assertEqual(sorted(Metric.objects.values_list('value_int', flat=True)), [10, 11])
+        self.assertEqual(refcounts(), self.before)
+
+    def test_deleted_session_is_skipped_and_released(self):
+        segment = self.archive()
+        deleted = self.sessions[0]
+        deleted.delete()
+        # Shared config blob loses one reference, the deleted run's responses blob is gone
+        self.assertEqual(sum(refcounts().values()), sum(self.before.values()) - 2)
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+        self.assertEqual(archive.restore_segment(segment), {'runs': 1, 'metrics': 1})
+        self.assertEqual(list(AssessmentRun.objects.values_list('session_id', flat=True)), [self.sessions[1].id])
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+    def test_segment_removed_with_its_last_session(self):
+        segment = self.archive()
+        path = archive.archive_dir() / segment.path
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.all().delete()
+        self.assertFalse(ArchiveSegment.objects.exists())
+        self.assertFalse(path.exists())
+        self.assertFalse(RawBlob.objects.exists())
+
+    def test_norm_rebuild_reads_archived_metrics(self):
+        self.archive()
+        norms.rebuild()
+        table = NormTable.objects.get(key='score', stratum_type=NormTable.STRATUM_ALL)
+        self.assertEqual(list(norms.unpack(table.values)), [10.0, 11.0])
+        self.assertEqual(NormTable.objects.get(key='score', stratum='Boston').count, 2)
+
+    def test_exports_include_archived_rows(self):
+        self.archive()
+        # A metric saved after archiving stays hot and comes first
+        run = AssessmentRun.objects.create(session=self.sessions[0], assessment=Assessment.objects.get(name='Stroop'))
+        Metric.objects.create(run=run, key='score', value_int=12)
+
+        def rows(dataset, **filters):
+            return [row for chunk in exports.iter_rows(dataset, filters) for row in chunk]
+
+        self.assertEqual([row[9] for row in rows('metrics')], [12, 10, 11])
+        self.assertEqual([row[5] for row in rows('runs', assessment='Stroop')], ['Stroop'] * 3)
+        self.assertEqual(len(rows('metrics', site='Boston', assessment='Stroop')), 3)
+        self.assertEqual(rows('metrics', site='Elsewhere'), [])
+        self.assertEqual(rows('runs', assessment='Flanker'), [])
+        # Each session once, whether its matching run is hot or archived
+        self.assertEqual(sorted(row[0] for row in rows('sessions', assessment='Stroop')),
+                         sorted(session.id for session in self.sessions))
+
+    def test_batch_without_live_sessions_is_skipped(self):
+        ids = [session.id for session in self.sessions]
+        Session.objects.filter(id__in=ids).delete()
+        self.assertIsNone(archive._archive_batch(ids))
+        self.assertFalse(ArchiveSegment.objects.exists())
+        self.assertEqual(list(archive.archive_dir().glob('*')), [])
+
+    def test_segment_is_written_in_the_delete_transaction(self):
+        depths = {}
+        write_segment, delete_ids = archive.write_segment, archive._delete_ids
+
+        def record(name, fn):
+            def wrapper(*args):
+                depths.setdefault(name, len(connection.savepoint_ids))
+                return fn(*args)
+            return wrapper
+
+        depth = len(connection.savepoint_ids)
+        with mock.patch.object(archive, 'write_segment', record('write', write_segment)), \
+                mock.patch.object(archive, '_delete_ids', record('delete', delete_ids)):
+            self.archive()
+        # Rows edited after the file was written cannot be deleted unseen
+        self.assertEqual(depths['write'], depths['delete'])
+        self.assertGreater(depths['write'], depth)
+
+
+@override_settings(MINDTRACE_NORM_REFRESH_DELAY=None)
+class RawStoreTests(TestCase):
+    def setUp(self):
+        self.session = make_session()
+        self.assessment = Assessment.objects.create(name='Stroop')
+
+    def make_run(self, responses):
+        return AssessmentRun.objects.create(
+            session=self.session, assessment=self.assessment,
+            raw={'config': {'trials': 24}, 'responses': responses},
+        )
+
+    def test_shared_values_are_stored_once(self):
+        first, second = self.make_run([1, 2]), self.make_run([3, 4])
+        config_digest = first.raw_manifest['config']
+        self.assertEqual(second.raw_manifest['config'], config_digest)
+        self.assertEqual(refcounts()[config_digest], 2)
+        self.assertEqual(AssessmentRun.objects.get(id=second.id).raw['responses'], [3, 4])
+
+        first.delete()
+        self.assertEqual(refcounts()[config_digest], 1)
+        self.assertNotIn(first.raw_manifest['responses'], refcounts())
+
+    def test_replacing_raw_releases_old_blobs(self):
+        run = self.make_run([1, 2])
+        old = run.raw_manifest['responses']
+        run.raw = {'config': {'trials': 24}, 'responses': [5]}
+        run.save()
+        self.assertNotIn(old, refcounts())
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+    def test_acquire_upserts_each_digest_in_one_statement(self):
+        run = self.make_run([1, 2])
+        config = run.raw_manifest['config']
+        blobs = {digest: (blob.data, blob.size) for digest, blob in RawBlob.objects.in_bulk().items()}
+        # A release deleted one blob after its payload was read
+        RawBlob.objects.filter(digest=config).delete()
+        counts = {digest: 2 for digest in blobs}
+        with CaptureQueriesContext(connection) as queries:
+            rawstore.acquire(blobs, counts)
+        writes = [q['sql'] for q in queries if 'rawblob' in q['sql'].lower()]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('ON CONFLICT', writes[0])
+        self.assertEqual(refcounts()[config], 2)
+        self.assertEqual(refcounts()[run.raw_manifest['responses']], 3)
+
+    def test_refresh_from_db_drops_unsaved_raw(self):
+        run = self.make_run([1, 2])
+        run.raw = {'responses': [9]}
+        run.refresh_from_db()
+        self.assertEqual(run.raw['responses'], [1, 2])
+        run.save()
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+    def test_refresh_from_db_reloads_raw_saved_elsewhere(self):
+        run = self.make_run([1, 2])
+        self.assertEqual(run.raw['responses'], [1, 2])
+        other = AssessmentRun.objects.get(id=run.id)
+        other.raw = {'responses': [3]}
+        other.save()
+        run.refresh_from_db(fields=['raw'])
+        self.assertEqual(run.raw, {'responses': [3]})
+        run.raw = {'responses': [4]}
+        run.save()
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+    def test_loading_deferred_manifest_keeps_assigned_raw(self):
+        run = self.make_run([1, 2])
+        run = AssessmentRun.objects.only('id').get(id=run.id)
+        run.raw = {'responses': [5]}
+        self.assertIsNotNone(run.raw_manifest)
+        run.save()
+        self.assertEqual(AssessmentRun.objects.get(id=run.id).raw, {'responses': [5]})
+        self.assertEqual(rawstore.recount()['corrected'], 0)
+
+    def test_deferred_releases_once_on_success(self):
+        for index in range(3):
+            self.make_run([index])
+        with rawstore.deferred():
+            AssessmentRun.objects.all().delete()
+            # Nothing released until the block exits
+            self.assertEqual(len(refcounts()), 4)
+        self.assertFalse(RawBlob.objects.exists())
+
+    def test_deferred_keeps_blobs_when_the_delete_rolls_back(self):
+        run = self.make_run([1, 2])
+        run_id, before = run.id, refcounts()
+        with self.assertRaises(RuntimeError):
+            with rawstore.deferred(), transaction.atomic():
+                run.delete()
+                raise RuntimeError('abort')
+        self.assertEqual(refcounts(), before)
+        self.assertEqual(AssessmentRun.objects.get(id=run_id).raw['responses'], [1, 2])
@@ -1,3 +1,17 @@
 from django.urls import path
+from . import async_views, views
 
-urlpatterns = []
+urlpatterns = [
+    path('api/sessions/<int:session_id>/', views.session_detail, name='mindtrace-session-detail'),
+    path('api/sessions/<int:session_id>/summary/', views.session_summary, name='mindtrace-session-summary'),
+    path('api/patients/<int:patient_id>/summaries/', views.patient_summaries, name='mindtrace-patient-summaries'),
+    path('api/export/<str:dataset>.<str:fmt>', views.export, name='mindtrace-export'),
+    path('api/norms/percentile/', views.percentile, name='mindtrace-norm-percentile'),
+
+    # Native async endpoints
+    path('api/async/patients/', async_views.patient_list, name='mindtrace-patient-list-async'),
+    path('api/async/patients/<int:pk>/', async_views.patient_detail, name='mindtrace-patient-detail-async'),
+    path('api/async/sessions/<int:session_id>/', async_views.session_detail, name='mindtrace-session-detail-async'),
+    path('api/async/sessions/<int:session_id>/summary/', async_views.session_summary, name='mindtrace-session-summary-async'),
+    path('api/async/patients/<int:patient_id>/summaries/', async_views.patient_summaries, name='mindtrace-patient-summaries-async'),
+]
@@ -0,0 +1,114 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from . import exports, norms, services
+from .models import PatientProtocolSummary, SessionSummary
+
+
+def _session_summary_data(summary):
+    return {
+        'session_id': summary.session_id,
+        'patient_id': summary.patient_id,
+        'protocol_id': summary.protocol_id,
+        'start_time': summary.start_time,
+        'run_count': summary.run_count,
+        'metric_count': summary.metric_count,
+        'expected_count': summary.expected_count,
+        'completed_count': summary.completed_count,
+        'is_complete': summary.is_complete,
+        'completed_assessment_ids': summary.completed_assessment_ids,
+        'next_assessment_id': summary.next_assessment_id,
+        'key_scores': summary.key_scores,
+        'last_run_at': summary.last_run_at,
+        'updated_at': summary.updated_at,
+    }
+
+
+@api_view(['GET'])
+def session_summary(request, session_id):
+    """Dashboard row for one session (single-row lookup)"""
+    summary = get_object_or_404(SessionSummary, session_id=session_id)
+    return Response(_session_summary_data(summary))
+
+
+def _patient_summary_data(row):
+    return {
+        'patient_id': row.patient_id,
+        'protocol_id': row.protocol_id,
+        'session_count': row.session_count,
+        'completed_session_count': row.completed_session_count,
+        'run_count': row.run_count,
+        'first_session_at': row.first_session_at,
+        'last_session_at': row.last_session_at,
+        'latest_session_id': row.latest_session_id,
+        'latest_key_scores': row.latest_key_scores,
+    }
+
+
+@api_view(['GET'])
+def patient_summaries(request, patient_id):
+    """Per-protocol roll-ups for one patient"""
+    rows = PatientProtocolSummary.objects.filter(patient_id=patient_id).order_by('protocol_id')
+    return Response([_patient_summary_data(row) for row in rows])
+
+
+@api_view(['GET'])
+def session_detail(request, session_id):
+    """Session with its runs and metrics"""
+    payload = services.session_detail(session_id)
+    if payload is None:
+        raise Http404
+    return Response(payload)
+
+
+@api_view(['GET'])
+def percentile(request):
+    """Percentile ranks of one value against the norm tables.
+    Query params: assessment, key, value, site, protocol.
+    """
+    try:
+        assessment_id = int(request.GET['assessment'])
+        value = float(request.GET['value'])
+        protocol_id = int(request.GET['protocol']) if request.GET.get('protocol') else None
+    except (KeyError, ValueError):
+        return Response({'error': 'assessment and value are required numbers; protocol is an id'}, status=400)
+    key = request.GET.get('key', '')
+    if not key:
+        return Response({'error': 'key is required'}, status=400)
+    return Response({
+        'assessment_id': assessment_id,
+        'key': key,
+        'value': value,
+        'percentiles': norms.lookup(assessment_id, key, value, request.GET.get('site', ''), protocol_id),
+    })
+
+
+@require_GET
+def export(request, dataset, fmt):
+    """Stream sessions/runs/metrics as CSV, NDJSON or Parquet.
+    Query params: protocol, site, assessment, date_from, date_to, chunk_size.
+    """
+    filters = {
+        key: request.GET.get(key)
+        for key in ('protocol', 'site', 'assessment', 'date_from', 'date_to')
+    }
+    try:
+        chunk_size = int(request.GET.get('chunk_size') or exports.DEFAULT_CHUNK_SIZE)
+        if chunk_size <= 0:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': 'chunk_size must be a positive integer'}, status=400)
+    try:
+        stream = exports.stream_export(dataset, fmt, filters, chunk_size=chunk_size)
+    except exports.ExportError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    if isinstance(request, ASGIRequest):
+        stream = exports.achunks(stream)
+
+    response = StreamingHttpResponse(stream, content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
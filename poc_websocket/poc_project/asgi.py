@@ -4,18 +4,23 @@ ASGI config for poc_project project.
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from user_app.routing import websocket_urlpatterns
+from channels.routing import ProtocolTypeRouter
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'poc_project.settings')
 
+# Set up Django (apps, settings) before anything imports models or consumers
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import URLRouter  # noqa: E402
+from jobs.routing import websocket_urlpatterns as job_urlpatterns  # noqa: E402
+from user_app.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
-            websocket_urlpatterns
+            websocket_urlpatterns + job_urlpatterns
         )
     ),
 })
-
@@ -0,0 +1,54 @@
+"""
+Helpers shared by the native async JSON views (user_app/async_views.py,
+mindtrace/async_views.py).
+"""
+
+import json
+from functools import wraps
+
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from rest_framework.renderers import JSONRenderer
+
+_renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    """JSON response encoded by DRF's renderer, so async endpoints return the
+    same bytes as their @api_view counterparts (e.g. datetimes keep their
+    microseconds, which DjangoJSONEncoder would truncate)."""
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def async_api_view(methods):
+    """Async counterpart of DRF's @api_view for plain JSON views.
+    Restricts methods, parses JSON bodies into request.data, exempts CSRF
+    (as DRF does for unauthenticated requests) and maps Http404 to JSON.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            request.data = {}
+            if request.body:
+                try:
+                    request.data = json.loads(request.body)
+                except ValueError as exc:
+                    return json_response({'detail': f'JSON parse error - {exc}'}, status=400)
+                if not isinstance(request.data, dict):
+                    return json_response({'detail': 'Expected a JSON object.'}, status=400)
+            try:
+                return await view(request, *args, **kwargs)
+            except Http404:
+                return json_response({'detail': 'Not found.'}, status=404)
+
+        inner.csrf_exempt = True
+        return inner
+    return decorator
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404
@@ -0,0 +1,128 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the primary ('default'). Reads go to a replica
+(settings.DATABASE_REPLICAS, see settings.py) unless the current context is
+pinned to the primary, which happens:
+
+- for the whole of a request with an unsafe method (POST/PUT/PATCH/DELETE),
+- for requests arriving within DB_STICKY_SECONDS of a write by the same
+  client (a cookie set by ReplicaRoutingMiddleware), so a refetch right
+  after an edit does not see replica lag,
+- after the first write in the current context (a management command, a
+  task, an on_commit callback), and inside transactions on the primary,
+- explicitly, with `with use_primary():` around read-after-write critical code.
+
+Without replicas configured every read goes to the primary, as before.
+"""
+
+import contextlib
+import contextvars
+import itertools
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_pinned = contextvars.ContextVar('db_pinned_primary', default=False)
+_round_robin = itertools.count()
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def is_pinned() -> bool:
+    return _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def pin_primary():
+    """Send the rest of the current context's reads to the primary."""
+    _pinned.set(True)
+
+
+@contextlib.contextmanager
+def use_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Database router: writes and pinned reads to the primary, other reads
+    round-robin across the replicas."""
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or is_pinned():
+            return DEFAULT_DB_ALIAS
+        return replicas[next(_round_robin) % len(replicas)]
+
+    def db_for_write(self, model, **hints):
+        # Reads after a write in the same context must see it
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold copies of the primary, so any pairing is valid
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication (or sync_replica)
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Pins requests to the primary for writes and for DB_STICKY_SECONDS
+    after a client's last write."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sticky_seconds = getattr(settings, 'DB_STICKY_SECONDS', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _pinned.set(self._needs_primary(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._mark_sticky(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(self._needs_primary(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._mark_sticky(request, response)
+
+    def _needs_primary(self, request) -> bool:
+        if request.method not in SAFE_METHODS:
+            return True
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _mark_sticky(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and self.sticky_seconds > 0:
+            response.set_cookie(
+                STICKY_COOKIE,
+                f'{time.time() + self.sticky_seconds:.3f}',
+                max_age=self.sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,415 @@
+"""
+In-process performance instrumentation.
+
+- InstrumentationMiddleware: per-request latency, query count and DB time
+  per view (sync and async requests).
+- A database execute wrapper, installed on every connection, that feeds
+  the per-request stats and (when PERF_QUERY_DETECTOR is on) logs slow
+  queries and N+1 patterns.
+- InstrumentedConsumerMixin: connection gauge, messages in/out and
+  group_send latency for WebSocket consumers.
+- metrics_view: everything above in the Prometheus text format. It has no
+  login: only clients in PERF_METRICS_ALLOWED_IPS and staff users may
+  scrape it, everyone else gets a 403.
+
+Metrics live in the memory of each worker process; scrape each worker
+separately (or run one worker) to get per-process numbers.
+
+Settings:
+    PERF_INSTRUMENTATION     enable request/query collection (default True)
+    PERF_QUERY_DETECTOR      log slow queries and N+1 patterns (default False)
+    PERF_SLOW_QUERY_MS       slow query threshold in ms (default 100)
+    PERF_NPLUSONE_THRESHOLD  identical statements per request that count as N+1 (default 10)
+    PERF_METRICS_ALLOWED_IPS client addresses allowed to read /metrics (default loopback only)
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter as _Tally
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+# ---- metric types ----
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly (inc/dec/set) or computed at scrape time (set_function)."""
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], Optional[float]]] = None
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        self._function = function
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        lines = self.header()
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                logger.exception("gauge %s callback failed", self.name)
+                value = None
+            if value is not None:
+                lines.append(f'{self.name} {value}')
+            return lines
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels) -> int:
+        row = self._values.get(self._key(labels))
+        return row[-1] if row else 0
+
+    def collect(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            for i, bound in enumerate(self.buckets):
+                le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{le} {row[i]}')
+            inf = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{inf} {row[-1]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {row[-2]}')
+            lines.append(f'{self.name}_count{labels} {row[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by view, method and status', ('view', 'method', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ('view',))
+HTTP_QUERIES = Histogram('http_request_db_queries', 'Database queries per HTTP request', ('view',), buckets=COUNT_BUCKETS)
+HTTP_DB_TIME = Histogram('http_request_db_seconds', 'Database time per HTTP request', ('view',))
+SERIALIZER_TIME = Histogram('serializer_duration_seconds', 'Time spent producing serializer .data', ('serializer',))
+SLOW_QUERIES = Counter('db_slow_queries_total', 'Queries slower than PERF_SLOW_QUERY_MS', ('view',))
+NPLUSONE = Counter('db_nplusone_total', 'Requests with a repeated statement above PERF_NPLUSONE_THRESHOLD', ('view',))
+
+WS_CONNECTIONS = Gauge('ws_connections', 'Open WebSocket connections', ('consumer',))
+WS_MESSAGES_IN = Counter('ws_messages_received_total', 'WebSocket messages received from clients', ('consumer',))
+WS_MESSAGES_OUT = Counter('ws_messages_sent_total', 'WebSocket messages sent to clients', ('consumer',))
+WS_GROUP_SEND = Histogram('channel_layer_group_send_seconds', 'group_send latency', ('group',))
+CHANNEL_QUEUE_DEPTH = Gauge('channel_layer_queue_depth', 'Messages waiting in the in-memory channel layer')
+
+
+def _channel_queue_depth():
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    queues = getattr(layer, 'channels', None)
+    if not isinstance(queues, dict):
+        # Redis layer: depth lives in Redis, not in this process
+        return None
+    return sum(q.qsize() for q in list(queues.values()))
+
+
+CHANNEL_QUEUE_DEPTH.set_function(_channel_queue_depth)
+
+
+# ---- per-request query tracking ----
+
+class RequestStats:
+    __slots__ = ('request', 'queries', 'db_time', 'statements')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = _Tally()
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar('perf_request_stats', default=None)
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def _detector_enabled() -> bool:
+    return getattr(settings, 'PERF_QUERY_DETECTOR', False)
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.queries += 1
+        stats.db_time += elapsed
+        if _detector_enabled():
+            stats.statements[_IN_LIST.sub('IN (...)', sql)] += 1
+            threshold = getattr(settings, 'PERF_SLOW_QUERY_MS', 100) / 1000
+            if elapsed >= threshold:
+                view = _view_name(stats.request)
+                SLOW_QUERIES.inc(view=view)
+                logger.warning("Slow query (%.1f ms) in %s: %s", elapsed * 1000, view, sql)
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    if _query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_wrapper)
+
+
+connection_created.connect(_install_wrapper, dispatch_uid='perf_query_wrapper')
+
+
+# Label for requests no URL pattern matched (404s); the raw path would let
+# any client create new label values
+UNRESOLVED_VIEW = '<unresolved>'
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def _view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED_VIEW
+    return match.view_name or match._func_path
+
+
+def _method(request) -> str:
+    return request.method if request.method in KNOWN_METHODS else 'OTHER'
+
+
+def _begin(request):
+    stats = RequestStats(request)
+    return stats, _current.set(stats), time.perf_counter()
+
+
+def _finish(request, response, stats, token, started):
+    elapsed = time.perf_counter() - started
+    _current.reset(token)
+    view = _view_name(request)
+    HTTP_REQUESTS.inc(view=view, method=_method(request), status=getattr(response, 'status_code', 500))
+    HTTP_LATENCY.observe(elapsed, view=view)
+    HTTP_QUERIES.observe(stats.queries, view=view)
+    HTTP_DB_TIME.observe(stats.db_time, view=view)
+    if _detector_enabled() and stats.statements:
+        sql, repeats = stats.statements.most_common(1)[0]
+        if repeats >= getattr(settings, 'PERF_NPLUSONE_THRESHOLD', 10):
+            NPLUSONE.inc(view=view)
+            logger.warning("Possible N+1 in %s: statement ran %d times: %s", view, repeats, sql)
+
+
+class InstrumentationMiddleware:
+    """Records latency, query count and DB time for every request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PERF_INSTRUMENTATION', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        stats, token, started = _begin(request)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            _finish(request, response, stats, token, started)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        stats, token, started = _begin(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            _finish(request, response, stats, token, started)
+
+
+# ---- timing helpers ----
+
+class timed:
+    """Context manager observing elapsed seconds into a histogram."""
+
+    def __init__(self, histogram: Histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class InstrumentedConsumerMixin:
+    """Mix into an AsyncWebsocketConsumer (before the base class) to record
+    connections, messages in/out and group_send latency."""
+
+    def _metric_label(self):
+        return type(self).__name__
+
+    async def websocket_connect(self, message):
+        WS_CONNECTIONS.inc(consumer=self._metric_label())
+        self._counted_connection = True
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        if getattr(self, '_counted_connection', False):
+            self._counted_connection = False
+            WS_CONNECTIONS.dec(consumer=self._metric_label())
+        await super().websocket_disconnect(message)
+
+    async def websocket_receive(self, message):
+        WS_MESSAGES_IN.inc(consumer=self._metric_label())
+        await super().websocket_receive(message)
+
+    async def send(self, *args, **kwargs):
+        WS_MESSAGES_OUT.inc(consumer=self._metric_label())
+        await super().send(*args, **kwargs)
+
+    async def group_send(self, group, message):
+        with timed(WS_GROUP_SEND, group=group):
+            await self.channel_layer.group_send(group, message)
+
+
+def _may_scrape(request) -> bool:
+    allowed = getattr(settings, 'PERF_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') in allowed:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's metrics"""
+    if not _may_scrape(request):
+        return HttpResponseForbidden('Forbidden\n', content_type='text/plain')
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+TARGETS = {
+    # What each target does in a fresh interpreter
+    "setup": "import django; django.setup()",
+    "asgi": "import poc_project.asgi",
+    "urls": "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns",
+}
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)$")
+
+_PROBE = """
+import time, json
+started = time.perf_counter()
+{code}
+print(json.dumps({{"wall": time.perf_counter() - started}}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Report per-module import cost of starting the project in a fresh interpreter\n"
+        "(python -X importtime). Compare settings profiles with --settings-module, e.g.\n"
+        "  manage.py profile_startup --target setup --settings-module poc_project.settings "
+        "--settings-module poc_project.settings_cli"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            choices=sorted(TARGETS),
+            default="asgi",
+            help="What to time: django.setup(), importing the ASGI app, or loading the URLconf (default: asgi)",
+        )
+        parser.add_argument(
+            "--settings-module",
+            action="append",
+            dest="settings_modules",
+            help="DJANGO_SETTINGS_MODULE to profile (repeatable, default: current settings)",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="Number of modules/packages to list (default: 20)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Runs per profile; wall time is the median (default: 3)",
+        )
+
+    def handle(self, *args, **options):
+        modules = options.get("settings_modules") or [os.environ.get("DJANGO_SETTINGS_MODULE") or settings.SETTINGS_MODULE]
+        for module in modules:
+            self._profile(module, options["target"], options["top"], max(1, options["repeat"]))
+
+    def _run(self, settings_module, target):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _PROBE.format(code=TARGETS[target])],
+            cwd=str(settings.BASE_DIR),
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            tail = "\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:"))[-2000:]
+            raise CommandError(f"Profiling {settings_module} failed:\n{tail}")
+        wall = json.loads(proc.stdout.strip().splitlines()[-1])["wall"]
+        return wall, proc.stderr.splitlines()
+
+    def _profile(self, settings_module, target, top, repeat):
+        runs = [self._run(settings_module, target) for _ in range(repeat)]
+        walls = [wall for wall, _ in runs]
+
+        # Use the fastest run's breakdown (least disturbed by the OS)
+        lines = min(runs, key=lambda r: r[0])[1]
+        cumulative = []
+        by_package = defaultdict(int)
+        module_count = 0
+        for line in lines:
+            match = _LINE.match(line)
+            if not match:
+                continue
+            self_us, cum_us, name = int(match[1]), int(match[2]), match[3]
+            module_count += 1
+            by_package[name.split(".")[0]] += self_us
+            cumulative.append((cum_us, self_us, name))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{settings_module} [{target}]"))
+        self.stdout.write(
+            f"  wall time: median {statistics.median(walls) * 1000:.0f} ms "
+            f"(min {min(walls) * 1000:.0f}, max {max(walls) * 1000:.0f}) over {repeat} run(s)"
+        )
+        self.stdout.write(f"  modules imported: {module_count}")
+        self.stdout.write("  top packages by import time (self, summed):")
+        for pkg, us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+            self.stdout.write(f"    {us / 1000:8.1f} ms  {pkg}")
+        self.stdout.write("  top modules by cumulative import time:")
+        for cum_us, self_us, name in sorted(cumulative, reverse=True)[:top]:
+            self.stdout.write(f"    {cum_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f})  {name}")
@@ -0,0 +1,29 @@
+"""
+DRF serializer base classes that report .data timings to
+poc_project.instrumentation (serializer_duration_seconds).
+"""
+
+from rest_framework import serializers
+
+from .instrumentation import SERIALIZER_TIME, timed
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        if hasattr(self, '_data'):
+            return super().data
+        with timed(SERIALIZER_TIME, serializer=f'{type(self.child).__name__}[]'):
+            return super().data
+
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer whose first .data access is timed. For many=True, set
+    Meta.list_serializer_class = TimedListSerializer."""
+
+    @property
+    def data(self):
+        if hasattr(self, '_data'):
+            return super().data
+        with timed(SERIALIZER_TIME, serializer=type(self).__name__):
+            return super().data
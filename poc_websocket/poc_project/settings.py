@@ -2,6 +2,7 @@
 Django settings for poc_project project.
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,11 +31,17 @@ INSTALLED_APPS = [
     'channels',
     'rest_framework',
     'corsheaders',  # CORS for Electron app
+    'poc_project',  # project-wide management commands (profile_startup)
     'user_app',
     'mindtrace',
+    'search',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'poc_project.instrumentation.InstrumentationMiddleware',  # outermost, times the whole stack
+    'poc_project.db_router.ReplicaRoutingMiddleware',  # pins writes and recent writers to the primary
+    'mindtrace.middleware.SummaryBatchMiddleware',  # one summary refresh per session per request
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS - must be before CommonMiddleware
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -71,6 +78,12 @@ ASGI_APPLICATION = 'poc_project.asgi.application'
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {
+            # Per-channel bound: group_send skips channels that are full,
+            # and undelivered messages expire instead of piling up
+            'capacity': 1000,
+            'expiry': 30,
+        },
     },
 }
 
@@ -80,10 +93,69 @@ CHANNEL_LAYERS = {
 #         'BACKEND': 'channels_redis.core.RedisChannelLayer',
 #         'CONFIG': {
 #             "hosts": [('127.0.0.1', 6379)],
+#             "capacity": 1000,
+#             "expiry": 30,
 #         },
 #     },
 # }
 
+# Cache (user detail payloads, see user_app/cache.py)
+# locmem is per process: with several workers use Redis so write-through
+# updates and invalidations reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'poc-cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# For production with Redis, use:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     },
+# }
+
+# Seconds a cached user payload lives; bounds staleness from writes that
+# bypass the API (bulk updates, raw SQL)
+USER_CACHE_TIMEOUT = 300
+
+# The user changes feed only serves entries older than this many seconds, so
+# concurrent transactions cannot commit a lower seq behind a client's token
+# (see user_app/changes.py; defaults to 0 on SQLite and 2 elsewhere)
+# USER_CHANGES_SETTLE_SECONDS = 2
+
+# Per-connection limits for UserUpdateConsumer (see user_app/consumers.py)
+USER_UPDATES_WS = {
+    'QUEUE_SIZE': 256,
+    'OVERFLOW_POLICY': 'snapshot',  # drop_oldest | snapshot | disconnect
+    'MAX_IN_FLIGHT': 1000,
+    'HEARTBEAT_INTERVAL': 20,
+}
+
+# Background jobs (see jobs/queue.py); run workers with `manage.py run_jobs`
+JOBS = {
+    'POLL_INTERVAL': 1.0,
+    'STALE_AFTER': 300,
+    'PROGRESS_INTERVAL': 0.5,
+    'RETRY_DELAY': 10,
+    # JobProgressConsumer polling; None = only with the in-memory channel layer
+    'WS_POLL_INTERVAL': None,
+}
+
+# Performance instrumentation (exposed at /metrics, see poc_project/instrumentation.py)
+PERF_INSTRUMENTATION = True
+# Slow-query/N+1 detector, safe to switch on in production via the environment
+PERF_QUERY_DETECTOR = os.environ.get('PERF_QUERY_DETECTOR', '') in ('1', 'true', 'yes')
+PERF_SLOW_QUERY_MS = int(os.environ.get('PERF_SLOW_QUERY_MS', '100'))
+PERF_NPLUSONE_THRESHOLD = int(os.environ.get('PERF_NPLUSONE_THRESHOLD', '10'))
+# /metrics has no login: scrapers must connect from one of these addresses (staff users may always read it)
+PERF_METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('PERF_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
 # Database
 DATABASES = {
     'default': {
@@ -92,6 +164,26 @@ DATABASES = {
     }
 }
 
+# Read replicas (see poc_project/db_router.py), comma-separated in DB_REPLICAS:
+# SQLite file paths for the sqlite3 engine (refresh them with
+# `manage.py sync_replica`), otherwise host[:port] of servers sharing the
+# primary's name and credentials. Unset: all reads go to the primary.
+DATABASE_REPLICAS = []
+for _i, _replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    _alias = f'replica{_i}'
+    DATABASES[_alias] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES[_alias]['NAME'] = BASE_DIR / _replica.strip()
+    else:
+        _host, _, _port = _replica.strip().partition(':')
+        DATABASES[_alias].update(HOST=_host, PORT=_port or DATABASES['default'].get('PORT', ''))
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['poc_project.db_router.PrimaryReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it writes
+DB_STICKY_SECONDS = int(os.environ.get('DB_STICKY_SECONDS', '5'))
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -141,6 +233,7 @@ CORS_ALLOW_ALL_ORIGINS = True  # For development - allows Electron to connect
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_HEADERS = ['*']
 CORS_ALLOW_METHODS = ['GET', 'POST', 'PATCH', 'DELETE', 'OPTIONS']
+CORS_EXPOSE_HEADERS = ['X-Changes-Token']  # user listing's changes-feed token
 
 # CSRF settings for Electron
 CSRF_TRUSTED_ORIGINS = ['http://localhost:*', 'http://127.0.0.1:*']
@@ -0,0 +1,35 @@
+"""
+Slim settings profile for CLI and batch jobs.
+
+Drops the apps and middleware that only matter when serving HTTP/WebSocket
+traffic (daphne pulls in Twisted, plus admin, DRF, channels, corsheaders),
+so short management commands start faster:
+
+    python manage.py import_protocols --settings=poc_project.settings_cli ...
+    DJANGO_SETTINGS_MODULE=poc_project.settings_cli python manage.py rebuild_summaries
+
+Use the full settings for runserver, migrate (admin/sessions tables) and
+anything that serves requests. Compare the two with
+`manage.py profile_startup --target setup --settings-module ...`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+SERVER_ONLY_APPS = {
+    'daphne',
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'channels',
+    'rest_framework',
+    'corsheaders',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in SERVER_ONLY_APPS]  # noqa: F405
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = 'poc_project.urls_cli'
+
+TEMPLATES = []
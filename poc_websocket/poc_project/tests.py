@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from user_app.models import User
+
+from . import db_router, instrumentation
+from .db_router import STICKY_COOKIE, ReplicaRoutingMiddleware
+from .instrumentation import HTTP_QUERIES, HTTP_REQUESTS, NPLUSONE, UNRESOLVED_VIEW, InstrumentationMiddleware
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        # The wrapper is installed when a connection opens; the test connection may predate the import
+        instrumentation._install_wrapper(None, connection)
+
+    def test_middleware_records_requests_and_queries(self):
+        User.objects.create(first_name='Ada')
+        requests, queries = HTTP_REQUESTS.value(view='user-list', method='GET', status=200), HTTP_QUERIES.count(view='user-list')
+        self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        self.assertEqual(HTTP_REQUESTS.value(view='user-list', method='GET', status=200), requests + 1)
+        self.assertEqual(HTTP_QUERIES.count(view='user-list'), queries + 1)
+
+    def test_labels_are_bounded(self):
+        before = HTTP_REQUESTS.value(view=UNRESOLVED_VIEW, method='OTHER', status=404)
+        self.client.generic('BREW', '/no-such-page-1/')
+        self.client.generic('PROPFIND', '/no-such-page-2/')
+        # Neither the path nor the method becomes a label value
+        self.assertEqual(HTTP_REQUESTS.value(view=UNRESOLVED_VIEW, method='OTHER', status=404), before + 2)
+        self.assertNotIn('no-such-page', instrumentation.REGISTRY.render())
+
+    @override_settings(PERF_QUERY_DETECTOR=True, PERF_NPLUSONE_THRESHOLD=5)
+    def test_nplusone_detector(self):
+        users = [User.objects.create(first_name=f'U{i}') for i in range(6)]
+
+        def view(request):
+            # One query per user, each with a longer IN list: still one statement shape
+            for index in range(len(users)):
+                list(User.objects.filter(id__in=[user.id for user in users[:index + 1]]))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.resolver_match = SimpleNamespace(view_name='tests-nplusone')
+        before = NPLUSONE.value(view='tests-nplusone')
+        with self.assertLogs(instrumentation.logger, 'WARNING') as logs:
+            InstrumentationMiddleware(view)(request)
+        self.assertEqual(NPLUSONE.value(view='tests-nplusone'), before + 1)
+        self.assertIn('ran 6 times', logs.output[0])
+
+        # Below the threshold nothing is reported
+        del users[4:]
+        InstrumentationMiddleware(view)(request)
+        self.assertEqual(NPLUSONE.value(view='tests-nplusone'), before + 1)
+
+    def test_metrics_endpoint_is_restricted(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE http_requests_total counter', response.content)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+        # user_app.User is not the auth user model
+        self.client.force_login(get_user_model().objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+
+REPLICA = 'replica1'
+REPLICA_ONLY = 'OnlyOnReplica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], DB_STICKY_SECONDS=5)
+class DbRouterTests(TransactionTestCase):
+    """Two real databases: the test primary and a replica file holding a
+    row the primary does not have, so each read shows where it went. The
+    replica alias is added in setUpClass, before '__all__' is resolved."""
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings[REPLICA] = {
+            **connections.settings[DEFAULT_DB_ALIAS], 'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+        # Replicas are not migrated (allow_migrate); give this one the users table
+        with connections[REPLICA].schema_editor() as editor:
+            editor.create_model(User)
+        User.objects.using(REPLICA).bulk_create([User(first_name=REPLICA_ONLY)])
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        # The pin is a context variable; writes in earlier tests must not leak in
+        self.addCleanup(db_router._pinned.reset, db_router._pinned.set(False))
+
+    def _served_by(self):
+        return 'replica' if User.objects.filter(first_name=REPLICA_ONLY).exists() else 'primary'
+
+    def _view(self, request):
+        if request.method == 'POST':
+            User.objects.create(first_name='Ada')
+        return HttpResponse(self._served_by())
+
+    def test_reads_go_to_the_replica_until_a_write(self):
+        self.assertEqual(self._served_by(), 'replica')
+        User.objects.create(first_name='Ada')
+        self.assertEqual(self._served_by(), 'primary')
+        self.assertFalse(User.objects.using(REPLICA).filter(first_name='Ada').exists())
+
+    def test_use_primary_pins_only_inside_the_block(self):
+        with db_router.use_primary():
+            self.assertEqual(self._served_by(), 'primary')
+        self.assertEqual(self._served_by(), 'replica')
+
+    def test_sticky_cookie_pins_reads_until_it_expires(self):
+        middleware = ReplicaRoutingMiddleware(self._view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'primary')
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        follow_up = factory.get('/')
+        follow_up.COOKIES[STICKY_COOKIE] = cookie.value
+        self.assertEqual(middleware(follow_up).content, b'primary')
+        self.assertNotIn(STICKY_COOKIE, middleware(follow_up).cookies)
+        # The pin does not outlive the request
+        self.assertEqual(self._served_by(), 'replica')
+
+        with mock.patch('poc_project.db_router.time.time', return_value=float(cookie.value) + 1):
+            self.assertEqual(middleware(follow_up).content, b'replica')
+
+        follow_up.COOKIES[STICKY_COOKIE] = 'garbage'
+        self.assertEqual(middleware(follow_up).content, b'replica')
+
+    def test_failed_write_does_not_set_the_cookie(self):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse(status=400))
+        self.assertNotIn(STICKY_COOKIE, middleware(RequestFactory().post('/')).cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_reads_go_to_the_primary(self):
+        self.assertEqual(User.objects.all().db, DEFAULT_DB_ALIAS)
+        self.assertEqual(self._served_by(), 'primary')
+        response = ReplicaRoutingMiddleware(self._view)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'primary')
@@ -4,9 +4,14 @@ URL configuration for poc_project project.
 from django.contrib import admin
 from django.urls import path, include
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('user_app.urls')),
     path('mindtrace/', include('mindtrace.urls')),
+    path('', include('search.urls')),
+    path('', include('jobs.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
@@ -0,0 +1,7 @@
+"""
+Empty URLconf for the CLI settings profile (poc_project.settings_cli), so
+system checks run by management commands don't import the admin, DRF and
+view modules.
+"""
+
+urlpatterns = []
@@ -0,0 +1,286 @@
+"""
+Indexed name search for users and patients.
+
+Backends, picked by database vendor (get_backend()):
+
+- Fts5Backend (SQLite): one FTS5 table per kind with the trigram tokenizer,
+  rowid = object id, kept in sync by signals (search.signals). Each query
+  word is split into trigrams: AND-ed they find prefixes and substrings
+  straight from the index; when that yields too few rows, groups of
+  trigrams that survive one typo are tried (typo_groups()). Every pass
+  reads a bounded candidate set in rowid order, which FTS5 can stop early
+  on, instead of ordering all matches by bm25 (hundreds of ms for common
+  names at 500k rows; see bench_search). Word-start matches are read
+  first so a short prefix such as "jam" is not crowded out by substrings
+  ("Benjamin"). Candidates are re-ranked by the share of query trigrams
+  they contain. Queries without a word of three characters cannot use the
+  trigram index and fall back to IcontainsBackend.
+- TrigramBackend (PostgreSQL): pg_trgm GIN expression indexes on the base
+  tables (created by the migration), queried with the % similarity operator.
+- IcontainsBackend: unindexed fallback for anything else.
+
+Each backend returns SearchHit tuples ordered best-first.
+"""
+
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.db import connection, transaction
+
+MIN_SIMILARITY = 0.3
+FTS_TABLE_PREFIX = 'search_fts_'
+
+# Searchable document kinds: base table and the columns concatenated into the label
+KINDS: Dict[str, Dict] = {
+    'users': {'table': 'users', 'fields': ('first_name', 'last_name')},
+    'patients': {'table': 'mindtrace_patient', 'fields': ('external_id', 'name')},
+}
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    object_id: int
+    label: str
+    score: float
+
+
+def normalize(text: str) -> str:
+    return ' '.join((text or '').lower().split())
+
+
+def word_trigrams(word: str) -> List[str]:
+    return list(dict.fromkeys(word[i:i + 3] for i in range(len(word) - 2)))
+
+
+def trigrams(text: str) -> List[str]:
+    """Trigrams of each word (none spanning a space), so word order does not matter."""
+    grams = []
+    for word in normalize(text).split():
+        grams.extend(word_trigrams(word))
+    return list(dict.fromkeys(grams))
+
+
+def similarity(query: str, label: str) -> float:
+    """Share of the query's trigrams present in label, plus a bonus when every
+    query word starts a label word."""
+    query, label = normalize(query), normalize(label)
+    grams = trigrams(query)
+    label_words = label.split()
+    if not grams:
+        return 1.0 if query and query in label else 0.0
+    score = sum(1 for g in grams if g in label) / len(grams)
+    if all(any(lw.startswith(qw) for lw in label_words) for qw in query.split()):
+        score += 0.5
+    return score
+
+
+def typo_groups(word: str) -> List[List[str]]:
+    """Trigram sets that survive one typo in word.
+
+    An edit at one position breaks at most the three trigrams overlapping it
+    (four for a transposition of neighbouring letters, allowed in longer
+    words), so for each such window the remaining trigrams must all match.
+    AND-ing each group and OR-ing the groups keeps the MATCH selective,
+    unlike OR-ing single trigrams.
+    """
+    grams = word_trigrams(word)
+    n = len(grams)
+    if n <= 1:
+        return [grams] if grams else []
+    window = 4 if n >= 5 else 3
+    min_size = 2 if n >= 4 else 1
+    groups = []
+    for start in range(1 - window, n):
+        kept = grams[:max(start, 0)] + grams[start + window:]
+        if len(kept) >= min_size and kept not in groups:
+            groups.append(kept)
+    # Drop groups that contain a smaller one; the smaller one already matches them
+    return [g for g in groups if not any(o is not g and set(o) <= set(g) for o in groups)]
+
+
+def fts_table(kind: str) -> str:
+    return FTS_TABLE_PREFIX + kind
+
+
+def document_text(kind: str, values) -> str:
+    return ' '.join(str(v) for v in values if v)
+
+
+class BaseBackend:
+    name = ''
+
+    def search(self, kind: str, query: str, limit: int = 20) -> List[SearchHit]:
+        raise NotImplementedError
+
+    # Index maintenance; no-ops for backends indexing the base tables directly
+    def index(self, kind: str, object_id: int, values) -> None:
+        pass
+
+    def remove(self, kind: str, object_id: int) -> None:
+        pass
+
+    def index_many(self, kind: str, rows: Iterable[Tuple[int, tuple]]) -> None:
+        """Index (object_id, values) pairs of objects created without signals."""
+        for object_id, values in rows:
+            self.index(kind, object_id, values)
+
+    def remove_many(self, kind: str, object_ids: Iterable[int]) -> None:
+        for object_id in object_ids:
+            self.remove(kind, object_id)
+
+    def rebuild(self, kind: Optional[str] = None) -> None:
+        pass
+
+
+class Fts5Backend(BaseBackend):
+    name = 'sqlite-fts5'
+
+    def search(self, kind, query, limit=20):
+        query = normalize(query)
+        words = [w for w in query.split() if len(w) >= 3]
+        if not words:
+            # The trigram index cannot serve one- or two-character queries
+            return IcontainsBackend().search(kind, query, limit)
+
+        # Prefix/substring match: every trigram of every word present
+        exact = ' AND '.join(_quote(g) for g in trigrams(' '.join(words)))
+        budget = limit * 5
+        # Words starting the body or following a space come first; the
+        # trigram tokenizer indexes the space, so this is a phrase query too
+        starts = ' AND '.join(f'(^{_quote(w)} OR {_quote(" " + w)})' for w in words)
+        rows = self._match(kind, starts, budget)
+        if len(rows) < budget:
+            seen = {object_id for object_id, _ in rows}
+            rows += [row for row in self._match(kind, exact, budget) if row[0] not in seen][:budget - len(rows)]
+        if len(rows) < limit:
+            # Typo tolerance: per word, any group of trigrams surviving one edit
+            fuzzy = ' AND '.join(
+                '(' + ' OR '.join('(' + ' AND '.join(_quote(g) for g in group) + ')' for group in typo_groups(w)) + ')'
+                for w in words
+            )
+            seen = {object_id for object_id, _ in rows}
+            rows += [row for row in self._match(kind, fuzzy, max(limit * 10, 200)) if row[0] not in seen]
+        return _rank(kind, query, rows, limit)
+
+    def _match(self, kind, expression, limit):
+        # First matches in rowid order: FTS5 stops after limit rows, where
+        # ORDER BY rank would score every match first
+        table = fts_table(kind)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid, body FROM {table} WHERE {table} MATCH %s LIMIT %s", [expression, limit])
+            return cursor.fetchall()
+
+    def index(self, kind, object_id, values):
+        table = fts_table(kind)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [object_id])
+            cursor.execute(f"INSERT INTO {table} (rowid, body) VALUES (%s, %s)", [object_id, document_text(kind, values)])
+
+    def remove(self, kind, object_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {fts_table(kind)} WHERE rowid = %s", [object_id])
+
+    def index_many(self, kind, rows):
+        # New objects only: rowids are not in the table yet
+        table = fts_table(kind)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (rowid, body) VALUES (%s, %s)",
+                [(object_id, document_text(kind, values)) for object_id, values in rows],
+            )
+
+    def remove_many(self, kind, object_ids):
+        table = fts_table(kind)
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(object_id,) for object_id in object_ids])
+
+    def rebuild(self, kind=None):
+        with transaction.atomic(), connection.cursor() as cursor:
+            for name in ([kind] if kind else KINDS):
+                spec = KINDS[name]
+                body = " || ' ' || ".join(f'COALESCE("{f}", \'\')' for f in spec['fields'])
+                cursor.execute(f"DELETE FROM {fts_table(name)}")
+                cursor.execute(f"INSERT INTO {fts_table(name)} (rowid, body) SELECT id, TRIM({body}) FROM \"{spec['table']}\"")
+
+
+class TrigramBackend(BaseBackend):
+    name = 'postgresql-trigram'
+
+    def search(self, kind, query, limit=20):
+        query = normalize(query)
+        if not query:
+            return []
+        spec = KINDS[kind]
+        expr = _pg_expression(spec['fields'])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, {expr} FROM \"{spec['table']}\" "
+                f"WHERE {expr} %% %s OR {expr} LIKE %s "
+                f"ORDER BY similarity({expr}, %s) DESC LIMIT %s",
+                [query, f'%{query}%', query, max(limit * 5, 50)],
+            )
+            rows = cursor.fetchall()
+        return _rank(kind, query, rows, limit)
+
+
+class IcontainsBackend(BaseBackend):
+    name = 'icontains'
+
+    def search(self, kind, query, limit=20):
+        query = normalize(query)
+        if not query:
+            return []
+        spec = KINDS[kind]
+        cols = ', '.join(f'"{f}"' for f in spec['fields'])
+        where = ' OR '.join(f'LOWER("{f}") LIKE %s' for f in spec['fields'])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, {cols} FROM \"{spec['table']}\" WHERE {where} LIMIT %s",
+                [f'%{query}%'] * len(spec['fields']) + [max(limit * 5, 50)],
+            )
+            rows = [(row[0], document_text(kind, row[1:])) for row in cursor.fetchall()]
+        return _rank(kind, query, rows, limit)
+
+
+def _quote(gram: str) -> str:
+    return '"' + gram.replace('"', '""') + '"'
+
+
+def _pg_expression(fields) -> str:
+    """Indexed expression; must match the one in the migration."""
+    return "LOWER(" + " || ' ' || ".join(f'COALESCE("{f}", \'\')' for f in fields) + ")"
+
+
+def _rank(kind, query, rows, limit) -> List[SearchHit]:
+    hits = []
+    for object_id, label in rows:
+        score = similarity(query, label)
+        if score >= MIN_SIMILARITY:
+            hits.append(SearchHit(kind, object_id, label, round(score, 3)))
+    hits.sort(key=lambda h: (-h.score, len(h.label), h.object_id))
+    return hits[:limit]
+
+
+_backend: Optional[BaseBackend] = None
+
+
+def get_backend() -> BaseBackend:
+    global _backend
+    if _backend is None:
+        # The migrations only create the FTS5 tables when SQLite supports it
+        if connection.vendor == 'sqlite' and fts_table('users') in connection.introspection.table_names():
+            _backend = Fts5Backend()
+        elif connection.vendor == 'postgresql':
+            _backend = TrigramBackend()
+        else:
+            _backend = IcontainsBackend()
+    return _backend
+
+
+def search(kind: str, query: str, limit: int = 20):
+    """Run a search; returns (hits, elapsed_ms)."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown search type {kind!r}")
+    started = time.perf_counter()
+    hits = get_backend().search(kind, query, limit)
+    return hits, (time.perf_counter() - started) * 1000
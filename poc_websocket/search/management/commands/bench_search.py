@@ -0,0 +1,58 @@
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from search.backends import KINDS, get_backend, search
+
+DEFAULT_QUERIES = ("smith", "smiht", "jam", "james smith", "ith")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure search latency against the current database.\n"
+        "Runs each query --repeat times after one warm-up call and reports\n"
+        "p50/max milliseconds and the hit count. Load data first, e.g.\n"
+        "generate_dataset --users 500000."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queries",
+            nargs="*",
+            help=f"Queries to run (default: {', '.join(DEFAULT_QUERIES)})",
+        )
+        parser.add_argument(
+            "--kind",
+            choices=sorted(KINDS),
+            default="users",
+            help="Document kind to search (default: users)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Hits per query (default: 20)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Timed runs per query (default: 20)",
+        )
+
+    def handle(self, *args, **options):
+        if options["limit"] <= 0 or options["repeat"] <= 0:
+            raise CommandError("--limit and --repeat must be positive")
+        kind = options["kind"]
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{get_backend().name}, kind {kind}"))
+        self.stdout.write(f"{'query':<16} {'p50 ms':>9} {'max ms':>9} {'hits':>5}  best")
+        for query in options["queries"] or DEFAULT_QUERIES:
+            search(kind, query, options["limit"])
+            timings = []
+            for _ in range(options["repeat"]):
+                hits, took_ms = search(kind, query, options["limit"])
+                timings.append(took_ms)
+            best = hits[0].label if hits else "-"
+            self.stdout.write(
+                f"{query:<16} {statistics.median(timings):>9.2f} {max(timings):>9.2f} {len(hits):>5}  {best}"
+            )
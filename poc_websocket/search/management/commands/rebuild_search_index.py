@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from search.backends import KINDS, get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the search index from the users and patients tables.\n"
+        "Use after bulk loads that bypass signals. A no-op on PostgreSQL, where\n"
+        "the trigram indexes sit on the base tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind",
+            choices=sorted(KINDS),
+            help="Only rebuild one document kind",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.monotonic()
+        backend.rebuild(options.get("kind"))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Done. Rebuilt {backend.name} index in {elapsed:.1f}s"))
@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# One FTS5 table per kind, rowid = object id; kept in step with search.backends.KINDS
+FTS_TABLES = {
+    'search_fts_users': ('users', ('first_name', 'last_name')),
+    'search_fts_patients': ('mindtrace_patient', ('external_id', 'name')),
+}
+
+# Kept in step with search.backends.KINDS / _pg_expression
+PG_INDEXES = {
+    'users_name_trgm': ('users', ('first_name', 'last_name')),
+    'mindtrace_patient_name_trgm': ('mindtrace_patient', ('external_id', 'name')),
+}
+
+
+def _body(fields):
+    return 'TRIM(' + " || ' ' || ".join(f'COALESCE("{f}", \'\')' for f in fields) + ')'
+
+
+def _pg_expression(fields):
+    return "LOWER(" + " || ' ' || ".join(f'COALESCE("{f}", \'\')' for f in fields) + ")"
+
+
+def _fts5_available(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if not _fts5_available(cursor):
+                return
+            for name, (table, fields) in FTS_TABLES.items():
+                cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5(body, tokenize='trigram')")
+                cursor.execute(f'INSERT INTO {name} (rowid, body) SELECT id, {_body(fields)} FROM "{table}"')
+        elif connection.vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for name, (table, fields) in PG_INDEXES.items():
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" '
+                    f'USING gin (({_pg_expression(fields)}) gin_trgm_ops)'
+                )
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in FTS_TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        elif connection.vendor == 'postgresql':
+            for name in PG_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('user_app', '0001_initial'),
+        ('mindtrace', '0002_session_summaries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,56 @@
+from functools import reduce
+from operator import or_
+
+from django.contrib import messages
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+
+from .backends import search
+
+
+class SearchIndexAdminMixin:
+    """ModelAdmin mixin answering the changelist search box from the search
+    index instead of icontains scans over search_fields.
+
+    search_kind is a key of search.backends.KINDS; search_lookup is the field
+    the hit ids are matched against (e.g. 'patient_id' for sessions).
+    search_index_fields lists the search_fields the index already covers;
+    the others (e.g. a session's operator) are still matched with icontains
+    and their rows are shown alongside the index hits. At most
+    search_index_limit hits are used; the changelist says so when the limit
+    is reached.
+    """
+    search_kind = None
+    search_lookup = 'pk'
+    search_index_fields = ()
+    search_index_limit = 500
+
+    def get_search_results(self, request, queryset, search_term):
+        if not (self.search_kind and search_term.strip()):
+            return super().get_search_results(request, queryset, search_term)
+
+        hits, _ = search(self.search_kind, search_term, limit=self.search_index_limit)
+        if len(hits) >= self.search_index_limit:
+            self.message_user(
+                request,
+                f"Showing only the best {self.search_index_limit} matches for "
+                f"“{search_term.strip()}”; refine the search to narrow them down.",
+                messages.INFO,
+            )
+        condition = Q(**{f'{self.search_lookup}__in': [hit.object_id for hit in hits]})
+        others = [f for f in self.get_search_fields(request) if f not in self.search_index_fields]
+        if others:
+            condition |= _icontains(others, search_term)
+        may_have_duplicates = any(lookup_spawns_duplicates(self.opts, f'{f}__icontains') for f in others)
+        return queryset.filter(condition), may_have_duplicates
+
+
+def _icontains(fields, search_term):
+    # Same matching as ModelAdmin.get_search_results: every word in some field
+    condition = Q()
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        condition &= reduce(or_, (Q(**{f'{field}__icontains': bit}) for field in fields))
+    return condition
@@ -0,0 +1,34 @@
+"""
+Keep the search index in sync with User and Patient writes.
+Connected from SearchConfig.ready(). Bulk loads that bypass signals should
+call the backend's index_many()/remove_many() with the rows they wrote, or
+run `manage.py rebuild_search_index` afterwards.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from mindtrace.models import Patient
+from user_app.models import User
+
+from .backends import get_backend
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    get_backend().index('users', instance.id, (instance.first_name, instance.last_name))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    get_backend().remove('users', instance.id)
+
+
+@receiver(post_save, sender=Patient)
+def patient_saved(sender, instance, **kwargs):
+    get_backend().index('patients', instance.id, (instance.external_id, instance.name))
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    get_backend().remove('patients', instance.id)
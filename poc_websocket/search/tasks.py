@@ -0,0 +1,24 @@
+"""
+Background job tasks for search (see jobs.registry).
+"""
+
+from jobs.registry import InvalidParams, task
+
+from .backends import KINDS, get_backend
+
+
+def _check_kind(params):
+    kind = params.get('kind')
+    if kind is not None and kind not in KINDS:
+        raise InvalidParams(f"kind must be one of {', '.join(KINDS)}")
+
+
+@task('rebuild_search_index', validate=_check_kind)
+def rebuild_search_index(ctx, kind=None):
+    """Reindex names after bulk loads; one step per document kind."""
+    kinds = [kind] if kind else list(KINDS)
+    backend = get_backend()
+    for index, name in enumerate(kinds):
+        ctx.progress(done=index, total=len(kinds), message=f'Indexing {name}', force=True)
+        backend.rebuild(name)
+    return {'backend': backend.name, 'kinds': kinds}
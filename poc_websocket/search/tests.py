@@ -0,0 +1,94 @@
+import datetime
+import io
+
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from mindtrace.models import Patient, Session
+from user_app.models import User
+
+from . import backends
+
+
+class Fts5SearchTests(TestCase):
+    def setUp(self):
+        if not isinstance(backends.get_backend(), backends.Fts5Backend):
+            self.skipTest('SQLite without FTS5')
+
+    def test_word_starts_are_not_crowded_out_by_substrings(self):
+        # More substring matches than the candidate budget, all read first in rowid order
+        for i in range(30):
+            User.objects.create(first_name='Benjamin', last_name=f'Doe{i}')
+        james = User.objects.create(first_name='James', last_name='Lee')
+        hits, _ = backends.search('users', 'jam', limit=5)
+        self.assertEqual(hits[0].object_id, james.id)
+
+    def test_typo_is_tolerated(self):
+        smith = User.objects.create(first_name='Wei', last_name='Smith')
+        User.objects.create(first_name='Ada', last_name='Lovelace')
+        hits, _ = backends.search('users', 'smiht')
+        self.assertEqual([hit.object_id for hit in hits], [smith.id])
+
+    def test_candidates_are_read_in_bounded_rowid_order(self):
+        User.objects.create(first_name='Wei', last_name='Smith')
+        with CaptureQueriesContext(connection) as queries:
+            backends.search('users', 'smiht', limit=20)
+        matches = [q['sql'] for q in queries if ' MATCH ' in q['sql']]
+        self.assertTrue(matches)
+        for sql in matches:
+            # ORDER BY rank scores every match before the LIMIT applies
+            self.assertNotIn('ORDER BY', sql)
+            self.assertIn('LIMIT', sql)
+
+    def test_bench_search_reports_each_query(self):
+        User.objects.create(first_name='James', last_name='Smith')
+        out = io.StringIO()
+        call_command('bench_search', 'smith', 'jam', '--repeat', '2', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[2].startswith('smith'))
+        self.assertTrue(lines[3].startswith('jam'))
+        self.assertTrue(lines[3].endswith('James Smith'))
+
+
+class SessionSearchTests(TestCase):
+    def test_best_patient_match_is_kept_before_recency_limit(self):
+        now = timezone.now()
+        ann = Patient.objects.create(external_id='P-1', name='Ann Smith')
+        bob = Patient.objects.create(external_id='P-2', name='Bob Smithson')
+        old = Session.objects.create(patient=ann, start_time=now - datetime.timedelta(days=400))
+        newer = [Session.objects.create(patient=bob, start_time=now - datetime.timedelta(days=d)) for d in (1, 2)]
+
+        response = APIClient().get('/api/search/', {'q': 'smith', 'type': 'sessions', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [old.id, newer[0].id])
+
+
+class SearchIndexAdminMixinTests(TestCase):
+    def setUp(self):
+        self.admin = admin.site._registry[Session]
+        self.request = RequestFactory().get('/admin/mindtrace/session/')
+        now = timezone.now()
+        self.by_patient = Session.objects.create(
+            patient=Patient.objects.create(external_id='P-1', name='Grace Hopper'), start_time=now,
+        )
+        self.by_operator = Session.objects.create(
+            patient=Patient.objects.create(external_id='P-2', name='Alan Turing'), start_time=now, operator='hopper',
+        )
+        Session.objects.create(patient=Patient.objects.create(external_id='P-3', name='Ada Lovelace'), start_time=now)
+
+    def _search(self, term):
+        queryset, _ = self.admin.get_search_results(self.request, Session.objects.all(), term)
+        return set(queryset.values_list('id', flat=True))
+
+    def test_index_hits_and_unindexed_fields_are_combined(self):
+        self.assertEqual(self._search('hopper'), {self.by_patient.id, self.by_operator.id})
+
+    def test_unindexed_field_matches_without_index_hits(self):
+        self.assertEqual(self._search('hopp'), {self.by_patient.id, self.by_operator.id})
+        Session.objects.filter(id=self.by_operator.id).update(operator='night shift')
+        self.assertEqual(self._search('night'), {self.by_operator.id})
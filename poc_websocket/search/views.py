@@ -0,0 +1,62 @@
+from django.db.models import Case, When
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+
+from mindtrace.models import Session
+
+from . import backends
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+TYPES = ('users', 'patients', 'sessions')
+
+
+def _hit_data(hit):
+    return {'id': hit.object_id, 'label': hit.label, 'score': hit.score}
+
+
+@api_view(['GET'])
+def search(request):
+    """Indexed name search.
+    Query params: q, type (users | patients | sessions), limit.
+    Sessions are matched through their patient's external id/name.
+    """
+    query = request.GET.get('q', '')
+    kind = request.GET.get('type', 'users')
+    if kind not in TYPES:
+        return Response({'error': f"type must be one of {', '.join(TYPES)}"}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit') or DEFAULT_LIMIT), MAX_LIMIT)
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        return Response({'error': 'limit must be a positive integer'}, status=400)
+
+    if kind != 'sessions':
+        hits, took_ms = backends.search(kind, query, limit)
+        results = [_hit_data(hit) for hit in hits]
+    else:
+        hits, took_ms = backends.search('patients', query, limit)
+        patients = {hit.object_id: hit for hit in hits}
+        sessions = []
+        if hits:
+            # Best patient match first, then most recent, before the limit: a
+            # recency cut first would drop older sessions of the best matches
+            rank = Case(*(When(patient_id=hit.object_id, then=position) for position, hit in enumerate(hits)))
+            sessions = (
+                Session.objects.filter(patient_id__in=patients)
+                .order_by(rank, '-start_time')
+                .values('id', 'patient_id', 'protocol_id', 'start_time')[:limit]
+            )
+        results = [
+            {**row, 'patient_label': patients[row['patient_id']].label, 'score': patients[row['patient_id']].score}
+            for row in sessions
+        ]
+
+    return Response({
+        'query': query,
+        'type': kind,
+        'backend': backends.get_backend().name,
+        'took_ms': round(took_ms, 2),
+        'results': results,
+    })
@@ -1,9 +1,19 @@
 from django.contrib import admin
-from .models import User
+from search.mixins import SearchIndexAdminMixin
+from .models import User, UserChange
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(SearchIndexAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'first_name', 'last_name', 'created_at', 'updated_at')
     search_fields = ('first_name', 'last_name')
+    search_kind = 'users'
+    search_index_fields = search_fields
 
+
+@admin.register(UserChange)
+class UserChangeAdmin(admin.ModelAdmin):
+    list_display = ('seq', 'action', 'user_id', 'changed_at')
+    list_filter = ('action',)
+    search_fields = ('user_id',)
+    readonly_fields = [f.name for f in UserChange._meta.fields]
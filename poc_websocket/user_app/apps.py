@@ -5,3 +5,5 @@ class UserAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_app'
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,100 @@
+"""
+Native async versions of the user API.
+
+Under Daphne these run on the event loop: the async ORM (aget/asave/adelete)
+and a direct await of group_send replace the sync_to_async/async_to_sync
+thread hops the DRF views in views.py pay on every request. Payloads and
+status codes match the sync endpoints.
+"""
+
+from django.http import HttpResponse
+
+from poc_project.async_api import aget_object_or_404, async_api_view, json_response
+from poc_project.db_router import use_primary
+from . import cache, changes
+from .events import abroadcast_user_event
+from .models import User
+from .serializers import UserSerializer
+
+
+@async_api_view(['GET', 'POST'])
+async def user_list(request):
+    """List all users or create a new user"""
+    if request.method == 'GET':
+        # Read before the listing: replaying changes after it is idempotent
+        token = await changes.acurrent_token()
+        users = [user async for user in User.objects.all()]
+        response = json_response(UserSerializer(users, many=True).data)
+        response['X-Changes-Token'] = token
+        return response
+
+    serializer = UserSerializer(data=request.data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+    user = User(**serializer.validated_data)
+    await user.asave()
+    data = UserSerializer(user).data
+    await cache.astore_user(data)
+
+    # Broadcast update via WebSocket
+    await abroadcast_user_event({
+        'action': 'create',
+        'user': data
+    })
+    return json_response(data, status=201)
+
+
+@async_api_view(['GET', 'PATCH', 'DELETE'])
+async def user_detail(request, pk):
+    """Retrieve, update or delete a user"""
+    if request.method == 'GET':
+        # Hot reads are served from the write-through cache without a query
+        payload = await cache.aget_user(pk)
+        if payload is None:
+            with use_primary():
+                payload = UserSerializer(await aget_object_or_404(User.objects.all(), pk=pk)).data
+            await cache.afill_user(payload)
+        return json_response(payload)
+
+    user = await aget_object_or_404(User.objects.all(), pk=pk)
+
+    if request.method == 'PATCH':
+        serializer = UserSerializer(user, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        for field, value in serializer.validated_data.items():
+            setattr(user, field, value)
+        await user.asave()
+        data = UserSerializer(user).data
+        await cache.astore_user(data)
+
+        # Broadcast update via WebSocket
+        await abroadcast_user_event({
+            'action': 'update',
+            'user': data
+        })
+        return json_response(data)
+
+    user_id = user.id
+    await user.adelete()
+    await cache.ainvalidate_user(user_id)
+
+    # Broadcast delete via WebSocket
+    await abroadcast_user_event({
+        'action': 'delete',
+        'user_id': user_id
+    })
+    return HttpResponse(status=204)
+
+
+@async_api_view(['GET'])
+async def user_changes(request):
+    """Users created, updated or deleted since a token (see user_app.changes).
+    Query params: since, limit.
+    """
+    try:
+        since = changes.parse_token(request.GET.get('since'))
+        limit = changes.parse_limit(request.GET.get('limit'))
+    except ValueError as exc:
+        return json_response({'error': str(exc)}, status=400)
+    return json_response(await changes.aread_changes(since, limit))
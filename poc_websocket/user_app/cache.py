@@ -0,0 +1,78 @@
+"""
+Write-through cache of serialized user payloads for user_detail.
+
+The API views store the fresh payload after POST/PATCH and drop it on
+DELETE, next to the WebSocket broadcast, so a cached read never lags behind
+what clients were told. Saves and deletes made elsewhere (admin, shell)
+invalidate the entry through signals; USER_CACHE_TIMEOUT bounds anything
+that bypasses both (queryset.update(), raw SQL).
+
+Read misses fill the entry with fill_user(), which only adds a missing key:
+a reader that loaded the row just before a PATCH cannot overwrite the
+payload the PATCH stored. Views read the filling row from the primary
+(use_primary()), so a lagging replica cannot seed the cache either.
+
+Hits and misses are exported at /metrics as object_cache_requests_total.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from poc_project.instrumentation import Counter
+
+CACHE_REQUESTS = Counter('object_cache_requests_total', 'Object cache lookups', ('cache', 'result'))
+
+NAME = 'user_detail'
+KEY_PREFIX = 'user:detail:'
+
+
+def _key(pk):
+    return f'{KEY_PREFIX}{pk}'
+
+
+def _timeout():
+    return getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+
+
+def _record(payload):
+    CACHE_REQUESTS.inc(cache=NAME, result='miss' if payload is None else 'hit')
+    return payload
+
+
+def get_user(pk):
+    """Cached payload for user pk, or None."""
+    return _record(cache.get(_key(pk)))
+
+
+def store_user(payload):
+    cache.set(_key(payload['id']), payload, _timeout())
+
+
+def fill_user(payload):
+    """Cache a payload read on a miss, unless a writer stored one meanwhile."""
+    cache.add(_key(payload['id']), payload, _timeout())
+
+
+def invalidate_user(pk):
+    cache.delete(_key(pk))
+
+
+def invalidate_users(pks):
+    """Drop many entries at once (bulk deletes that bypass the signals)."""
+    cache.delete_many([_key(pk) for pk in pks])
+
+
+async def aget_user(pk):
+    return _record(await cache.aget(_key(pk)))
+
+
+async def astore_user(payload):
+    await cache.aset(_key(payload['id']), payload, _timeout())
+
+
+async def afill_user(payload):
+    await cache.aadd(_key(payload['id']), payload, _timeout())
+
+
+async def ainvalidate_user(pk):
+    await cache.adelete(_key(pk))
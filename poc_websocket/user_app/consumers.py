@@ -1,50 +1,242 @@
-import json
+import asyncio
+import collections
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from poc_project.instrumentation import Counter, InstrumentedConsumerMixin
+from . import wire
+from .events import user_update_message
 
+WS_DROPPED = Counter('ws_dropped_messages_total', 'Outgoing messages dropped or collapsed by the overflow policy', ('policy',))
+WS_EVICTIONS = Counter('ws_evictions_total', 'WebSocket connections closed by the server', ('reason',))
+
+OVERFLOW_POLICIES = ('drop_oldest', 'snapshot', 'disconnect')
+
+DEFAULT_OPTIONS = {
+    # Outgoing messages buffered per connection before OVERFLOW_POLICY applies
+    'QUEUE_SIZE': 256,
+    # drop_oldest | snapshot (collapse per user, then a single resync) | disconnect
+    'OVERFLOW_POLICY': 'snapshot',
+    # Frames sent but not yet acknowledged by a pong before sending pauses
+    'MAX_IN_FLIGHT': 1000,
+    # Seconds between server pings; a connection that has not answered the
+    # previous ping by the next one is evicted
+    'HEARTBEAT_INTERVAL': 20,
+}
+
+# Close codes (4000-4999 are reserved for applications)
+CLOSE_SLOW_CONSUMER = 4008
+CLOSE_HEARTBEAT_TIMEOUT = 4009
+
+
+def ws_options():
+    options = {**DEFAULT_OPTIONS, **getattr(settings, 'USER_UPDATES_WS', {})}
+    if options['OVERFLOW_POLICY'] not in OVERFLOW_POLICIES:
+        raise ImproperlyConfigured(
+            f"USER_UPDATES_WS['OVERFLOW_POLICY'] must be one of {', '.join(OVERFLOW_POLICIES)}"
+        )
+    return options
+
+
+class UserUpdateConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    """WebSocket consumer for real-time user updates
+
+    Frames are JSON text by default; clients can negotiate MessagePack or
+    deflated JSON and batching of events into one frame (see user_app.wire).
+    Batched frames look like {"type": "batch", "events": [...]}.
+
+    Each connection has a bounded outgoing queue drained by a writer task, so
+    one slow client cannot grow server memory or hold up the group. The
+    server sends {"type": "ping", "seq": n} every HEARTBEAT_INTERVAL seconds;
+    clients answer {"type": "pong", "seq": n}. The seq is the number of data
+    frames sent so far and doubles as an acknowledgement for flow control;
+    control frames (ping, pong) are not counted, so the heartbeat never uses
+    up the in-flight window.
+    """
 
-class UserUpdateConsumer(AsyncWebsocketConsumer):
-    """WebSocket consumer for real-time user updates"""
-    
     async def connect(self):
+        self.encoding, self.batch_ms, subprotocol = wire.negotiate(self.scope)
+        self.options = ws_options()
+        self._queue = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._frames_sent = 0
+        self._acked = 0
+        self._ping_seq = None
+        self._ping_sent_at = 0.0
+        self._closing = False
+
         # Join the user updates group
         self.room_group_name = 'user_updates'
-        
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
-        
-        await self.accept()
-    
+
+        await self.accept(subprotocol=subprotocol)
+        self._writer = asyncio.ensure_future(self._write_loop())
+        self._heartbeat = asyncio.ensure_future(self._heartbeat_loop())
+
     async def disconnect(self, close_code):
+        self._closing = True
+        for task in (getattr(self, '_writer', None), getattr(self, '_heartbeat', None)):
+            if task is not None:
+                task.cancel()
         # Leave the user updates group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
-    
-    async def receive(self, text_data):
+
+    async def receive(self, text_data=None, bytes_data=None):
         """Receive message from WebSocket"""
-        text_data_json = json.loads(text_data)
+        text_data_json = wire.decode(self.encoding, text_data, bytes_data)
         message_type = text_data_json.get('type', 'user_update')
+
+        if message_type == 'pong':
+            self._on_pong(text_data_json.get('seq'))
+            return
+        if message_type == 'ping':
+            await self.send_control({'type': 'pong', 'seq': text_data_json.get('seq')})
+            return
+
         data = text_data_json.get('data', {})
-        
+
         # Send message to room group
-        await self.channel_layer.group_send(
+        await self.group_send(
             self.room_group_name,
-            {
-                'type': 'user_update',
-                'data': data
-            }
+            user_update_message(data)
         )
-    
+
     async def user_update(self, event):
         """Receive message from room group"""
-        data = event['data']
-        
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.deliver({
             'type': 'user_update',
-            'data': data
-        }))
+            'data': event['data']
+        }, event.get('prepared'))
+
+    # ---- outgoing queue ----
+
+    async def deliver(self, payload, prepared=None):
+        """Queue a payload for the writer, applying the overflow policy when full.
+        prepared is its pre-encoded form (wire.prepare), when the sender made one."""
+        if self._closing:
+            return
+        self._queue.append((payload, prepared))
+        if len(self._queue) > self.options['QUEUE_SIZE']:
+            await self._overflow()
+        self._wakeup.set()
+
+    async def _overflow(self):
+        policy = self.options['OVERFLOW_POLICY']
+        if policy == 'disconnect':
+            WS_DROPPED.inc(len(self._queue), policy=policy)
+            await self.evict(CLOSE_SLOW_CONSUMER, 'slow_consumer')
+        elif policy == 'drop_oldest':
+            self._queue.popleft()
+            WS_DROPPED.inc(policy=policy)
+        else:
+            before = len(self._queue)
+            self._queue = collapse(self._queue, self.options['QUEUE_SIZE'])
+            WS_DROPPED.inc(before - len(self._queue), policy='snapshot')
+
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.batch_ms:
+                # Let a burst accumulate into one frame
+                await asyncio.sleep(self.batch_ms / 1000)
+            while self._queue:
+                if self._frames_sent - self._acked >= self.options['MAX_IN_FLIGHT']:
+                    # Client is not keeping up; hold the rest (the queue bound
+                    # and overflow policy take over) and ask for an ack now
+                    await self.ping()
+                    break
+                count = min(len(self._queue), wire.MAX_BATCH_EVENTS) if self.batch_ms else 1
+                events = [self._queue.popleft() for _ in range(count)]
+                await self.send_frame(*self._encode(events))
+
+    def _encode(self, events):
+        """Frame for queued (payload, prepared) events, reusing the sender's encoding when possible."""
+        if len(events) == 1:
+            payload, prepared = events[0]
+            if prepared is not None and self._usable(prepared):
+                return wire.frame(self.encoding, prepared)
+            return wire.encode(self.encoding, payload)
+        if all(prepared is not None and self._usable(prepared) for _, prepared in events):
+            return wire.batch_frame(self.encoding, [prepared for _, prepared in events])
+        return wire.encode(self.encoding, {'type': 'batch', 'events': [payload for payload, _ in events]})
+
+    def _usable(self, prepared):
+        return self.encoding != 'msgpack' or 'msgpack' in prepared
+
+    async def send_control(self, payload):
+        """Send a control frame; it does not count toward MAX_IN_FLIGHT."""
+        text_data, bytes_data = wire.encode(self.encoding, payload)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def send_frame(self, text_data, bytes_data):
+        self._frames_sent += 1
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    # ---- heartbeat ----
+
+    async def ping(self):
+        if self._ping_seq is None:
+            self._ping_seq = self._frames_sent
+            self._ping_sent_at = time.monotonic()
+            await self.send_control({'type': 'ping', 'seq': self._ping_seq})
+
+    def _on_pong(self, seq):
+        if isinstance(seq, int) and seq <= self._frames_sent:
+            self._acked = max(self._acked, seq)
+        self._ping_seq = None
+        # Resume a writer paused on MAX_IN_FLIGHT
+        if self._queue:
+            self._wakeup.set()
+
+    async def _heartbeat_loop(self):
+        interval = self.options['HEARTBEAT_INTERVAL']
+        while True:
+            await asyncio.sleep(interval)
+            if self._ping_seq is not None and time.monotonic() - self._ping_sent_at >= interval:
+                await self.evict(CLOSE_HEARTBEAT_TIMEOUT, 'heartbeat_timeout')
+                return
+            await self.ping()
+
+    async def evict(self, code, reason):
+        if self._closing:
+            return
+        self._closing = True
+        self._queue.clear()
+        WS_EVICTIONS.inc(reason=reason)
+        current = asyncio.current_task()
+        for task in (self._writer, self._heartbeat):
+            if task is not current:
+                task.cancel()
+        await self.close(code=code)
+
+
+def collapse(queue, limit):
+    """Collapse queued user_update events to the latest one per user, keeping
+    the surviving events in arrival order. If that is still over the limit,
+    replace everything with one resync message telling the client to refetch
+    the full list."""
+    keys = [_user_key(payload) for payload, _ in queue]
+    last = {key: index for index, key in enumerate(keys) if key is not None}
+    collapsed = collections.deque(
+        entry for index, (entry, key) in enumerate(zip(queue, keys))
+        if key is None or last[key] == index
+    )
+    if len(collapsed) > limit:
+        return collections.deque([({'type': 'resync'}, None)])
+    return collapsed
+
 
+def _user_key(payload):
+    data = payload.get('data') if payload.get('type') == 'user_update' else None
+    if isinstance(data, dict):
+        return data.get('user_id') or (data.get('user') or {}).get('id')
+    return None
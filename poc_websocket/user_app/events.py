@@ -0,0 +1,37 @@
+"""
+Broadcast helpers for the user_updates WebSocket group.
+
+Sync views go through broadcast_user_event (one async_to_sync hop); async
+views await abroadcast_user_event and call group_send directly. The event is
+encoded here, once per wire encoding (see user_app.wire.prepare).
+"""
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from poc_project.instrumentation import WS_GROUP_SEND, timed
+from . import wire
+
+USER_UPDATES_GROUP = 'user_updates'
+
+
+def user_update_message(data):
+    return {
+        'type': 'user_update',
+        'data': data,
+        'prepared': wire.prepare({'type': 'user_update', 'data': data}),
+    }
+
+
+def broadcast_user_event(data):
+    """Send a user_update event to every connected client (sync callers)"""
+    channel_layer = get_channel_layer()
+    with timed(WS_GROUP_SEND, group=USER_UPDATES_GROUP):
+        async_to_sync(channel_layer.group_send)(USER_UPDATES_GROUP, user_update_message(data))
+
+
+async def abroadcast_user_event(data):
+    """Send a user_update event to every connected client (async callers)"""
+    channel_layer = get_channel_layer()
+    with timed(WS_GROUP_SEND, group=USER_UPDATES_GROUP):
+        await channel_layer.group_send(USER_UPDATES_GROUP, user_update_message(data))
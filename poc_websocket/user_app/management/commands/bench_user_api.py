@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+
+from user_app.models import User
+
+SCENARIOS = ("list", "detail", "patch")
+BENCH_LAST_NAME = "Bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the sync DRF user views against the native async views.\n"
+        "Requests go through the full ASGI handler and middleware in-process\n"
+        "(django.test.AsyncClient), so the sync views pay the same\n"
+        "sync_to_async/async_to_sync hops they do under Daphne.\n"
+        "Reports requests/second and p50/p99 latency per scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Requests per scenario and implementation (default: 2000)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=100,
+            help="Requests in flight at once (default: 100)",
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=SCENARIOS,
+            dest="scenarios",
+            help="Scenario to run (repeatable, default: all)",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=50,
+            help="Benchmark users to create/reuse (last_name 'Bench'; PATCH only touches these) (default: 50)",
+        )
+
+    def handle(self, *args, **options):
+        total, concurrency = options["requests"], options["concurrency"]
+        if total <= 0 or concurrency <= 0:
+            raise CommandError("--requests and --concurrency must be positive")
+
+        bench_users = User.objects.filter(last_name=BENCH_LAST_NAME)
+        missing = options["users"] - bench_users.count()
+        for i in range(missing):
+            # One save per user so the change log and search index see them
+            User.objects.create(first_name=f"Bench{i}", last_name=BENCH_LAST_NAME)
+        user_ids = list(bench_users.order_by("id").values_list("id", flat=True)[:options["users"]])
+        if not user_ids:
+            raise CommandError("No users to benchmark against")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{total} requests per run, concurrency {concurrency}, {len(user_ids)} users"
+        ))
+        self.stdout.write(f"{'scenario':<10} {'impl':<6} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for scenario in options.get("scenarios") or SCENARIOS:
+            for impl, prefix in (("sync", "/api/users/"), ("async", "/api/async/users/")):
+                rps, p50, p99, errors = asyncio.run(
+                    self._run(scenario, prefix, user_ids, total, concurrency)
+                )
+                self.stdout.write(f"{scenario:<10} {impl:<6} {rps:>10.0f} {p50:>9.2f} {p99:>9.2f} {errors:>7}")
+
+    async def _run(self, scenario, prefix, user_ids, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            pk = user_ids[i % len(user_ids)]
+            async with semaphore:
+                started = time.perf_counter()
+                if scenario == "list":
+                    response = await client.get(prefix)
+                elif scenario == "detail":
+                    response = await client.get(f"{prefix}{pk}/")
+                else:
+                    response = await client.patch(
+                        f"{prefix}{pk}/", {"first_name": f"Bench{i}"}, content_type="application/json"
+                    )
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        return total / elapsed, p50, p99, errors
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from user_app import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete user change log entries superseded by a later change of the same\n"
+        "user. Tombstones and each user's latest change are kept, so clients\n"
+        "syncing from any token still reach the same state."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=900,
+            help="Entries checked per query (default: 900)",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] <= 0:
+            raise CommandError("--batch-size must be positive")
+        deleted = changes.prune(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Done. Deleted {deleted} superseded change(s)"))
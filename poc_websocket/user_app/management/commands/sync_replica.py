@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the replica files (DB_REPLICAS).\n"
+        "Stands in for replication when testing the read/write router locally;\n"
+        "with --interval it keeps copying, which gives replicas realistic lag.\n"
+        "PostgreSQL replicas are kept in sync by streaming replication instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            action="append",
+            dest="aliases",
+            help="Replica alias to refresh (repeatable, default: all replicas)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Repeat every N seconds until interrupted",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options.get("aliases") or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError("No replicas configured. Set DB_REPLICAS, e.g. DB_REPLICAS=db_replica.sqlite3")
+        unknown = set(aliases) - set(settings.DATABASE_REPLICAS)
+        if unknown:
+            raise CommandError(f"Not a replica: {', '.join(sorted(unknown))}")
+        if connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("sync_replica only copies SQLite files; use database replication for other engines.")
+
+        while True:
+            started = time.monotonic()
+            for alias in aliases:
+                self._copy(alias)
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f"Synced {', '.join(aliases)} in {elapsed:.2f}s"))
+            if options["interval"] <= 0:
+                return
+            time.sleep(options["interval"])
+
+    def _copy(self, alias):
+        # Drop Django's handle on the replica so the backup can replace its pages
+        connections[alias].close()
+        source = sqlite3.connect(str(settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"]))
+        target = sqlite3.connect(str(settings.DATABASES[alias]["NAME"]))
+        try:
+            # Online backup API: a consistent snapshot even while the primary is in use
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.9 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+BATCH = 1000
+
+
+def _timestamp(value):
+    # Same format as the API (DRF DateTimeField)
+    if value is None:
+        return None
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+def seed_existing_users(apps, schema_editor):
+    """One create entry per existing user, so replaying the log from the
+    start reproduces the table."""
+    User = apps.get_model('user_app', 'User')
+    UserChange = apps.get_model('user_app', 'UserChange')
+
+    last_id = 0
+    while True:
+        users = list(User.objects.filter(id__gt=last_id).order_by('id')[:BATCH])
+        if not users:
+            break
+        UserChange.objects.bulk_create([
+            UserChange(user_id=user.id, action='create', payload={
+                'id': user.id,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'created_at': _timestamp(user.created_at),
+                'updated_at': _timestamp(user.updated_at),
+            })
+            for user in users
+        ])
+        last_id = users[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('user_id', models.BigIntegerField(db_index=True)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=10)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'user_changes',
+            },
+        ),
+        migrations.RunPython(seed_existing_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_app', '0002_user_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='synthetic',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -7,6 +7,8 @@ class User(models.Model):
     last_name = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Created by generate_dataset; removed again by its --flush
+    synthetic = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -14,3 +16,28 @@ class User(models.Model):
     class Meta:
         db_table = 'users'
 
+
+class UserChange(models.Model):
+    """One entry of the durable user change log (see user_app.changes).
+    seq orders the feed; deletes are tombstones with no payload."""
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_CREATE, 'Create'),
+        (ACTION_UPDATE, 'Update'),
+        (ACTION_DELETE, 'Delete'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    # Not a foreign key: tombstones outlive the user row
+    user_id = models.BigIntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    payload = models.JSONField(null=True, blank=True)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} user {self.user_id}"
+
+    class Meta:
+        db_table = 'user_changes'
@@ -1,10 +1,10 @@
-from rest_framework import serializers
+from poc_project.serializers import TimedListSerializer, TimedModelSerializer
 from .models import User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'first_name', 'last_name', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
-
+        list_serializer_class = TimedListSerializer
@@ -0,0 +1,27 @@
+"""
+Drop cached user payloads on writes outside the API views and append
+every save/delete to the change log (user_app.changes).
+Connected from UserAppConfig.ready().
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache, changes
+from .models import User, UserChange
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    changes.record(instance, UserChange.ACTION_CREATE if created else UserChange.ACTION_UPDATE)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    changes.record(instance, UserChange.ACTION_DELETE)
@@ -0,0 +1,337 @@
+import json
+import zlib
+from unittest import mock
+
+import msgpack
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache as django_cache
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from . import cache, changes, consumers, wire
+from .events import USER_UPDATES_GROUP, user_update_message
+from .models import User, UserChange
+from .routing import websocket_urlpatterns
+from .serializers import UserSerializer
+
+
+def replay(state, page):
+    for change in page['changes']:
+        if change['action'] == UserChange.ACTION_DELETE:
+            state.pop(change['user_id'], None)
+        else:
+            state[change['user_id']] = change['user']
+    return state
+
+
+@override_settings(USER_CHANGES_SETTLE_SECONDS=0)
+class ChangesFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def table(self):
+        return {user['id']: user for user in self.client.get('/api/users/').json()}
+
+    def sync(self, token='', limit=2):
+        """Replay the feed from token, page by page, as a client would."""
+        state = {}
+        while True:
+            response = self.client.get('/api/users/changes/', {'since': token, 'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            replay(state, page)
+            token = page['next']
+            if not page['has_more']:
+                return state, token
+
+    def write_history(self):
+        ids = [self.client.post('/api/users/', {'first_name': f'U{i}', 'last_name': 'Test'}, format='json').json()['id']
+               for i in range(4)]
+        self.client.patch(f'/api/users/{ids[0]}/', {'first_name': 'Renamed'}, format='json')
+        self.client.delete(f'/api/users/{ids[1]}/')
+        User.objects.get(id=ids[2]).delete()
+        return ids
+
+    def test_replay_from_start_matches_table(self):
+        self.write_history()
+        state, _ = self.sync()
+        self.assertEqual(state, self.table())
+
+    def test_incremental_sync_from_listing_token(self):
+        ids = self.write_history()
+        response = self.client.get('/api/users/')
+        state = {user['id']: user for user in response.json()}
+        token = response['X-Changes-Token']
+
+        self.client.patch(f'/api/users/{ids[3]}/', {'last_name': 'Later'}, format='json')
+        created = self.client.post('/api/users/', {'first_name': 'New'}, format='json').json()['id']
+        self.client.delete(f'/api/users/{ids[0]}/')
+
+        page = self.client.get('/api/users/changes/', {'since': token}).json()
+        self.assertEqual([change['action'] for change in page['changes']], ['update', 'create', 'delete'])
+        self.assertEqual(replay(state, page), self.table())
+        self.assertIn(created, state)
+
+        # Nothing new: the token stays put
+        again = self.client.get('/api/users/changes/', {'since': page['next']}).json()
+        self.assertEqual((again['changes'], again['next']), ([], page['next']))
+
+    def test_prune_keeps_replay_result(self):
+        self.write_history()
+        before = UserChange.objects.count()
+        self.assertGreater(changes.prune(), 0)
+        self.assertLess(UserChange.objects.count(), before)
+        state, _ = self.sync()
+        self.assertEqual(state, self.table())
+
+    def test_prune_checks_each_batch_once(self):
+        self.write_history()
+        size = UserChange.objects.count()
+        expected = size - UserChange.objects.values('user_id').distinct().count()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(changes.prune(batch_size=2), expected)
+        # One DELETE per batch of the log, not one per superseded batch over the whole log
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), size // 2 + 1)
+        state, _ = self.sync()
+        self.assertEqual(state, self.table())
+
+    def test_bulk_writes_logged_with_record_many(self):
+        users = User.objects.bulk_create([User(first_name=f'Bulk{i}') for i in range(3)])
+        changes.record_many(users)
+        state, _ = self.sync(limit=500)
+        self.assertEqual(state, self.table())
+
+    def test_payload_matches_serializer(self):
+        user = User.objects.create(first_name='Ada', last_name='Lovelace')
+        self.assertEqual(changes.payload(user), UserSerializer(user).data)
+
+    def test_invalid_token(self):
+        for token in ('abc', '-1'):
+            response = self.client.get('/api/users/changes/', {'since': token})
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(USER_CHANGES_SETTLE_SECONDS=3600)
+    def test_unsettled_changes_are_held_back(self):
+        self.client.post('/api/users/', {'first_name': 'Fresh'}, format='json')
+        page = self.client.get('/api/users/changes/').json()
+        self.assertEqual((page['changes'], page['next']), ([], '0'))
+
+
+@override_settings(USER_CHANGES_SETTLE_SECONDS=0)
+class AsyncUserViewTests(TestCase):
+    async def test_matches_sync_views(self):
+        client, sync = AsyncClient(), APIClient()
+        created = await client.post('/api/async/users/', {'first_name': 'Ada'}, content_type='application/json')
+        self.assertEqual(created.status_code, 201)
+        pk = created.json()['id']
+        for path in ('/api/users/', f'/api/users/{pk}/', '/api/users/changes/'):
+            with self.subTest(path=path):
+                response = await client.get(path.replace('/api/', '/api/async/'))
+                expected = await sync_to_async(sync.get)(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+        patched = await client.patch(f'/api/async/users/{pk}/', {'last_name': 'Lovelace'},
+                                     content_type='application/json')
+        self.assertEqual(patched.json()['last_name'], 'Lovelace')
+        self.assertEqual((await client.get(f'/api/async/users/{pk}/')).json()['last_name'], 'Lovelace')
+
+        self.assertEqual((await client.delete(f'/api/async/users/{pk}/')).status_code, 204)
+        self.assertEqual((await client.get(f'/api/async/users/{pk}/')).status_code, 404)
+        actions = [change['action'] for change in (await client.get('/api/async/users/changes/')).json()['changes']]
+        self.assertEqual(actions, ['create', 'update', 'delete'])
+
+    async def test_errors(self):
+        client = AsyncClient()
+        self.assertEqual((await client.put('/api/async/users/')).status_code, 405)
+        response = await client.post('/api/async/users/', '[1]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = await client.get('/api/async/users/changes/', {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.client = APIClient()
+
+    def _hits(self):
+        return cache.CACHE_REQUESTS.value(cache=cache.NAME, result='hit')
+
+    def test_writes_go_through_to_the_cache(self):
+        created = self.client.post('/api/users/', {'first_name': 'Ada'}, format='json').json()
+        self.assertEqual(cache.get_user(created['id']), created)
+
+        hits = self._hits()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f"/api/users/{created['id']}/").json(), created)
+        self.assertEqual(self._hits(), hits + 1)
+
+        patched = self.client.patch(f"/api/users/{created['id']}/", {'last_name': 'Lovelace'}, format='json').json()
+        self.assertEqual(cache.get_user(created['id']), patched)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f"/api/users/{created['id']}/").json()['last_name'], 'Lovelace')
+
+    def test_miss_fills_the_cache(self):
+        user = User.objects.create(first_name='Ada')
+        self.assertIsNone(cache.get_user(user.id))
+        self.client.get(f'/api/users/{user.id}/')
+        self.assertEqual(cache.get_user(user.id), UserSerializer(user).data)
+
+    def test_delete_invalidates(self):
+        user_id = self.client.post('/api/users/', {'first_name': 'Ada'}, format='json').json()['id']
+        self.assertEqual(self.client.delete(f'/api/users/{user_id}/').status_code, 204)
+        self.assertIsNone(cache.get_user(user_id))
+        self.assertEqual(self.client.get(f'/api/users/{user_id}/').status_code, 404)
+
+    def test_writes_outside_the_views_invalidate(self):
+        user = User.objects.create(first_name='Ada')
+        self.client.get(f'/api/users/{user.id}/')
+        user.last_name = 'Lovelace'
+        user.save()
+        self.assertIsNone(cache.get_user(user.id))
+
+        self.client.get(f'/api/users/{user.id}/')
+        User.objects.filter(id=user.id).delete()
+        self.assertIsNone(cache.get_user(user.id))
+
+    def test_fill_does_not_overwrite_a_concurrent_write(self):
+        user = User.objects.create(first_name='Ada')
+        fill_user = cache.fill_user
+
+        def patch_then_fill(payload):
+            # The reader has loaded the old row; a PATCH lands before it fills
+            self.client.patch(f'/api/users/{user.id}/', {'last_name': 'Lovelace'}, format='json')
+            fill_user(payload)
+
+        with mock.patch.object(cache, 'fill_user', side_effect=patch_then_fill):
+            stale = self.client.get(f'/api/users/{user.id}/').json()
+        self.assertEqual(stale['last_name'], '')
+        self.assertEqual(cache.get_user(user.id)['last_name'], 'Lovelace')
+        self.assertEqual(self.client.get(f'/api/users/{user.id}/').json()['last_name'], 'Lovelace')
+
+
+def user_event(user_id, **fields):
+    return {'action': 'update', 'user': {'id': user_id, **fields}}
+
+
+class UserUpdateSocketTests(TestCase):
+    async def connect(self, path='/ws/user-updates/', subprotocols=None):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path, subprotocols=subprotocols)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    async def broadcast(self, *events):
+        layer = get_channel_layer()
+        for event in events:
+            await layer.group_send(USER_UPDATES_GROUP, user_update_message(event))
+
+    async def test_encoding_negotiation(self):
+        communicator, subprotocol = await self.connect(subprotocols=['chat', 'user-updates.msgpack'])
+        self.assertEqual(subprotocol, 'user-updates.msgpack')
+        await self.broadcast(user_event(1, first_name='Ada'))
+        frame = await communicator.receive_from()
+        self.assertEqual(msgpack.unpackb(frame), {'type': 'user_update', 'data': user_event(1, first_name='Ada')})
+        await communicator.disconnect()
+
+        # Query string fallback; deflate only compresses frames worth compressing
+        communicator, subprotocol = await self.connect('/ws/user-updates/?encoding=deflate')
+        self.assertIsNone(subprotocol)
+        await self.broadcast(user_event(2), user_event(3, notes='x' * wire.DEFLATE_MIN_BYTES))
+        self.assertEqual(json.loads(await communicator.receive_from())['data'], user_event(2))
+        payload = json.loads(zlib.decompress(await communicator.receive_from()))
+        self.assertEqual(payload['data'], user_event(3, notes='x' * wire.DEFLATE_MIN_BYTES))
+
+        # Clients may always send plain JSON, whatever they negotiated
+        await communicator.send_to(text_data=json.dumps({'type': 'ping', 'seq': 7}))
+        self.assertEqual(json.loads(await communicator.receive_from()), {'type': 'pong', 'seq': 7})
+        await communicator.disconnect()
+
+    def test_negotiate_falls_back_to_defaults(self):
+        for scope in ({'subprotocols': ['user-updates.xml']}, {'query_string': b'encoding=xml&batch=soon'}):
+            with self.subTest(scope=scope):
+                self.assertEqual(wire.negotiate(scope), ('json', 0, None))
+        self.assertEqual(wire.negotiate({'query_string': b'batch=99999'})[1], wire.MAX_BATCH_MS)
+        self.assertEqual(wire.negotiate({'subprotocols': ['user-updates.deflate+batch']}),
+                         ('deflate', wire.DEFAULT_BATCH_MS, 'user-updates.deflate+batch'))
+
+    async def test_batched_frames(self):
+        communicator, _ = await self.connect('/ws/user-updates/?batch=50')
+        events = [user_event(index) for index in range(3)]
+        await self.broadcast(*events)
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual(frame, {'type': 'batch', 'events': [{'type': 'user_update', 'data': e} for e in events]})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.disconnect()
+
+    def test_batch_frame_matches_encode(self):
+        events = [user_event(index, notes='y' * 300) for index in range(3)]
+        prepared = [user_update_message(event)['prepared'] for event in events]
+        batch = {'type': 'batch', 'events': [{'type': 'user_update', 'data': event} for event in events]}
+        for encoding in wire.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                text, data = wire.batch_frame(encoding, prepared)
+                self.assertEqual(wire.decode(encoding, text, data), batch)
+        # Spliced bytes are exactly what packing the whole batch would produce
+        self.assertEqual(wire.batch_frame('msgpack', prepared), wire.encode('msgpack', batch))
+
+    async def test_in_flight_window_waits_for_pong(self):
+        with self.settings(USER_UPDATES_WS={'MAX_IN_FLIGHT': 2}):
+            communicator, _ = await self.connect()
+        await self.broadcast(*(user_event(index) for index in range(3)))
+        for index in range(2):
+            self.assertEqual(json.loads(await communicator.receive_from())['data'], user_event(index))
+        # The window is full: the writer asks for an ack instead of sending
+        self.assertEqual(json.loads(await communicator.receive_from()), {'type': 'ping', 'seq': 2})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+
+        await communicator.send_to(text_data=json.dumps({'type': 'pong', 'seq': 2}))
+        self.assertEqual(json.loads(await communicator.receive_from())['data'], user_event(2))
+        await communicator.disconnect()
+
+    async def test_overflow_collapses_per_user(self):
+        with self.settings(USER_UPDATES_WS={'MAX_IN_FLIGHT': 1, 'QUEUE_SIZE': 2}):
+            communicator, _ = await self.connect()
+        await self.broadcast(user_event(1))
+        await communicator.receive_from()
+
+        # Held back by the full window; the third queued event overflows the queue
+        await self.broadcast(user_event(2, v=1), user_event(3), user_event(2, v=2))
+        self.assertEqual(json.loads(await communicator.receive_from()), {'type': 'ping', 'seq': 1})
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.send_to(text_data=json.dumps({'type': 'pong', 'seq': 1}))
+        self.assertEqual(json.loads(await communicator.receive_from())['data'], user_event(3))
+        self.assertEqual(json.loads(await communicator.receive_from()), {'type': 'ping', 'seq': 2})
+        await communicator.send_to(text_data=json.dumps({'type': 'pong', 'seq': 2}))
+        self.assertEqual(json.loads(await communicator.receive_from())['data'], user_event(2, v=2))
+        await communicator.disconnect()
+
+    def test_collapse_falls_back_to_resync(self):
+        queue = [({'type': 'user_update', 'data': user_event(index)}, None) for index in (1, 2, 1)]
+        self.assertEqual([payload['data'] for payload, _ in consumers.collapse(queue, 2)],
+                         [user_event(2), user_event(1)])
+        self.assertEqual(list(consumers.collapse(queue, 1)), [({'type': 'resync'}, None)])
+
+    async def test_missed_pong_evicts(self):
+        with self.settings(USER_UPDATES_WS={'HEARTBEAT_INTERVAL': 0.05}):
+            communicator, _ = await self.connect()
+        self.assertEqual(json.loads(await communicator.receive_from()), {'type': 'ping', 'seq': 0})
+        # No pong before the next interval
+        close = await communicator.receive_output()
+        self.assertEqual(close, {'type': 'websocket.close', 'code': consumers.CLOSE_HEARTBEAT_TIMEOUT})
+        await communicator.wait()
+
+    async def test_answered_pings_keep_the_connection(self):
+        with self.settings(USER_UPDATES_WS={'HEARTBEAT_INTERVAL': 0.05}):
+            communicator, _ = await self.connect()
+        for _ in range(3):
+            ping = json.loads(await communicator.receive_from())
+            await communicator.send_to(text_data=json.dumps({'type': 'pong', 'seq': ping['seq']}))
+        await communicator.disconnect()
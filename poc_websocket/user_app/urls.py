@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.window1_view, name='window1'),
@@ -7,5 +7,9 @@ urlpatterns = [
     path('window2/', views.window2_view, name='window2'),
     path('api/users/', views.user_list, name='user-list'),
     path('api/users/<int:pk>/', views.user_detail, name='user-detail'),
+    path('api/users/changes/', views.user_changes, name='user-changes'),
+    path('api/async/users/', async_views.user_list, name='user-list-async'),
+    path('api/async/users/<int:pk>/', async_views.user_detail, name='user-detail-async'),
+    path('api/async/users/changes/', async_views.user_changes, name='user-changes-async'),
 ]
 
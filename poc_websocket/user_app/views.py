@@ -2,8 +2,9 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from poc_project.db_router import use_primary
+from . import cache, changes
+from .events import broadcast_user_event
 from .models import User
 from .serializers import UserSerializer
 
@@ -24,27 +25,23 @@ def window2_view(request):
 def user_list(request):
     """List all users or create a new user"""
     if request.method == 'GET':
+        # Read before the listing: replaying changes after it is idempotent
+        token = changes.current_token()
         users = User.objects.all()
         serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'X-Changes-Token': token})
     
     elif request.method == 'POST':
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            serializer.save()
+            cache.store_user(serializer.data)
             
             # Broadcast update via WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                'user_updates',
-                {
-                    'type': 'user_update',
-                    'data': {
-                        'action': 'create',
-                        'user': UserSerializer(user).data
-                    }
-                }
-            )
+            broadcast_user_event({
+                'action': 'create',
+                'user': serializer.data
+            })
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -53,29 +50,28 @@ def user_list(request):
 @api_view(['GET', 'PATCH', 'DELETE'])
 def user_detail(request, pk):
     """Retrieve, update or delete a user"""
-    user = get_object_or_404(User, pk=pk)
-    
     if request.method == 'GET':
-        serializer = UserSerializer(user)
-        return Response(serializer.data)
+        # Hot reads are served from the write-through cache without a query
+        payload = cache.get_user(pk)
+        if payload is None:
+            with use_primary():
+                payload = UserSerializer(get_object_or_404(User, pk=pk)).data
+            cache.fill_user(payload)
+        return Response(payload)
+
+    user = get_object_or_404(User, pk=pk)
     
-    elif request.method == 'PATCH':
+    if request.method == 'PATCH':
         serializer = UserSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
-            user = serializer.save()
+            serializer.save()
+            cache.store_user(serializer.data)
             
             # Broadcast update via WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                'user_updates',
-                {
-                    'type': 'user_update',
-                    'data': {
-                        'action': 'update',
-                        'user': UserSerializer(user).data
-                    }
-                }
-            )
+            broadcast_user_event({
+                'action': 'update',
+                'user': serializer.data
+            })
             
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -83,19 +79,25 @@ def user_detail(request, pk):
     elif request.method == 'DELETE':
         user_id = user.id
         user.delete()
+        cache.invalidate_user(user_id)
         
         # Broadcast delete via WebSocket
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'user_updates',
-            {
-                'type': 'user_update',
-                'data': {
-                    'action': 'delete',
-                    'user_id': user_id
-                }
-            }
-        )
+        broadcast_user_event({
+            'action': 'delete',
+            'user_id': user_id
+        })
         
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+
+@api_view(['GET'])
+def user_changes(request):
+    """Users created, updated or deleted since a token (see user_app.changes).
+    Query params: since, limit.
+    """
+    try:
+        since = changes.parse_token(request.GET.get('since'))
+        limit = changes.parse_limit(request.GET.get('limit'))
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changes.read_changes(since, limit))
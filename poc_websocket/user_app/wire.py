@@ -0,0 +1,141 @@
+"""
+Wire encodings for the user updates WebSocket.
+
+Negotiated per connection by UserUpdateConsumer, either through the
+WebSocket subprotocol or the `encoding` query parameter:
+
+    json      text frames, one JSON document per frame (default)
+    msgpack   binary MessagePack frames
+    deflate   JSON; frames of at least DEFLATE_MIN_BYTES are sent as binary
+              zlib-deflated JSON, smaller ones as plain text frames
+
+Daphne does not expose the transport-level permessage-deflate extension,
+so `deflate` compresses at the application level; browsers can inflate it
+with DecompressionStream('deflate').
+
+Group broadcasts are encoded once at the group_send site: prepare() builds
+the JSON text, MessagePack bytes and deflated JSON of an event, and each
+consumer only picks its frame (frame()) or splices the pre-encoded events
+into a batch (batch_frame()), so a broadcast to N clients no longer packs
+and compresses the same event N times.
+"""
+
+import json
+import zlib
+from urllib.parse import parse_qs
+
+ENCODINGS = ('json', 'msgpack', 'deflate')
+DEFAULT_ENCODING = 'json'
+SUBPROTOCOL_PREFIX = 'user-updates.'
+DEFLATE_MIN_BYTES = 512
+DEFAULT_BATCH_MS = 20
+MAX_BATCH_MS = 1000
+MAX_BATCH_EVENTS = 100
+
+
+def _dumps(payload) -> str:
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def encode(encoding, payload):
+    """Return (text_data, bytes_data) for one frame."""
+    if encoding == 'msgpack':
+        import msgpack
+
+        return None, msgpack.packb(payload, use_bin_type=True)
+    text = _dumps(payload)
+    if encoding == 'deflate' and len(text) >= DEFLATE_MIN_BYTES:
+        return None, _deflate(text)
+    return text, None
+
+
+def _deflate(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def prepare(payload):
+    """Encode a broadcast payload once for every encoding. The result is
+    plain str/bytes values, so it travels through any channel layer."""
+    text = _dumps(payload)
+    prepared = {'json': text}
+    msgpack = _msgpack()
+    if msgpack is not None:
+        prepared['msgpack'] = msgpack.packb(payload, use_bin_type=True)
+    if len(text) >= DEFLATE_MIN_BYTES:
+        prepared['deflate'] = _deflate(text)
+    return prepared
+
+
+def frame(encoding, prepared):
+    """(text_data, bytes_data) for one prepared payload."""
+    if encoding == 'msgpack':
+        return None, prepared['msgpack']
+    if encoding == 'deflate' and 'deflate' in prepared:
+        return None, prepared['deflate']
+    return prepared['json'], None
+
+
+def batch_frame(encoding, prepared_events):
+    """(text_data, bytes_data) of {"type": "batch", "events": [...]} built from
+    prepared events without re-encoding them."""
+    if encoding == 'msgpack':
+        import msgpack
+
+        packer = msgpack.Packer(use_bin_type=True)
+        head = (
+            packer.pack_map_header(2) + packer.pack('type') + packer.pack('batch')
+            + packer.pack('events') + packer.pack_array_header(len(prepared_events))
+        )
+        return None, head + b''.join(event['msgpack'] for event in prepared_events)
+    text = '{"type":"batch","events":[' + ','.join(event['json'] for event in prepared_events) + ']}'
+    if encoding == 'deflate' and len(text) >= DEFLATE_MIN_BYTES:
+        return None, _deflate(text)
+    return text, None
+
+
+def decode(encoding, text_data=None, bytes_data=None):
+    """Decode a client frame; clients may always send plain JSON text."""
+    if text_data is not None:
+        return json.loads(text_data)
+    if encoding == 'msgpack':
+        import msgpack
+
+        return msgpack.unpackb(bytes_data, raw=False)
+    if encoding == 'deflate':
+        return json.loads(zlib.decompress(bytes_data).decode('utf-8'))
+    return json.loads(bytes_data.decode('utf-8'))
+
+
+def negotiate(scope):
+    """Pick (encoding, batch_ms, subprotocol) for a connection.
+
+    Subprotocols look like `user-updates.msgpack` or `user-updates.deflate+batch`;
+    the first supported one the client offers wins and is echoed back on
+    accept. Otherwise the query string is used: `?encoding=msgpack&batch=25`
+    (batch window in milliseconds, 0 disables batching).
+    """
+    for offered in scope.get('subprotocols') or ():
+        if not offered.startswith(SUBPROTOCOL_PREFIX):
+            continue
+        name, _, option = offered[len(SUBPROTOCOL_PREFIX):].partition('+')
+        if name in ENCODINGS and option in ('', 'batch'):
+            return name, (DEFAULT_BATCH_MS if option else 0), offered
+
+    query = parse_qs((scope.get('query_string') or b'').decode('latin-1'))
+    encoding = (query.get('encoding') or [DEFAULT_ENCODING])[0]
+    if encoding not in ENCODINGS:
+        encoding = DEFAULT_ENCODING
+    try:
+        batch_ms = int((query.get('batch') or ['0'])[0])
+    except ValueError:
+        batch_ms = 0
+    return encoding, max(0, min(batch_ms, MAX_BATCH_MS)), None
+
@@ -10,6 +10,8 @@ class ApiService {
     const url = `${this.baseUrl}${endpoint}`;
     
     const defaultOptions = {
+      // Send the backend's sticky-primary cookie so reads right after a write see it
+      credentials: 'include',
       headers: {
         'Content-Type': 'application/json',
       },
@@ -67,6 +69,53 @@ class ApiService {
       method: 'DELETE',
     });
   }
+
+  // Users created, updated or deleted since a token ({changes, next, has_more}).
+  // Start from the X-Changes-Token header of /users/ or '' for the whole log.
+  async getUserChanges(since = '', limit = 500) {
+    const params = new URLSearchParams({ since, limit });
+    return this.request(`/users/changes/?${params}`);
+  }
+
+  // Every change since a token, following pages; returns {changes, next}
+  async syncUserChanges(since = '') {
+    const changes = [];
+    let page;
+    do {
+      page = await this.getUserChanges(since);
+      changes.push(...page.changes);
+      since = page.next;
+    } while (page.has_more);
+    return { changes, next: since };
+  }
+
+  // Background jobs (progress streams over ws/jobs/<id>/)
+  async getJobs() {
+    return this.request('/jobs/');
+  }
+
+  async getJob(id) {
+    return this.request(`/jobs/${id}/`);
+  }
+
+  async createJob(task, params = {}, priority = 0) {
+    return this.request('/jobs/', {
+      method: 'POST',
+      body: JSON.stringify({ task, params, priority }),
+    });
+  }
+
+  async cancelJob(id) {
+    return this.request(`/jobs/${id}/cancel/`, {
+      method: 'POST',
+    });
+  }
+
+  // Indexed name search (type: users | patients | sessions)
+  async search(query, type = 'users', limit = 20) {
+    const params = new URLSearchParams({ q: query, type, limit: String(limit) });
+    return this.request(`/search/?${params}`);
+  }
 }
 
 export const apiService = new ApiService();
@@ -1,17 +1,47 @@
 // WebSocket service for real-time communication with Django backend
 const DJANGO_WS_URL = 'ws://localhost:8000/ws/user-updates/';
 
+// Negotiated with UserUpdateConsumer (see user_app/wire.py):
+// 'deflate' sends large frames as zlib-compressed JSON, BATCH_MS groups
+// bursts of events into {type: 'batch', events: [...]} frames.
+const ENCODING = 'deflate';
+const BATCH_MS = 20;
+
 class WebSocketService {
   constructor() {
     this.ws = null;
     this.reconnectInterval = 3000;
     this.listeners = [];
     this.isConnected = false;
+    // Decoding binary frames is async; chain it so messages keep their order
+    this.decodeChain = Promise.resolve();
+  }
+
+  async decode(raw) {
+    if (typeof raw === 'string') {
+      return JSON.parse(raw);
+    }
+    const stream = new Blob([raw]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return JSON.parse(await new Response(stream).text());
+  }
+
+  handleMessage(data) {
+    if (data.type === 'ping') {
+      // Server heartbeat; the seq acknowledges every frame received so far
+      this.send({ type: 'pong', seq: data.seq });
+      return;
+    }
+    if (data.type === 'batch') {
+      data.events.forEach(evt => this.notifyListeners(evt));
+    } else {
+      this.notifyListeners(data);
+    }
   }
 
   connect() {
     try {
-      this.ws = new WebSocket(DJANGO_WS_URL);
+      this.ws = new WebSocket(`${DJANGO_WS_URL}?encoding=${ENCODING}&batch=${BATCH_MS}`);
+      this.ws.binaryType = 'arraybuffer';
 
       this.ws.onopen = () => {
         console.log('WebSocket connected');
@@ -20,9 +50,13 @@ class WebSocketService {
       };
 
       this.ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        console.log('WebSocket message received:', data);
-        this.notifyListeners(data);
+        this.decodeChain = this.decodeChain
+          .then(() => this.decode(event.data))
+          .then((data) => {
+            console.log('WebSocket message received:', data);
+            this.handleMessage(data);
+          })
+          .catch((error) => console.error('Failed to decode WebSocket message:', error));
       };
 
       this.ws.onerror = (error) => {